@@ -14,6 +14,7 @@ tests_requires = [
 install_requires = [
     'waldur-core>=0.151.0',
     'python-digitalocean>=1.5',
+    'requests>=2.4.2',
 ]
 
 
@@ -12,7 +12,7 @@ class DigitalOceanConfig(AppConfig):
         from waldur_core.core import models as core_models
         from waldur_core.structure import SupportedServices, signals as structure_signals, models as structure_models
 
-        from . import handlers
+        from . import handlers, models
         from .backend import DigitalOceanBackend
         SupportedServices.register_backend(DigitalOceanBackend)
 
@@ -29,3 +29,35 @@ class DigitalOceanConfig(AppConfig):
             sender=core_models.SshPublicKey,
             dispatch_uid='waldur_digitalocean.handlers.remove_ssh_key_from_service_settings_on_deletion',
         )
+
+        signals.post_save.connect(
+            handlers.invalidate_consumable_items,
+            sender=models.Size,
+            dispatch_uid='waldur_digitalocean.handlers.invalidate_consumable_items_on_save',
+        )
+
+        signals.post_delete.connect(
+            handlers.invalidate_consumable_items,
+            sender=models.Size,
+            dispatch_uid='waldur_digitalocean.handlers.invalidate_consumable_items_on_delete',
+        )
+
+        for model in (models.Region, models.Image, models.Size):
+            signals.post_save.connect(
+                handlers.invalidate_catalog,
+                sender=model,
+                dispatch_uid='waldur_digitalocean.handlers.invalidate_catalog_on_save__%s' % model.__name__,
+            )
+
+            signals.post_delete.connect(
+                handlers.invalidate_catalog,
+                sender=model,
+                dispatch_uid='waldur_digitalocean.handlers.invalidate_catalog_on_delete__%s' % model.__name__,
+            )
+
+        for model in (models.Image, models.Size):
+            signals.m2m_changed.connect(
+                handlers.invalidate_catalog,
+                sender=model.regions.through,
+                dispatch_uid='waldur_digitalocean.handlers.invalidate_catalog_on_regions_change__%s' % model.__name__,
+            )
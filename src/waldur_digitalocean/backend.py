@@ -1,22 +1,37 @@
 from __future__ import unicode_literals
 
+import collections
+import contextlib
+import datetime
+import decimal
 import functools
+import hashlib
+import json
 import logging
 import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
 import digitalocean
 
-from django.db import IntegrityError, transaction
-from django.utils import dateparse, six
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import dateparse, six, timezone
 
 from waldur_core.core.models import SshPublicKey
 from waldur_core.structure import ServiceBackend, ServiceBackendError, SupportedServices
 
-from . import models
+from . import catalog, client, metrics, models
+from .cost_tracking import DropletStrategy
 
 
 logger = logging.getLogger(__name__)
 
+NOT_FOUND_MESSAGE = 'The resource you were accessing could not be found.'
+
 
 class DigitalOceanBackendError(ServiceBackendError):
     pass
@@ -34,107 +49,618 @@ class UnauthorizedError(DigitalOceanBackendError):
     pass
 
 
+class RateLimitError(DigitalOceanBackendError):
+    pass
+
+
+class RequestsLimiter(object):
+    """
+    Limit number of DigitalOcean API calls which are executed concurrently in the process.
+
+    Limiter is disabled until semaphore is configured. Nested backend calls
+    made by the thread which already holds the semaphore are not limited again.
+    """
+
+    def __init__(self):
+        self.semaphore = None
+        self.local = threading.local()
+
+    def configure(self, semaphore):
+        self.semaphore = semaphore
+
+    @contextlib.contextmanager
+    def __call__(self):
+        semaphore = self.semaphore
+        if semaphore is None or getattr(self.local, 'acquired', False):
+            yield
+        else:
+            with semaphore:
+                self.local.acquired = True
+                try:
+                    yield
+                finally:
+                    self.local.acquired = False
+
+    @contextlib.contextmanager
+    def released(self):
+        """ Release semaphore held by the thread while it waits for API calls made by other threads. """
+        semaphore = self.semaphore
+        if semaphore is None or not getattr(self.local, 'acquired', False):
+            yield
+            return
+
+        semaphore.release()
+        self.local.acquired = False
+        try:
+            yield
+        finally:
+            semaphore.acquire()
+            self.local.acquired = True
+
+
+requests_limiter = RequestsLimiter()
+
+
 def digitalocean_error_handler(func):
     """
     Convert DigitalOcean exception to specific classes based on text message.
     It should be applied to functions which directly call `manager`.
+    Duration, number of calls and errors of the method are reported to metrics collector.
     """
     @functools.wraps(func)
-    def wrapped(*args, **kwargs):
+    def wrapped(backend, *args, **kwargs):
         error_messages = {
             'You do not have access for the attempted action.': TokenScopeError,
-            'The resource you were accessing could not be found.': NotFoundError,
-            'Unable to authenticate you.': UnauthorizedError
+            NOT_FOUND_MESSAGE: NotFoundError,
+            'Unable to authenticate you.': UnauthorizedError,
+            client.RATE_LIMIT_MESSAGE: RateLimitError,
         }
         logger.debug('About to execute DO backend method `%s`' % func.__name__)
+        collector = metrics.get_collector()
+        labels = {'method': func.__name__}
+        collector.inc(metrics.BACKEND_CALLS, labels)
+        start = time.time()
         try:
-            return func(*args, **kwargs)
+            with requests_limiter():
+                return func(backend, *args, **kwargs)
         except digitalocean.DataReadError as e:
             exc = list(sys.exc_info())
             message = six.text_type(e)
             exc[0] = error_messages.get(message, DigitalOceanBackendError)
+            collector.inc(metrics.BACKEND_ERRORS, dict(labels, error=exc[0].__name__))
             six.reraise(*exc)
+        except (StopIteration, client.RateLimitDeferred):
+            # End of paged listing and deferred call are not errors
+            raise
+        except Exception as e:
+            collector.inc(metrics.BACKEND_ERRORS, dict(labels, error=e.__class__.__name__))
+            raise
+        finally:
+            collector.observe(metrics.BACKEND_CALL_DURATION, labels, time.time() - start)
     return wrapped
 
 
+class PullResult(object):
+    """ Number of rows written by a single catalog pull. """
+
+    def __init__(self, created=0, updated=0, deleted=0):
+        self.created = created
+        self.updated = updated
+        self.deleted = deleted
+
+    @property
+    def changed(self):
+        return bool(self.created or self.updated or self.deleted)
+
+
+class PhaseStats(object):
+    """ Work done by a single phase of synchronization. """
+
+    def __init__(self):
+        self.duration = 0
+        self.api_calls = 0
+        self.queries = 0
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+
+    def add_result(self, result):
+        if result is not None:
+            self.created += result.created
+            self.updated += result.updated
+            self.deleted += result.deleted
+
+
+class CountingCursor(object):
+    """ Cursor of database connection which counts executed queries. """
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.callproc(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self.cursor.__exit__(*args)
+
+
+class QueryCounter(object):
+    """
+    Count SQL queries of current thread by wrapping cursors of its database connection.
+    Unlike queries log it does not depend on debug mode and does not store queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.connection = None
+        self.outer_cursor = None
+
+    def __enter__(self):
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        # Wrapper of outer counter, if any, is restored on exit
+        self.outer_cursor = vars(self.connection).get('cursor')
+        cursor = self.connection.cursor
+        self.connection.cursor = lambda: CountingCursor(cursor(), self)
+        return self
+
+    def __exit__(self, *args):
+        if self.outer_cursor is None:
+            del self.connection.cursor
+        else:
+            self.connection.cursor = self.outer_cursor
+
+
+class SyncRecorder(object):
+    """
+    Collect wall time, number of API calls, SQL queries and written rows of synchronization phases.
+    The same phase may be entered several times, for example to fetch and to store data, its stats are summed.
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stats = self.phases.setdefault(name, PhaseStats())
+        initial_api_calls = client.request_counter.get()
+        start = time.time()
+        with QueryCounter() as query_counter:
+            try:
+                yield stats
+            finally:
+                stats.duration += time.time() - start
+                stats.api_calls += client.request_counter.get() - initial_api_calls
+                stats.queries += query_counter.count
+
+    def save(self, run):
+        models.SyncPhase.objects.bulk_create([
+            models.SyncPhase(run=run, name=name, **vars(stats)) for name, stats in self.phases.items()
+        ])
+
+
 class DigitalOceanBackend(ServiceBackend):
     """ Waldur interface to Digital Ocean API.
         https://developers.digitalocean.com/documentation/v2/
         https://github.com/koalalorenzo/python-digitalocean
     """
 
+    # Action types which DigitalOcean can apply to all droplets with a tag
+    TAG_ACTION_TYPES = ('power_on', 'shutdown', 'power_off', 'power_cycle')
+    # Fields of droplets which are pulled from backend, see pull_droplets
+    DROPLET_BACKEND_FIELDS = ('state', 'runtime_state', 'image_name')
+
     def __init__(self, settings):
         self.settings = settings
-        self.manager = digitalocean.Manager(token=settings.token)
+        self.manager = client.pool.get(settings.token, settings.backend_url or None)
+        self.sync_recorder = None
 
     def sync(self):
-        self.pull_service_properties()
-        self.pull_droplets()
+        """ Pull catalog and droplets, phases of synchronization are stored as SyncRun. """
+        run = models.SyncRun.objects.create(settings=self.settings)
+        self.sync_recorder = SyncRecorder()
+        try:
+            with client.rate_limiter.priority(client.Priorities.SYNC):
+                self.pull_service_properties()
+                with self._sync_phase('pull_droplets') as phase:
+                    phase.add_result(self.pull_droplets())
+        except client.RateLimitDeferred as e:
+            # Settings are synchronized periodically, so the rest of synchronization is done by the next run
+            logger.info('Synchronization of DigitalOcean service settings %s is deferred: %s', self.settings, e)
+            run.state = models.SyncRun.States.DEFERRED
+            run.error_message = six.text_type(e)
+        except Exception as e:
+            run.state = models.SyncRun.States.ERRED
+            run.error_message = six.text_type(e)
+            raise
+        else:
+            run.state = models.SyncRun.States.OK
+        finally:
+            run.finished_at = timezone.now()
+            run.save(update_fields=['state', 'finished_at', 'error_message'])
+            self.sync_recorder.save(run)
+            self.sync_recorder = None
+            self._delete_old_sync_runs()
+
+    @contextlib.contextmanager
+    def _sync_phase(self, name):
+        if self.sync_recorder is None:
+            yield PhaseStats()
+        else:
+            with self.sync_recorder.phase(name) as stats:
+                yield stats
+
+    def _delete_old_sync_runs(self):
+        history_size = django_settings.WALDUR_DIGITALOCEAN['SYNC_RUN_HISTORY_SIZE']
+        old_pks = list(models.SyncRun.objects.filter(settings=self.settings).values_list(
+            'pk', flat=True)[history_size:])
+        if old_pks:
+            models.SyncRun.objects.filter(pk__in=old_pks).delete()
 
     @digitalocean_error_handler
     def create_droplet(self, droplet, backend_region_id=None, backend_image_id=None,
                        backend_size_id=None, ssh_key_uuid=None):
 
+        ssh_key = None
         if ssh_key_uuid:
             ssh_key = SshPublicKey.objects.get(uuid=ssh_key_uuid)
-            backend_ssh_key = self.get_or_create_ssh_key(ssh_key)
-
             droplet.key_name = ssh_key.name
             droplet.key_fingerprint = ssh_key.fingerprint
 
-        backend_droplet = digitalocean.Droplet(
-            token=self.manager.token,
+        backend_droplet = self._call_with_ssh_key(ssh_key, lambda ssh_keys: self.manager.create_droplet(
             name=droplet.name,
             user_data=droplet.user_data,
             region=backend_region_id,
             image=backend_image_id,
-            size_slug=backend_size_id,
-            ssh_keys=[backend_ssh_key.id] if ssh_key_uuid else [])
-        backend_droplet.create()
+            size=backend_size_id,
+            ssh_keys=ssh_keys))
 
         action_id = backend_droplet.action_ids[-1]
         droplet.backend_id = backend_droplet.id
         droplet.save()
+        self._register_action(droplet, action_id, 'create')
         return action_id
 
     @digitalocean_error_handler
     def destroy(self, droplet):
-        backend_droplet = self.get_droplet(droplet.backend_id)
-        backend_droplet.destroy()
+        self.manager.destroy_droplet(droplet.backend_id)
         droplet.decrease_backend_quotas_usage()
 
     @digitalocean_error_handler
     def start(self, droplet):
-        backend_droplet = self.get_droplet(droplet.backend_id)
-        action = backend_droplet.power_on()
-        return action['action']['id']
+        action = self.manager.droplet_action(droplet.backend_id, 'power_on')
+        self._register_action(droplet, action.id, action.type)
+        return action.id
 
     @digitalocean_error_handler
     def stop(self, droplet):
-        backend_droplet = self.get_droplet(droplet.backend_id)
-        action = backend_droplet.shutdown()
-        return action['action']['id']
+        action = self.manager.droplet_action(droplet.backend_id, 'shutdown')
+        self._register_action(droplet, action.id, action.type)
+        return action.id
 
     @digitalocean_error_handler
     def restart(self, droplet):
-        backend_droplet = self.get_droplet(droplet.backend_id)
-        action = backend_droplet.reboot()
-        return action['action']['id']
+        action = self.manager.droplet_action(droplet.backend_id, 'reboot')
+        self._register_action(droplet, action.id, action.type)
+        return action.id
 
     @digitalocean_error_handler
     def resize(self, droplet, backend_size_id=None, disk=None):
-        backend_droplet = self.get_droplet(droplet.backend_id)
-        action = backend_droplet.resize(new_size_slug=backend_size_id, disk=disk)
-        return action['action']['id']
+        action = self.manager.droplet_action(droplet.backend_id, 'resize', size=backend_size_id, disk=disk)
+        self._register_action(droplet, action.id, action.type, size_name=backend_size_id)
+        return action.id
+
+    def _register_action(self, droplet, action_id, action_type, size_name=None):
+        """ Store action so that it is tracked by poll_actions task. """
+        self._build_action(droplet, action_id, action_type, size_name=size_name).save()
+
+    def _build_action(self, droplet, action_id, action_type, size_name=None, batch=None, expected_durations=None):
+        action = models.Action(
+            settings=self.settings,
+            droplet=droplet,
+            batch=batch,
+            backend_id=action_id,
+            action_type=action_type,
+            size_name=size_name or droplet.size_name,
+            region_name=droplet.region_name,
+        )
+        # Expected duration is shared by similar actions of the batch
+        if expected_durations is None:
+            expected_durations = {}
+        key = (action.action_type, action.size_name, action.region_name)
+        if key not in expected_durations:
+            expected_durations[key] = action.get_expected_duration()
+        action.eta = action.started_at + datetime.timedelta(seconds=expected_durations[key])
+        action.schedule_next_poll()
+        return action
+
+    @digitalocean_error_handler
+    def batch_action(self, batch, droplets):
+        """
+        Start action of the batch for all droplets and register started actions.
+
+        If action can be applied to tagged droplets, droplets are tagged with temporary
+        batch tag and one action request is issued for all of them. Otherwise actions
+        are started concurrently for each droplet, at most BATCH_ACTION_CONCURRENCY at a time.
+        Returns dictionary which maps backend ID of droplet to error message
+        for droplets whose action has not been started.
+        """
+        action_type = batch.backend_action_type
+        if action_type in self.TAG_ACTION_TYPES and len(droplets) > 1:
+            backend_actions = self._start_tag_action(batch, droplets, action_type)
+            errors = {}
+        else:
+            backend_actions, errors = self._start_droplets_actions(droplets, action_type)
+
+        actions = []
+        expected_durations = {}
+        for droplet in droplets:
+            backend_action = backend_actions.get(droplet.backend_id)
+            if backend_action:
+                actions.append(self._build_action(droplet, backend_action.id, action_type,
+                                                  batch=batch, expected_durations=expected_durations))
+            elif droplet.backend_id not in errors:
+                errors[droplet.backend_id] = 'DigitalOcean has not started %s action for droplet.' % action_type
+        models.Action.objects.bulk_create(actions)
+        return errors
+
+    @digitalocean_error_handler
+    def batch_create_droplets(self, batch, droplets, backend_region_id=None, backend_image_id=None,
+                              backend_size_id=None, ssh_key_uuid=None):
+        """
+        Create droplets of the batch with as few API requests as possible.
+
+        DigitalOcean creates up to BATCH_CREATE_SIZE droplets with the same configuration
+        in a single request. Created droplets are tagged with batch tag, so that they
+        can be listed together when their actions are completed.
+        Returns dictionary which maps droplet UUID to error message for droplets which are not created.
+        """
+        ssh_key = None
+        key_name = key_fingerprint = ''
+        if ssh_key_uuid:
+            ssh_key = SshPublicKey.objects.get(uuid=ssh_key_uuid)
+            key_name, key_fingerprint = ssh_key.name, ssh_key.fingerprint
+
+        errors = {}
+        actions = []
+        expected_durations = {}
+        chunk_size = django_settings.WALDUR_DIGITALOCEAN['BATCH_CREATE_SIZE']
+        for index in range(0, len(droplets), chunk_size):
+            chunk = droplets[index:index + chunk_size]
+            try:
+                backend_droplets = self._call_with_ssh_key(ssh_key, lambda ssh_keys: self.manager.create_droplets(
+                    names=[droplet.name for droplet in chunk],
+                    user_data=chunk[0].user_data,
+                    region=backend_region_id,
+                    image=backend_image_id,
+                    size=backend_size_id,
+                    ssh_keys=ssh_keys,
+                    tags=[batch.tag_name]))
+            except digitalocean.DataReadError as e:
+                errors.update({droplet.uuid.hex: six.text_type(e) for droplet in chunk})
+                continue
+
+            for droplet, backend_droplet in zip(chunk, backend_droplets):
+                droplet.backend_id = backend_droplet.id
+                droplet.key_name = key_name
+                droplet.key_fingerprint = key_fingerprint
+                droplet.save(update_fields=['backend_id', 'key_name', 'key_fingerprint'])
+                actions.append(self._build_action(droplet, backend_droplet.action_ids[-1], 'create',
+                                                  batch=batch, expected_durations=expected_durations))
+
+        models.Action.objects.bulk_create(actions)
+        return errors
+
+    def _start_tag_action(self, batch, droplets, action_type):
+        tag_name = batch.tag_name
+        self.manager.create_tag(tag_name)
+        try:
+            self.manager.tag_droplets(tag_name, [droplet.backend_id for droplet in droplets])
+            backend_actions = self.manager.tag_droplet_action(tag_name, action_type)
+        finally:
+            self.manager.delete_tag(tag_name)
+        return {six.text_type(backend_action.resource_id): backend_action for backend_action in backend_actions}
+
+    def _start_droplets_actions(self, droplets, action_type):
+        def start_action(droplet):
+            try:
+                return droplet.backend_id, self.manager.droplet_action(droplet.backend_id, action_type), None
+            except digitalocean.DataReadError as e:
+                return droplet.backend_id, None, six.text_type(e)
+
+        results = self._map_concurrently(start_action, droplets)
+        backend_actions = {backend_id: action for backend_id, action, _ in results if action}
+        errors = {backend_id: error for backend_id, _, error in results if error}
+        return backend_actions, errors
+
+    def _map_concurrently(self, func, items):
+        """
+        Apply function to items by a pool of up to BATCH_ACTION_CONCURRENCY threads.
+
+        API calls of the threads are made with priority of the current thread, are limited
+        by requests_limiter and are counted as API calls of the current thread.
+        """
+        priority = client.rate_limiter.get_priority()
+        api_calls = []
+
+        def call(item):
+            initial_api_calls = client.request_counter.get()
+            try:
+                with client.rate_limiter.priority(priority), requests_limiter():
+                    return func(item)
+            finally:
+                api_calls.append(client.request_counter.get() - initial_api_calls)
+
+        workers = min(django_settings.WALDUR_DIGITALOCEAN['BATCH_ACTION_CONCURRENCY'], len(items))
+        pool = ThreadPool(max(workers, 1))
+        try:
+            # Semaphore of the current thread is released, so that threads do not wait for it
+            with requests_limiter.released():
+                return pool.map(call, items)
+        finally:
+            pool.close()
+            pool.join()
+            client.request_counter.increment(sum(api_calls))
+
+    def pull_actions(self, actions):
+        """
+        Update status of pending actions of the token.
+
+        Actions are looked up in the account actions listing, which is ordered
+        from the newest to the oldest, so only pages down to the oldest pending action
+        are fetched. Actions which are not found there are fetched one by one.
+        Polling of actions which are not changed is postponed with a single query per delay.
+        """
+        pending_actions = {action.backend_id: action for action in actions}
+        if not pending_actions:
+            return
+        oldest_id = min(int(backend_id) for backend_id in pending_actions)
+
+        finished_actions = []
+        unchanged_actions = []
+        for backend_page in self.iter_action_pages():
+            for backend_action in backend_page:
+                action = pending_actions.pop(six.text_type(backend_action.id), None)
+                if action and self._update_action(action, backend_action, unchanged_actions):
+                    finished_actions.append(action)
+            if not pending_actions or all(backend_action.id < oldest_id for backend_action in backend_page):
+                break
+
+        for action in pending_actions.values():
+            try:
+                backend_action = self.get_action(action.backend_id)
+            except NotFoundError:
+                logger.warning('DigitalOcean action %s is not found.', action.backend_id)
+                backend_action = digitalocean.Action(status=models.Action.Statuses.ERRORED)
+            if self._update_action(action, backend_action, unchanged_actions):
+                finished_actions.append(action)
+
+        self._schedule_next_polls(unchanged_actions)
+        self._pull_batch_droplets(finished_actions)
+
+    def _update_action(self, action, backend_action, unchanged_actions):
+        """ Store status of action and return True if it has been finished. """
+        if backend_action.status == action.status:
+            unchanged_actions.append(action)
+            return False
+
+        action.status = backend_action.status
+        started_at = getattr(backend_action, 'started_at', None)
+        if started_at:
+            action.started_at = dateparse.parse_datetime(started_at)
+        completed_at = getattr(backend_action, 'completed_at', None)
+        action.completed_at = dateparse.parse_datetime(completed_at) if completed_at else timezone.now()
+        action.save(update_fields=['status', 'started_at', 'completed_at'])
+        return action.is_finished
+
+    def _schedule_next_polls(self, actions):
+        # Delays are rounded to seconds, so that actions with similar ETA are updated together
+        now = timezone.now()
+        delays = collections.defaultdict(list)
+        for action in actions:
+            delays[int(round(action.get_poll_delay(now)))].append(action.pk)
+        for delay, pks in delays.items():
+            models.Action.objects.filter(pk__in=pks).update(next_poll_at=now + datetime.timedelta(seconds=delay))
+
+    def _pull_batch_droplets(self, finished_actions):
+        """
+        Update state of droplets whose batch actions are finished.
+        Droplets of the batch are not tracked by executors, so their state is updated here.
+        Batch tag of created droplets is deleted when all of them are finished.
+        """
+        States = models.Droplet.States
+        Statuses = models.Action.Statuses
+        batch_actions = [action for action in finished_actions if action.batch_id and action.droplet_id]
+        batches = models.Batch.objects.in_bulk({action.batch_id for action in batch_actions})
+        droplets = models.Droplet.objects.filter(state__in=[States.CREATING, States.UPDATING]).in_bulk(
+            [action.droplet_id for action in batch_actions])
+
+        for action in batch_actions:
+            droplet = droplets.get(action.droplet_id)
+            if droplet is None:
+                continue
+            if action.status == Statuses.COMPLETED:
+                droplet.set_ok()
+                droplet.runtime_state = batches[action.batch_id].success_runtime_state
+                droplet.error_message = ''
+                droplet.save(update_fields=['state', 'runtime_state', 'error_message'])
+            else:
+                droplet.set_erred()
+                droplet.error_message = 'DigitalOcean action %s has failed.' % action.backend_id
+                droplet.save(update_fields=['state', 'error_message'])
+
+        create_actions = [action for action in batch_actions if action.action_type == 'create']
+        for batch in {batches[action.batch_id] for action in create_actions}:
+            # IP addresses of created droplets are pulled with a single listing per batch
+            if any(action.batch_id == batch.pk and action.status == Statuses.COMPLETED for action in create_actions):
+                for backend_page in self.iter_droplet_pages(tag_name=batch.tag_name):
+                    for backend_droplet in backend_page:
+                        models.Droplet.objects.filter(
+                            service_project_link__service__settings=self.settings,
+                            backend_id=six.text_type(backend_droplet.id),
+                            ip_address__isnull=True,
+                        ).update(ip_address=backend_droplet.ip_address)
+
+            if not batch.actions.filter(status=Statuses.IN_PROGRESS).exists():
+                self._delete_batch_tag(batch)
+
+    def _delete_batch_tag(self, batch):
+        try:
+            self.manager.delete_tag(batch.tag_name)
+        except digitalocean.DataReadError as e:
+            logger.warning('Unable to delete DigitalOcean tag %s of batch %s: %s', batch.tag_name, batch.uuid.hex, e)
 
     @digitalocean_error_handler
     def remove_ssh_key(self, name, fingerprint):
+        models.SshKey.objects.filter(settings=self.settings, fingerprint=fingerprint).delete()
         try:
-            backend_ssh_key = self.pull_ssh_key(name, fingerprint)
+            backend_ssh_key = self.pull_ssh_key(fingerprint)
         except NotFoundError:
             pass  # no need to perform any action if key doesn't exist at backend
         else:
-            backend_ssh_key.destroy()
+            self.manager.destroy_ssh_key(backend_ssh_key.id)
+
+    @digitalocean_error_handler
+    def remove_ssh_keys(self, fingerprints):
+        """
+        Remove many SSH keys from the account at once.
+        Keys of the account are listed only once and matched by fingerprint locally.
+        """
+        fingerprints = set(fingerprints)
+        models.SshKey.objects.filter(settings=self.settings, fingerprint__in=fingerprints).delete()
+        backend_ssh_keys = [backend_ssh_key for backend_ssh_key in self.manager.get_all_ssh_keys()
+                            if backend_ssh_key.fingerprint in fingerprints]
+        if not backend_ssh_keys:
+            return
+
+        def destroy_ssh_key(backend_ssh_key):
+            try:
+                self.manager.destroy_ssh_key(backend_ssh_key.id)
+            except digitalocean.DataReadError as e:
+                if six.text_type(e) != NOT_FOUND_MESSAGE:
+                    return '%s: %s' % (backend_ssh_key.fingerprint, e)
+
+        errors = [error for error in self._map_concurrently(destroy_ssh_key, backend_ssh_keys) if error]
+        if errors:
+            raise DigitalOceanBackendError('Unable to remove SSH keys. %s' % '; '.join(errors))
 
     def ping(self, raise_exception=False):
         tries_count = 3
@@ -157,100 +683,226 @@ class DigitalOceanBackend(ServiceBackend):
             return True
 
     def pull_service_properties(self):
-        self.pull_regions()
-        self.pull_images()
-        self.pull_sizes()
+        """
+        Pull regions, images and sizes from backend.
+
+        These properties are shared by all service settings, therefore catalog which
+        has been already stored by another settings within CATALOG_FINGERPRINT_LIFETIME
+        is not written to database again. Only one worker stores the same catalog at a time.
+        """
+        with self._sync_phase('pull_regions'):
+            backend_regions = self.get_all_regions()
+        with self._sync_phase('pull_images'):
+            backend_images = self.get_all_images()
+        with self._sync_phase('pull_sizes'):
+            backend_sizes = self.get_all_sizes()
+
+        fingerprint = self._get_fingerprint([
+            sorted(self._get_regions_properties(backend_regions).items()),
+            sorted(self._get_images_properties(backend_images).items()),
+            sorted(self._get_sizes_properties(backend_sizes).items()),
+            sorted(self._get_properties_regions(backend_images).items()),
+            sorted(self._get_properties_regions(backend_sizes, key='slug').items()),
+        ])
+        cache_key = 'waldur_digitalocean:catalog_fingerprint'
+        if cache.get(cache_key) == fingerprint:
+            logger.debug('DigitalOcean catalog of service settings %s has not changed, skipping pull.',
+                         self.settings.uuid.hex)
+            return
+
+        lock_key = 'waldur_digitalocean:catalog_lock:%s' % fingerprint
+        if not cache.add(lock_key, True, django_settings.WALDUR_DIGITALOCEAN['CATALOG_LOCK_TIMEOUT']):
+            logger.debug('The same DigitalOcean catalog is being pulled by another worker, skipping pull.')
+            return
+
+        try:
+            with transaction.atomic():
+                with self._sync_phase('pull_regions') as phase:
+                    phase.add_result(self.pull_regions(backend_regions))
+                with self._sync_phase('pull_images') as phase:
+                    phase.add_result(self.pull_images(backend_images))
+                with self._sync_phase('pull_sizes') as phase:
+                    phase.add_result(self.pull_sizes(backend_sizes))
+            cache.set(cache_key, fingerprint, django_settings.WALDUR_DIGITALOCEAN['CATALOG_FINGERPRINT_LIFETIME'])
+        finally:
+            cache.delete(lock_key)
+
+        # Compatibility index is rebuilt right away, so that droplet validation does not have to wait for it
+        catalog.get_compatibility_index()
 
     def has_global_properties(self):
         properties = (models.Region, models.Image, models.Size)
         return all(model.objects.count() > 0 for model in properties)
 
     @transaction.atomic
-    def pull_regions(self):
-        cur_regions = self._get_current_properties(models.Region)
-        for backend_region in self.get_all_regions():
-            if backend_region.available:
-                cur_regions.pop(backend_region.slug, None)
-                try:
-                    models.Region.objects.update_or_create(
-                        backend_id=backend_region.slug,
-                        defaults={'name': backend_region.name})
-                except IntegrityError:
-                    logger.warning(
-                        'Could not create DigitalOcean region with id %s due to concurrent update',
-                        backend_region.slug)
+    def pull_regions(self, backend_regions=None):
+        if backend_regions is None:
+            backend_regions = self.get_all_regions()
+        result = self._pull_properties(models.Region, self._get_regions_properties(backend_regions))
+        if result.changed:
+            self._invalidate_catalog()
+        return result
 
-        models.Region.objects.filter(backend_id__in=cur_regions.keys()).delete()
+    @transaction.atomic
+    def pull_images(self, backend_images=None):
+        if backend_images is None:
+            backend_images = self.get_all_images()
+        result = self._pull_properties(models.Image, self._get_images_properties(backend_images))
+        regions_changed = self._pull_properties_regions(models.Image, self._get_properties_regions(backend_images))
+        if result.changed or regions_changed:
+            self._invalidate_catalog()
+        return result
 
     @transaction.atomic
-    def pull_images(self):
-        cur_images = self._get_current_properties(models.Image)
-        for backend_image in self.get_all_images():
-            cur_images.pop(str(backend_image.id), None)
-            try:
-                image, _ = models.Image.objects.update_or_create(
-                    backend_id=backend_image.id,
-                    defaults={
-                        'name': '{} {}'.format(backend_image.distribution, backend_image.name),
-                        'type': backend_image.type,
-                        'distribution': backend_image.distribution,
-                        'is_official': backend_image.slug is not None,
-                        'min_disk_size': self.gb2mb(backend_image.min_disk_size),
-                        'created_at': dateparse.parse_datetime(backend_image.created_at)
-                    })
-                self._update_entity_regions(image, backend_image)
-            except IntegrityError:
-                logger.warning(
-                    'Could not create DigitalOcean image with id %s due to concurrent update',
-                    backend_image.id)
+    def pull_sizes(self, backend_sizes=None):
+        if backend_sizes is None:
+            backend_sizes = self.get_all_sizes()
+        result = self._pull_properties(models.Size, self._get_sizes_properties(backend_sizes))
+        regions_changed = self._pull_properties_regions(
+            models.Size, self._get_properties_regions(backend_sizes, key='slug'))
+        if result.changed:
+            DropletStrategy.invalidate_consumable_items()
+            transaction.on_commit(DropletStrategy.invalidate_consumable_items)
+        if result.changed or regions_changed:
+            self._invalidate_catalog()
+        return result
+
+    def _invalidate_catalog(self):
+        # Caches are invalidated once more after commit, so that caches which
+        # have been rebuilt from not yet committed catalog are not left stale.
+        catalog.invalidate()
+        transaction.on_commit(catalog.invalidate)
+
+    def _get_regions_properties(self, backend_regions):
+        return {
+            backend_region.slug: {'name': backend_region.name}
+            for backend_region in backend_regions if backend_region.available
+        }
 
-        models.Image.objects.filter(backend_id__in=cur_images.keys()).delete()
+    def _get_images_properties(self, backend_images):
+        return {
+            six.text_type(backend_image.id): {
+                'name': '{} {}'.format(backend_image.distribution, backend_image.name),
+                'type': backend_image.type,
+                'distribution': backend_image.distribution,
+                'is_official': backend_image.slug is not None,
+                'min_disk_size': self.gb2mb(backend_image.min_disk_size),
+                'created_at': dateparse.parse_datetime(backend_image.created_at),
+            } for backend_image in backend_images
+        }
 
-    @transaction.atomic
-    def pull_sizes(self):
-        cur_sizes = self._get_current_properties(models.Size)
-        for backend_size in self.get_all_sizes():
-            cur_sizes.pop(backend_size.slug, None)
-            try:
-                size, _ = models.Size.objects.update_or_create(
-                    backend_id=backend_size.slug,
-                    defaults={
-                        'name': backend_size.slug,
-                        'cores': backend_size.vcpus,
-                        'ram': backend_size.memory,
-                        'disk': self.gb2mb(backend_size.disk),
-                        'transfer': int(self.tb2mb(backend_size.transfer)),
-                        'price': backend_size.price_hourly})
-                self._update_entity_regions(size, backend_size)
-            except IntegrityError:
-                logger.warning(
-                    'Could not create DigitalOcean size with id %s due to concurrent update',
-                    backend_size.slug)
+    def _get_sizes_properties(self, backend_sizes):
+        return {
+            backend_size.slug: {
+                'name': backend_size.slug,
+                'cores': backend_size.vcpus,
+                'ram': backend_size.memory,
+                'disk': self.gb2mb(backend_size.disk),
+                'transfer': int(self.tb2mb(backend_size.transfer)),
+                'price': backend_size.price_hourly,
+                'price_monthly': backend_size.price_monthly,
+            } for backend_size in backend_sizes
+        }
 
-        models.Size.objects.filter(backend_id__in=cur_sizes.keys()).delete()
+    def _get_properties_regions(self, backend_properties, key='id'):
+        return {
+            six.text_type(getattr(backend_property, key)): backend_property.regions
+            for backend_property in backend_properties
+        }
 
-    @transaction.atomic
     def pull_droplets(self):
-        backend_droplets = {six.text_type(droplet.id): droplet for droplet in self.get_all_droplets()}
-        backend_ids = set(backend_droplets.keys())
-
+        """
+        Update state, runtime state and image name of droplets from backend.
+
+        Droplets are listed page by page and each page is stored in its own transaction,
+        so memory usage does not depend on number of droplets in the account.
+        Only droplets whose fields differ from backend are written. Pages which have not
+        changed since the previous pull are skipped unless local droplets have changed.
+        """
         nc_droplets = models.Droplet.objects.filter(service_project_link__service__settings=self.settings)
-        nc_droplets = {droplet.backend_id: droplet for droplet in nc_droplets}
-        nc_ids = set(nc_droplets.keys())
-
-        # Mark stale droplets as erred if they are removed from the backend
-        for droplet_id in nc_ids - backend_ids:
-            nc_droplet = nc_droplets[droplet_id]
+        cache_key = 'waldur_digitalocean:droplets_fingerprint:%s' % self.settings.uuid.hex
+        cached_fingerprints, cached_signature = cache.get(cache_key, (frozenset(), None))
+        local_unchanged = cached_signature == self._get_droplets_signature(nc_droplets)
+
+        result = PullResult()
+        fingerprints = set()
+        backend_ids = set()
+        for backend_page in self.iter_droplet_pages():
+            backend_droplets = {
+                six.text_type(backend_droplet.id): self._get_droplet_backend_fields(backend_droplet)
+                for backend_droplet in backend_page
+            }
+            backend_ids.update(backend_droplets)
+            fingerprint = self._get_fingerprint(sorted(backend_droplets.items()))
+            fingerprints.add(fingerprint)
+            if local_unchanged and fingerprint in cached_fingerprints:
+                continue
+
+            with transaction.atomic():
+                page_droplets = nc_droplets.filter(backend_id__in=list(backend_droplets))
+                result.updated += self._pull_droplets(page_droplets, backend_droplets)
+
+        if local_unchanged and fingerprints == cached_fingerprints:
+            logger.debug('Skipping pull of DigitalOcean droplets for settings %s because '
+                         'they have not changed since previous pull.', self.settings.uuid.hex)
+            return result
+
+        with transaction.atomic():
+            result.updated += self._mark_stale_droplets(nc_droplets, backend_ids)
+
+        cache.set(cache_key, (frozenset(fingerprints), self._get_droplets_signature(nc_droplets)),
+                  django_settings.WALDUR_DIGITALOCEAN['DROPLETS_FINGERPRINT_LIFETIME'])
+        return result
+
+    def _pull_droplets(self, nc_droplets, backend_droplets):
+        """
+        Update droplets which have changed at backend and return number of updated droplets.
+        Only changed fields are saved, droplets are saved one by one so that their signals are sent.
+        """
+        updated_count = 0
+        for nc_droplet in nc_droplets:
+            backend_fields = backend_droplets[nc_droplet.backend_id]
+            changed_fields = [field for field, value in zip(self.DROPLET_BACKEND_FIELDS, backend_fields)
+                              if getattr(nc_droplet, field) != value]
+            if changed_fields:
+                for field, value in zip(self.DROPLET_BACKEND_FIELDS, backend_fields):
+                    setattr(nc_droplet, field, value)
+                nc_droplet.save(update_fields=changed_fields)
+                updated_count += 1
+
+        return updated_count
+
+    def _mark_stale_droplets(self, nc_droplets, backend_ids):
+        """ Mark droplets as erred if they are removed from the backend. """
+        stale_pks = [pk for pk, backend_id in nc_droplets.exclude(
+            state=models.Droplet.States.ERRED).values_list('pk', 'backend_id') if backend_id not in backend_ids]
+
+        for nc_droplet in models.Droplet.objects.filter(pk__in=stale_pks):
             nc_droplet.set_erred()
-            nc_droplet.save()
+            nc_droplet.save(update_fields=['state'])
 
-        # Update state of matching droplets
-        for droplet_id in nc_ids & backend_ids:
-            backend_droplet = backend_droplets[droplet_id]
-            nc_droplet = nc_droplets[droplet_id]
-            nc_droplet.state, nc_droplet.runtime_state = self._get_droplet_states(backend_droplet)
-            nc_droplet.image_name = self.format_image_name(backend_droplet.image)
-            nc_droplet.save()
+        return len(stale_pks)
+
+    def _get_droplet_backend_fields(self, backend_droplet):
+        state, runtime_state = self._get_droplet_states(backend_droplet)
+        return state, runtime_state, self.format_image_name(backend_droplet.image)
+
+    def _get_droplets_signature(self, nc_droplets):
+        """
+        Signature of local droplets and their fields which are pulled from backend.
+        Values are compared instead of modification time, because bulk updates do not change it.
+        """
+        # sha1 is used for change detection, not for security
+        digest = hashlib.sha1()  # nosec
+        values = nc_droplets.order_by('pk').values_list('pk', 'backend_id', *self.DROPLET_BACKEND_FIELDS)
+        for droplet_values in values.iterator():
+            digest.update(json.dumps(droplet_values, default=six.text_type).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get_fingerprint(self, data):
+        # sha1 is used for change detection, not for security
+        return hashlib.sha1(json.dumps(
+            data, sort_keys=True, default=six.text_type).encode('utf-8')).hexdigest()  # nosec
 
     def _get_droplet_states(self, droplet):
         States = models.Droplet.States
@@ -269,17 +921,40 @@ class DigitalOceanBackend(ServiceBackend):
         return '{} {}'.format(backend_image['distribution'], backend_image['name'])
 
     @digitalocean_error_handler
-    def get_droplet(self, backend_droplet_id):
+    def get_droplet(self, backend_droplet_id, cached=True):
+        """ Droplet may be served from short-lived cache of the client unless `cached` is False. """
+        if not cached:
+            self.manager.invalidate_droplet(backend_droplet_id)
         return self.manager.get_droplet(backend_droplet_id)
 
     def get_monthly_cost_estimate(self, droplet):
+        """ Estimate is based on pulled sizes, droplet is fetched from backend only if its size is unknown. """
+        price_monthly = models.Size.objects.filter(
+            name=droplet.size_name, price_monthly__isnull=False).values_list('price_monthly', flat=True).first()
+        if price_monthly is not None:
+            return price_monthly
+        return self._get_live_monthly_cost_estimate(droplet)
+
+    def get_monthly_cost_estimates(self, droplets):
+        """
+        Estimate monthly costs of droplets queryset with single query.
+        Returns dictionary which maps droplet primary key to its monthly price.
+        """
+        prices = models.Size.objects.filter(name=OuterRef('size_name')).values('price_monthly')[:1]
+        estimates = {}
+        for droplet in droplets.annotate(price_monthly=Subquery(prices)).only('pk', 'backend_id', 'size_name'):
+            if droplet.price_monthly is None:
+                droplet.price_monthly = self._get_live_monthly_cost_estimate(droplet)
+            estimates[droplet.pk] = droplet.price_monthly
+        return estimates
+
+    def _get_live_monthly_cost_estimate(self, droplet):
         backend_droplet = self.get_droplet(droplet.backend_id)
-        return backend_droplet.size['price_monthly']
+        return decimal.Decimal(six.text_type(backend_droplet.size['price_monthly']))
 
     def get_resources_for_import(self):
-        cur_droplets = models.Droplet.objects.all().values_list('backend_id', flat=True)
+        cur_droplets = set(models.Droplet.objects.all().values_list('backend_id', flat=True))
         statuses = ('active', 'off')
-        droplets = self.get_all_droplets()
         return [{
             'id': droplet.id,
             'name': droplet.name,
@@ -289,7 +964,7 @@ class DigitalOceanBackend(ServiceBackend):
             'disk': self.gb2mb(droplet.disk),
             'flavor_name': droplet.size_slug,
             'resource_type': SupportedServices.get_name_for_model(models.Droplet)
-        } for droplet in droplets
+        } for droplets in self.iter_droplet_pages() for droplet in droplets
             if str(droplet.id) not in cur_droplets and droplet.status in statuses]
 
     def import_droplet(self, backend_droplet_id, service_project_link=None, save=True):
@@ -315,7 +990,7 @@ class DigitalOceanBackend(ServiceBackend):
 
     def get_managed_resources(self):
         try:
-            ids = [droplet.id for droplet in self.get_all_droplets()]
+            ids = [droplet.id for droplets in self.iter_droplet_pages() for droplet in droplets]
             return models.Droplet.objects.filter(backend_id__in=ids)
         except DigitalOceanBackendError:
             return []
@@ -324,6 +999,31 @@ class DigitalOceanBackend(ServiceBackend):
     def get_all_droplets(self):
         return self.manager.get_all_droplets()
 
+    def iter_droplet_pages(self, tag_name=None):
+        """ Yield droplets of the account page by page. """
+        return self._iter_pages(self.manager.iter_droplet_pages(tag_name=tag_name))
+
+    def iter_action_pages(self):
+        """ Yield actions of the account page by page. """
+        return self._iter_pages(self.manager.iter_action_pages())
+
+    def _iter_pages(self, pages):
+        # Each page is fetched lazily, so error handler is applied to every step of iteration.
+        while True:
+            try:
+                page = self._get_next_page(pages)
+            except StopIteration:
+                return
+            yield page
+
+    @digitalocean_error_handler
+    def _get_next_page(self, pages):
+        return next(pages)
+
+    @digitalocean_error_handler
+    def get_action(self, action_id):
+        return self.manager.get_action(action_id)
+
     @digitalocean_error_handler
     def get_all_regions(self):
         return self.manager.get_all_regions()
@@ -338,38 +1038,175 @@ class DigitalOceanBackend(ServiceBackend):
 
     def get_or_create_ssh_key(self, ssh_key):
         try:
-            backend_ssh_key = self.pull_ssh_key(ssh_key.name, ssh_key.fingerprint)
+            backend_ssh_key = self.pull_ssh_key(ssh_key.fingerprint)
         except NotFoundError:
             backend_ssh_key = self.push_ssh_key(ssh_key)
         return backend_ssh_key
 
+    def get_ssh_key_id(self, ssh_key):
+        """
+        Return DigitalOcean ID of SSH key, registering the key at backend if needed.
+        IDs are stored per service settings, so that known keys are resolved without API calls.
+        """
+        try:
+            return models.SshKey.objects.get(settings=self.settings, fingerprint=ssh_key.fingerprint).backend_id
+        except models.SshKey.DoesNotExist:
+            pass
+
+        backend_id = six.text_type(self.get_or_create_ssh_key(ssh_key).id)
+        models.SshKey.objects.update_or_create(
+            settings=self.settings, fingerprint=ssh_key.fingerprint, defaults={'backend_id': backend_id})
+        return backend_id
+
+    def _is_ssh_key_stale(self, ssh_key, backend_id):
+        """ Check if stored SSH key ID is not valid anymore and forget it if so. """
+        try:
+            backend_ssh_key = self.pull_ssh_key(backend_id)
+        except NotFoundError:
+            stale = True
+        else:
+            stale = backend_ssh_key.fingerprint != ssh_key.fingerprint
+
+        if stale:
+            models.SshKey.objects.filter(settings=self.settings, fingerprint=ssh_key.fingerprint).delete()
+        return stale
+
+    def _call_with_ssh_key(self, ssh_key, create):
+        """
+        Call droplet create function with list of DigitalOcean SSH key IDs.
+        Stored key ID is verified only if request fails, then the key is resolved again and request is repeated.
+        """
+        if ssh_key is None:
+            return create([])
+
+        backend_id = self.get_ssh_key_id(ssh_key)
+        try:
+            return create([backend_id])
+        except digitalocean.DataReadError:
+            exc_info = sys.exc_info()
+            try:
+                stale = self._is_ssh_key_stale(ssh_key, backend_id)
+            except Exception as e:
+                # Error of the check should not hide the reason why the droplet is not created
+                logger.warning('Unable to check DigitalOcean SSH key %s of %s: %s', backend_id, self.settings, e)
+                stale = False
+            if not stale:
+                six.reraise(*exc_info)
+
+        return create([self.get_ssh_key_id(ssh_key)])
+
     @digitalocean_error_handler
     def push_ssh_key(self, ssh_key):
-        backend_ssh_key = digitalocean.SSHKey(
-            token=self.manager.token,
-            name=ssh_key.name,
-            public_key=ssh_key.public_key)
-
-        backend_ssh_key.create()
-        return backend_ssh_key
+        return self.manager.create_ssh_key(ssh_key.name, ssh_key.public_key)
 
     @digitalocean_error_handler
-    def pull_ssh_key(self, name, fingerprint):
-        backend_ssh_key = digitalocean.SSHKey(
-            token=self.manager.token,
-            fingerprint=fingerprint,
-            name=name,
-            id=None)
-
-        backend_ssh_key.load()
-        return backend_ssh_key
+    def pull_ssh_key(self, key_id_or_fingerprint):
+        return self.manager.get_ssh_key(key_id_or_fingerprint)
 
     def _get_current_properties(self, model):
         return {p.backend_id: p for p in model.objects.all()}
 
-    def _update_entity_regions(self, entity, backend_entity):
-        all_regions = set(entity.regions.all())
-        actual_regions = set(models.Region.objects.filter(backend_id__in=backend_entity.regions))
-
-        entity.regions.add(*(actual_regions - all_regions))
-        entity.regions.remove(*(all_regions - actual_regions))
+    def _pull_properties(self, model, backend_properties):
+        """
+        Synchronize catalog model with backend properties in bulk.
+
+        Current rows are loaded once, then missing rows are bulk inserted,
+        rows with changed fields are updated with one query per distinct change
+        and rows which are not reported by backend anymore are deleted.
+        Rows which are already up to date are not written at all.
+        """
+        result = PullResult()
+        cur_properties = self._get_current_properties(model)
+
+        new_properties = []
+        changed_properties = collections.defaultdict(list)
+        for backend_id, values in backend_properties.items():
+            values = self._normalize_property_values(model, values)
+            prop = cur_properties.pop(backend_id, None)
+            if prop is None:
+                new_properties.append(model(backend_id=backend_id, **values))
+                continue
+
+            changes = tuple(sorted(
+                ((field, value) for field, value in values.items() if getattr(prop, field) != value),
+                key=lambda change: change[0]))
+            if changes:
+                changed_properties[changes].append(prop.pk)
+
+        for changes, pks in changed_properties.items():
+            model.objects.filter(pk__in=pks).update(**dict(changes))
+            result.updated += len(pks)
+
+        if new_properties:
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(new_properties)
+            except IntegrityError:
+                logger.warning(
+                    'Could not create DigitalOcean %s with ids %s due to concurrent update',
+                    model._meta.verbose_name_plural,
+                    ', '.join(prop.backend_id for prop in new_properties))
+            else:
+                result.created = len(new_properties)
+
+        if cur_properties:
+            model.objects.filter(pk__in=[prop.pk for prop in cur_properties.values()]).delete()
+            result.deleted = len(cur_properties)
+
+        return result
+
+    def _normalize_property_values(self, model, values):
+        """
+        Convert backend values to the form they have after loading from database,
+        so that unchanged fields are not reported as changed.
+        """
+        normalized = {}
+        for name, value in values.items():
+            field = model._meta.get_field(name)
+            value = field.to_python(value)
+            decimal_places = getattr(field, 'decimal_places', None)
+            if value is not None and decimal_places is not None:
+                value = value.quantize(decimal.Decimal(10) ** -decimal_places)
+            normalized[name] = value
+        return normalized
+
+    def _pull_properties_regions(self, model, backend_regions):
+        """
+        Reconcile regions of all catalog entities of the model in one pass.
+
+        Backend regions are given as mapping from entity backend ID to list of region slugs.
+        Membership is compared as a set of (entity, region) pairs against the M2M through table,
+        missing pairs are bulk inserted and stale pairs are deleted with a single query.
+        Returns True if any pair has been changed.
+        """
+        field = model._meta.get_field('regions')
+        through = field.remote_field.through
+        entity_field = field.m2m_field_name() + '_id'
+        region_field = field.m2m_reverse_field_name() + '_id'
+
+        entities = dict(model.objects.values_list('backend_id', 'pk'))
+        regions = dict(models.Region.objects.values_list('backend_id', 'pk'))
+
+        actual_pairs = set()
+        for backend_id, region_slugs in backend_regions.items():
+            entity_pk = entities.get(backend_id)
+            if entity_pk is None:
+                continue
+            actual_pairs.update((entity_pk, regions[slug]) for slug in region_slugs if slug in regions)
+
+        current_pairs = {}
+        for pk, entity_pk, region_pk in through.objects.values_list('pk', entity_field, region_field):
+            current_pairs[(entity_pk, region_pk)] = pk
+
+        stale_pks = [pk for pair, pk in current_pairs.items() if pair not in actual_pairs]
+        if stale_pks:
+            through.objects.filter(pk__in=stale_pks).delete()
+
+        new_pairs = actual_pairs - set(current_pairs)
+        if new_pairs:
+            through.objects.bulk_create([
+                through(**{entity_field: entity_pk, region_field: region_pk})
+                for entity_pk, region_pk in new_pairs
+            ])
+
+        return bool(stale_pks or new_pairs)
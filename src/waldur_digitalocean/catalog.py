@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import time
+import uuid
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+
+from . import models
+
+
+CATALOG_STATE_KEY = 'waldur_digitalocean:catalog_state'
+INDEX_KEY = 'waldur_digitalocean:compatibility_index:%s'
+
+
+def _get_new_state():
+    return uuid.uuid4().hex, int(time.time())
+
+
+def get_state():
+    """
+    Return version of regions, images and sizes together with timestamp of its last change.
+    Version is a token which is changed whenever catalog is changed.
+    """
+    return cache.get_or_set(CATALOG_STATE_KEY, _get_new_state, None)
+
+
+def get_version():
+    return get_state()[0]
+
+
+def invalidate():
+    cache.set(CATALOG_STATE_KEY, _get_new_state(), None)
+
+
+class CompatibilityIndex(object):
+    """
+    Valid combinations of images, sizes and regions.
+
+    Images and sizes available in each region are stored as bitsets,
+    where bit position of image or size is its position in `images` or `sizes` list.
+    Image can be used with size if disk of size is not smaller than minimal disk size of image.
+    """
+
+    def __init__(self, images, sizes, region_images, region_sizes):
+        # images and sizes are lists of (pk, uuid, disk size) tuples
+        self.images = images
+        self.sizes = sizes
+        self.image_bits = {pk: 1 << position for position, (pk, _, _) in enumerate(images)}
+        self.size_bits = {pk: 1 << position for position, (pk, _, _) in enumerate(sizes)}
+        self.region_images = region_images
+        self.region_sizes = region_sizes
+
+    @classmethod
+    def build(cls):
+        """
+        Build index of the current catalog.
+
+        Catalog may be pulled concurrently, so links to images and sizes which have been created
+        after they were listed are skipped. Such index is stored under the previous catalog version,
+        because catalog is invalidated after it is pulled.
+        """
+        images = list(models.Image.objects.order_by('pk').values_list('pk', 'uuid', 'min_disk_size'))
+        sizes = list(models.Size.objects.order_by('pk').values_list('pk', 'uuid', 'disk'))
+        index = cls(images, sizes, {}, {})
+
+        for region_pk, image_pk in models.Image.regions.through.objects.values_list('region_id', 'image_id'):
+            if image_pk in index.image_bits:
+                index.region_images[region_pk] = index.region_images.get(region_pk, 0) | index.image_bits[image_pk]
+        for region_pk, size_pk in models.Size.regions.through.objects.values_list('region_id', 'size_id'):
+            if size_pk in index.size_bits:
+                index.region_sizes[region_pk] = index.region_sizes.get(region_pk, 0) | index.size_bits[size_pk]
+        return index
+
+    def has_image(self, region_pk, image_pk):
+        return bool(self.region_images.get(region_pk, 0) & self.image_bits.get(image_pk, 0))
+
+    def has_size(self, region_pk, size_pk):
+        return bool(self.region_sizes.get(region_pk, 0) & self.size_bits.get(size_pk, 0))
+
+    def get_pairs(self, region_pk):
+        """ Return list of (image UUID, list of size UUIDs) which can be used together in the region. """
+        region_images = self.region_images.get(region_pk, 0)
+        region_sizes = self.region_sizes.get(region_pk, 0)
+        sizes = [(size_uuid, disk) for pk, size_uuid, disk in self.sizes if region_sizes & self.size_bits[pk]]
+
+        pairs = []
+        for pk, image_uuid, min_disk_size in self.images:
+            if not region_images & self.image_bits[pk]:
+                continue
+            image_sizes = [size_uuid for size_uuid, disk in sizes if not min_disk_size or disk >= min_disk_size]
+            if image_sizes:
+                pairs.append((image_uuid, image_sizes))
+        return pairs
+
+
+_index = (None, None)
+
+
+def get_compatibility_index():
+    """
+    Return compatibility index of the current catalog.
+    Index is shared by all processes via cache and kept in memory of each process.
+    """
+    global _index
+    version = get_version()
+    cached_version, index = _index
+    if cached_version == version:
+        return index
+
+    index = cache.get(INDEX_KEY % version)
+    if index is None:
+        index = CompatibilityIndex.build()
+        cache.set(INDEX_KEY % version, index, django_settings.WALDUR_DIGITALOCEAN['CATALOG_INDEX_LIFETIME'])
+    _index = (version, index)
+    return index
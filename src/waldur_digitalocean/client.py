@@ -0,0 +1,535 @@
+from __future__ import unicode_literals
+
+import collections
+import contextlib
+import hashlib
+import itertools
+import logging
+import sys
+import threading
+import time
+
+import digitalocean
+import requests
+from celery import current_task
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.utils import six
+from django.utils.six.moves.urllib import parse as urlparse
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+GET = 'GET'
+POST = 'POST'
+DELETE = 'DELETE'
+
+RATE_LIMIT_MESSAGE = 'API Rate limit exceeded.'
+
+
+class Priorities(object):
+    """ Priorities of API calls, calls which are not classified explicitly have SYNC priority. """
+    SYNC = 'sync'
+    POLLING = 'polling'
+    PROVISIONING = 'provisioning'
+
+
+class RateLimitDeferred(Exception):
+    """
+    API call of background priority is deferred until rate limit budget is reset.
+
+    It is not a backend error: callers are expected to skip or reschedule the work
+    without marking service settings or resources as erred.
+    """
+
+    def __init__(self, countdown):
+        super(RateLimitDeferred, self).__init__(
+            'DigitalOcean API call is deferred for %s seconds due to rate limit.' % countdown)
+        self.countdown = countdown
+
+
+class RateLimiter(object):
+    """
+    Share rate limit budget of DigitalOcean token between all workers.
+
+    Limit, remaining budget and reset time reported by API in response headers
+    are stored in Django cache, which is shared by web and Celery workers.
+    Each call is admitted against that budget according to priority of the current thread:
+    a priority may only consume budget above its reserved share of the limit (RATE_LIMIT_RESERVE),
+    so background sync is throttled first and user-facing provisioning last.
+    Sync and polling calls which exceed their share are deferred until the budget is reset.
+    Calls without explicit priority, such as generic pull tasks of Waldur, are treated as sync,
+    user-initiated provisioning should be run within priority(Priorities.PROVISIONING).
+    """
+    BACKGROUND_PRIORITIES = (Priorities.SYNC, Priorities.POLLING)
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        previous = self.get_priority()
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def get_priority(self):
+        return getattr(self.local, 'priority', Priorities.SYNC)
+
+    def acquire(self, token):
+        """
+        Consume one call from token budget.
+
+        Raise RateLimitDeferred if budget of background priority is exhausted
+        or DataReadError if the whole budget is exhausted.
+        """
+        remaining_key, limit_key, reset_key = self._get_keys(token)
+        budget = cache.get_many([remaining_key, limit_key, reset_key])
+        limit = budget.get(limit_key)
+        remaining = budget.get(remaining_key)
+        if limit is None or remaining is None:
+            return
+
+        priority = self.get_priority()
+        reserve = limit * django_settings.WALDUR_DIGITALOCEAN['RATE_LIMIT_RESERVE'].get(priority, 0)
+        if remaining <= reserve:
+            logger.info('DigitalOcean API call with priority %s is rejected, %s of %s calls remain.',
+                        priority, remaining, limit)
+            if priority in self.BACKGROUND_PRIORITIES:
+                reset = budget.get(reset_key, 0)
+                raise RateLimitDeferred(max(reset - int(time.time()), 1))
+            raise digitalocean.DataReadError(RATE_LIMIT_MESSAGE)
+
+        try:
+            cache.decr(remaining_key)
+        except ValueError:
+            pass  # budget has been reset concurrently
+
+    def update(self, token, headers):
+        """ Store budget reported by API. """
+        try:
+            limit = int(headers['Ratelimit-Limit'])
+            remaining = int(headers['Ratelimit-Remaining'])
+            reset = int(headers['Ratelimit-Reset'])
+        except (KeyError, ValueError):
+            return
+
+        timeout = max(reset - int(time.time()), 1)
+        remaining_key, limit_key, reset_key = self._get_keys(token)
+        cache.set_many({remaining_key: remaining, limit_key: limit, reset_key: reset}, timeout)
+
+    def _get_keys(self, token):
+        # sha1 is used to avoid storing token in cache keys, not for security
+        token_hash = hashlib.sha1(token.encode('utf-8')).hexdigest()  # nosec
+        return ('waldur_digitalocean:ratelimit:%s:remaining' % token_hash,
+                'waldur_digitalocean:ratelimit:%s:limit' % token_hash,
+                'waldur_digitalocean:ratelimit:%s:reset' % token_hash)
+
+
+rate_limiter = RateLimiter()
+
+
+class RequestCounter(object):
+    """ Number of API requests made by the current thread, it is used to profile synchronization. """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def increment(self, value=1):
+        self.local.count = self.get() + value
+
+    def get(self):
+        return getattr(self.local, 'count', 0)
+
+
+request_counter = RequestCounter()
+
+
+class DropletCache(object):
+    """
+    Short-lived cache of droplets fetched one by one, shared by API clients of the process.
+
+    Entries are keyed by scope of the client (token and end point) and droplet ID.
+    Number of entries of all clients is limited by DROPLET_CACHE_SIZE and expired entries
+    are dropped on access, so the cache does not hold droplets longer than their TTL.
+    Concurrent lookups of the same droplet share a single API call:
+    the first thread fetches the droplet while the others wait for its result.
+    A lookup which is in flight while its droplet is invalidated is not stored
+    and is not joined by later lookups.
+    """
+
+    class Flight(object):
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.exc_info = None
+            self.invalidated = False
+
+        def wait(self):
+            self.event.wait()
+            if self.exc_info:
+                six.reraise(*self.exc_info)
+            return self.result
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Key is mapped to (expiration time, droplet) in order of insertion
+        self.entries = collections.OrderedDict()
+        self.flights = {}
+
+    def get(self, scope, droplet_id, fetch, ttl):
+        """ Return cached droplet or fetch it by calling `fetch`. """
+        if not ttl:
+            return fetch()
+
+        key = (scope, six.text_type(droplet_id))
+        with self.lock:
+            self._drop_expired()
+            entry = self.entries.get(key)
+            if entry is not None:
+                return entry[1]
+            flight = self.flights.get(key)
+            if flight is not None:
+                is_leader = False
+            else:
+                is_leader = True
+                flight = self.flights[key] = self.Flight()
+
+        if not is_leader:
+            return flight.wait()
+
+        try:
+            flight.result = fetch()
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        else:
+            with self.lock:
+                if not flight.invalidated:
+                    self.entries.pop(key, None)
+                    self.entries[key] = (time.time() + ttl, flight.result)
+                    size = django_settings.WALDUR_DIGITALOCEAN['DROPLET_CACHE_SIZE']
+                    while len(self.entries) > size:
+                        self.entries.popitem(last=False)
+            return flight.result
+        finally:
+            with self.lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.event.set()
+
+    def invalidate(self, scope, droplet_id):
+        key = (scope, six.text_type(droplet_id))
+        with self.lock:
+            self.entries.pop(key, None)
+            flight = self.flights.pop(key, None)
+            if flight is not None:
+                flight.invalidated = True
+
+    def clear(self, scope=None):
+        """ Drop all entries of the scope, or all entries if scope is not specified. """
+        with self.lock:
+            for key in [key for key in self.entries if scope is None or key[0] == scope]:
+                del self.entries[key]
+            for key in [key for key in self.flights if scope is None or key[0] == scope]:
+                self.flights.pop(key).invalidated = True
+
+    def _drop_expired(self):
+        # Entries are stored with the same TTL, so the oldest ones expire first
+        now = time.time()
+        while self.entries:
+            key, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[key]
+
+
+droplet_cache = DropletCache()
+
+
+class DigitalOceanClient(object):
+    """
+    DigitalOcean API v2 client which reuses keep-alive HTTP connections.
+
+    Resources are returned as python-digitalocean objects in order to stay compatible
+    with existing code, but they should be treated as plain data containers:
+    their own methods open new connections instead of using the client session.
+    Errors are reported as digitalocean.DataReadError with API message,
+    the same way as python-digitalocean does.
+    """
+    END_POINT = 'https://api.digitalocean.com/v2/'
+    PER_PAGE = 200
+
+    def __init__(self, token, end_point=None, timeout=None, connections=10, droplet_cache_ttl=0):
+        self.token = token
+        # End point is joined with relative URLs of resources, so it should end with slash
+        self.end_point = (end_point or self.END_POINT).rstrip('/') + '/'
+        self.timeout = timeout
+        self.last_used = time.time()
+        # Client which is closed while requests are in progress is closed after the last of them
+        self.lock = threading.Lock()
+        self.active_requests = 0
+        self.close_pending = False
+        self.droplet_cache_ttl = droplet_cache_ttl
+        self.droplet_cache_scope = (token, self.end_point)
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': 'Bearer %s' % token,
+            'Content-Type': 'application/json',
+        })
+
+    def close(self):
+        """
+        Close keep-alive connections of the client. Session of closed client opens new connections
+        if it is used again, so backend which still holds evicted client keeps working.
+        """
+        with self.lock:
+            if self.active_requests:
+                self.close_pending = True
+                return
+        self.session.close()
+
+    @contextlib.contextmanager
+    def in_use(self):
+        with self.lock:
+            self.active_requests += 1
+            self.last_used = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active_requests -= 1
+                self.last_used = time.time()
+                close = self.close_pending and not self.active_requests
+                if close:
+                    self.close_pending = False
+            if close:
+                self.session.close()
+
+    def request(self, method, url, params=None, data=None):
+        with self.in_use():
+            return self._send(method, url, params, data)
+
+    def _send(self, method, url, params, data):
+        url = urlparse.urljoin(self.end_point, url)
+        rate_limiter.acquire(self.token)
+        request_counter.increment()
+        metrics.get_collector().inc(metrics.API_REQUESTS, {
+            'task': getattr(current_task, 'name', None) or '',
+            'priority': rate_limiter.get_priority(),
+        })
+        logger.debug('%s %s %s', method, url, params or '')
+        response = self.session.request(method, url, params=params, json=data, timeout=self.timeout)
+        rate_limiter.update(self.token, response.headers)
+
+        if response.status_code == 204:
+            return True
+
+        try:
+            payload = response.json()
+        except ValueError as e:
+            raise digitalocean.DataReadError('Read failed from DigitalOcean: %s' % e)
+
+        if not response.ok:
+            raise digitalocean.DataReadError(payload.get('message') or response.reason)
+
+        return payload
+
+    def iter_pages(self, url, key, params=None):
+        """ Fetch pages of the list resource one by one. """
+        params = dict(params or {}, per_page=self.PER_PAGE)
+        data = self.request(GET, url, params=params)
+        while True:
+            yield data[key]
+            next_url = data.get('links', {}).get('pages', {}).get('next')
+            if not next_url:
+                return
+            data = self.request(GET, next_url)
+
+    def get_list(self, url, key, params=None):
+        """ Fetch all pages of the list resource. """
+        return list(itertools.chain.from_iterable(self.iter_pages(url, key, params)))
+
+    def get_account(self):
+        return digitalocean.Account(**self.request(GET, 'account')['account'])
+
+    def get_all_regions(self):
+        return [digitalocean.Region(**data) for data in self.get_list('regions', 'regions')]
+
+    def get_all_images(self):
+        return [digitalocean.Image(**data) for data in self.get_list('images', 'images')]
+
+    def get_all_sizes(self):
+        return [digitalocean.Size(**data) for data in self.get_list('sizes', 'sizes')]
+
+    def get_all_droplets(self):
+        return [self._get_droplet(data) for data in self.get_list('droplets', 'droplets')]
+
+    def iter_droplet_pages(self, tag_name=None):
+        params = {'tag_name': tag_name} if tag_name else None
+        for page in self.iter_pages('droplets', 'droplets', params):
+            yield [self._get_droplet(data) for data in page]
+
+    def get_droplet(self, droplet_id):
+        return droplet_cache.get(self.droplet_cache_scope, droplet_id, lambda: self._get_droplet(
+            self.request(GET, 'droplets/%s' % droplet_id)['droplet']), self.droplet_cache_ttl)
+
+    def invalidate_droplet(self, droplet_id):
+        droplet_cache.invalidate(self.droplet_cache_scope, droplet_id)
+
+    def create_droplet(self, name, region, image, size, ssh_keys=None, user_data=None):
+        data = {
+            'name': name,
+            'region': region,
+            'image': image,
+            'size': size,
+            'ssh_keys': ssh_keys or [],
+        }
+        if user_data:
+            data['user_data'] = user_data
+
+        response = self.request(POST, 'droplets', data=data)
+        droplet = self._get_droplet(response['droplet'])
+        droplet.action_ids = [action['id'] for action in response['links']['actions']]
+        return droplet
+
+    def create_droplets(self, names, region, image, size, ssh_keys=None, user_data=None, tags=None):
+        """ Create droplets with the same configuration in a single request. """
+        data = {
+            'names': names,
+            'region': region,
+            'image': image,
+            'size': size,
+            'ssh_keys': ssh_keys or [],
+            'tags': tags or [],
+        }
+        if user_data:
+            data['user_data'] = user_data
+
+        response = self.request(POST, 'droplets', data=data)
+        droplets = [self._get_droplet(droplet) for droplet in response['droplets']]
+        # Create actions are listed in the same order as droplets
+        for droplet, action in zip(droplets, response['links']['actions']):
+            droplet.action_ids = [action['id']]
+        return droplets
+
+    def destroy_droplet(self, droplet_id):
+        self.invalidate_droplet(droplet_id)
+        return self.request(DELETE, 'droplets/%s' % droplet_id)
+
+    def droplet_action(self, droplet_id, action_type, **params):
+        self.invalidate_droplet(droplet_id)
+        params['type'] = action_type
+        data = self.request(POST, 'droplets/%s/actions' % droplet_id, data=params)
+        return digitalocean.Action(**data['action'])
+
+    def tag_droplet_action(self, tag_name, action_type, **params):
+        """ Start action for all droplets with the tag. """
+        # Droplets of the tag are not known, so all of them are invalidated
+        droplet_cache.clear(self.droplet_cache_scope)
+        params['type'] = action_type
+        data = self.request(POST, 'droplets/actions', params={'tag_name': tag_name}, data=params)
+        return [digitalocean.Action(**action) for action in data['actions']]
+
+    def create_tag(self, name):
+        return self.request(POST, 'tags', data={'name': name})
+
+    def tag_droplets(self, name, droplet_ids):
+        for droplet_id in droplet_ids:
+            self.invalidate_droplet(droplet_id)
+        for index in range(0, len(droplet_ids), self.PER_PAGE):
+            resources = [{'resource_id': six.text_type(droplet_id), 'resource_type': 'droplet'}
+                         for droplet_id in droplet_ids[index:index + self.PER_PAGE]]
+            self.request(POST, 'tags/%s/resources' % name, data={'resources': resources})
+
+    def delete_tag(self, name):
+        droplet_cache.clear(self.droplet_cache_scope)
+        return self.request(DELETE, 'tags/%s' % name)
+
+    def get_action(self, action_id):
+        return digitalocean.Action(**self.request(GET, 'actions/%s' % action_id)['action'])
+
+    def iter_action_pages(self):
+        for page in self.iter_pages('actions', 'actions'):
+            yield [digitalocean.Action(**data) for data in page]
+
+    def get_all_ssh_keys(self):
+        return [digitalocean.SSHKey(**data) for data in self.get_list('account/keys', 'ssh_keys')]
+
+    def get_ssh_key(self, key_id_or_fingerprint):
+        data = self.request(GET, 'account/keys/%s' % key_id_or_fingerprint)
+        return digitalocean.SSHKey(**data['ssh_key'])
+
+    def create_ssh_key(self, name, public_key):
+        data = self.request(POST, 'account/keys', data={'name': name, 'public_key': public_key})
+        return digitalocean.SSHKey(**data['ssh_key'])
+
+    def destroy_ssh_key(self, key_id):
+        return self.request(DELETE, 'account/keys/%s' % key_id)
+
+    def _get_droplet(self, data):
+        droplet = digitalocean.Droplet(**data)
+        for network in droplet.networks.get('v4', []):
+            if network['type'] == 'public':
+                droplet.ip_address = network['ip_address']
+            elif network['type'] == 'private':
+                droplet.private_ip_address = network['ip_address']
+        return droplet
+
+
+class ClientPool(object):
+    """
+    Process-wide registry of API clients keyed by token and end point.
+
+    Clients which have not been used for CLIENT_IDLE_TIMEOUT seconds are closed,
+    least recently used clients are closed when there are more than CLIENT_POOL_SIZE of them.
+    Clients are ordered by time of the last request, not by time when they were taken from the pool,
+    because backends keep clients for their whole lifetime.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, token, end_point=None):
+        conf = django_settings.WALDUR_DIGITALOCEAN
+        key = (token, end_point)
+        now = time.time()
+
+        with self.lock:
+            for idle_key, idle_client in list(self.clients.items()):
+                if now - idle_client.last_used > conf['CLIENT_IDLE_TIMEOUT'] and not idle_client.active_requests:
+                    del self.clients[idle_key]
+                    idle_client.close()
+
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = DigitalOceanClient(
+                    token, end_point, timeout=conf['REQUEST_TIMEOUT'], connections=conf['CLIENT_CONNECTIONS'],
+                    droplet_cache_ttl=conf['DROPLET_CACHE_TTL'])
+            client.last_used = now
+
+            while len(self.clients) > conf['CLIENT_POOL_SIZE']:
+                evicted_key = min(self.clients, key=lambda k: self.clients[k].last_used)
+                # Client with requests in progress is closed when they are finished
+                self.clients.pop(evicted_key).close()
+
+        return client
+
+    def clear(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+        droplet_cache.clear()
+
+
+pool = ClientPool()
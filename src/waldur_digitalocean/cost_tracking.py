@@ -1,3 +1,7 @@
+import uuid
+
+from django.core.cache import cache
+
 from waldur_core.cost_tracking import CostTrackingRegister, CostTrackingStrategy, ConsumableItem
 
 from . import models
@@ -6,19 +10,43 @@ from . import models
 class DropletStrategy(CostTrackingStrategy):
     resource_class = models.Droplet
 
+    # Version of sizes catalog is shared by all processes, consumable items are cached per process.
+    SIZES_VERSION_KEY = 'waldur_digitalocean:sizes_version'
+    _consumable_items = (None, [])
+
     class Types(object):
         FLAVOR = 'flavor'
 
     @classmethod
     def get_consumable_items(cls):
-        return [ConsumableItem(item_type=cls.Types.FLAVOR, key=size.name, default_price=size.price)
-                for size in models.Size.objects.all()]
+        version = cache.get_or_set(cls.SIZES_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+        cached_version, items = cls._consumable_items
+        if cached_version != version:
+            items = [ConsumableItem(item_type=cls.Types.FLAVOR, key=name, default_price=price)
+                     for name, price in models.Size.objects.values_list('name', 'price')]
+            cls._consumable_items = (version, items)
+        return list(items)
+
+    @classmethod
+    def invalidate_consumable_items(cls):
+        """ Should be called when names or prices of sizes are changed. """
+        cache.set(cls.SIZES_VERSION_KEY, uuid.uuid4().hex, None)
 
     @classmethod
     def get_configuration(cls, droplet):
+        return cls._get_configuration(droplet.state, droplet.size_name)
+
+    @classmethod
+    def get_configurations(cls, droplets):
+        """ Return configurations of many droplets as dictionary keyed by droplet primary key. """
+        return {pk: cls._get_configuration(state, size_name)
+                for pk, state, size_name in droplets.values_list('pk', 'state', 'size_name').iterator()}
+
+    @classmethod
+    def _get_configuration(cls, state, size_name):
         consumables = {}
-        if droplet.state != models.Droplet.States.ERRED and droplet.size_name:
-            consumables[ConsumableItem(item_type=cls.Types.FLAVOR, key=droplet.size_name)] = 1
+        if state != models.Droplet.States.ERRED and size_name:
+            consumables[ConsumableItem(item_type=cls.Types.FLAVOR, key=size_name)] = 1
         return consumables
 
 
@@ -20,7 +20,7 @@ class DropletCreateExecutor(executors.CreateExecutor):
                 runtime_state='provisioning',
                 success_runtime_state=RuntimeStateMixin.RuntimeStates.ONLINE,
                 **kwargs),
-            tasks.WaitForActionComplete().s(serialized_droplet).set(countdown=30))
+            tasks.WaitForActionComplete().s(serialized_droplet))
 
 
 class DropletDeleteExecutor(executors.DeleteExecutor):
@@ -43,7 +43,7 @@ class DropletStopExecutor(executors.ActionExecutor):
                 serialized_droplet, 'stop',
                 state_transition='begin_updating',
                 success_runtime_state=models.Droplet.RuntimeStates.OFFLINE),
-            tasks.WaitForActionComplete().s(serialized_droplet).set(countdown=10))
+            tasks.WaitForActionComplete().s(serialized_droplet))
 
 
 class DropletStartExecutor(executors.ActionExecutor):
@@ -55,7 +55,7 @@ class DropletStartExecutor(executors.ActionExecutor):
                 serialized_droplet, 'start',
                 state_transition='begin_updating',
                 success_runtime_state=models.Droplet.RuntimeStates.ONLINE),
-            tasks.WaitForActionComplete().s(serialized_droplet).set(countdown=10))
+            tasks.WaitForActionComplete().s(serialized_droplet))
 
 
 class DropletRestartExecutor(executors.ActionExecutor):
@@ -67,7 +67,7 @@ class DropletRestartExecutor(executors.ActionExecutor):
                 serialized_droplet, 'restart',
                 state_transition='begin_updating',
                 success_runtime_state=models.Droplet.RuntimeStates.ONLINE),
-            tasks.WaitForActionComplete().s(serialized_droplet).set(countdown=10))
+            tasks.WaitForActionComplete().s(serialized_droplet))
 
 
 class DropletResizeExecutor(executors.UpdateExecutor):
@@ -84,7 +84,7 @@ class DropletResizeExecutor(executors.UpdateExecutor):
                 success_runtime_state=models.Droplet.RuntimeStates.ONLINE,
                 backend_size_id=size.backend_id,
                 disk=disk),
-            tasks.WaitForActionComplete().s(serialized_droplet).set(countdown=10),
+            tasks.WaitForActionComplete().s(serialized_droplet),
             tasks.LogDropletResized().si(serialized_droplet, core_utils.serialize_instance(size)))
 
 
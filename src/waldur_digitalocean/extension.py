@@ -5,6 +5,67 @@ from waldur_core.core import WaldurExtension
 
 class DigitalOceanExtension(WaldurExtension):
 
+    class Settings:
+        WALDUR_DIGITALOCEAN = {
+            # Maximum time in seconds to skip pull of droplets which have not changed
+            'DROPLETS_FINGERPRINT_LIFETIME': 60 * 60,
+            # Maximum time in seconds to skip pull of regions, images and sizes if catalog has not changed
+            'CATALOG_FINGERPRINT_LIFETIME': 10 * 60,
+            'CATALOG_LOCK_TIMEOUT': 5 * 60,
+            # Lifetime in seconds of cached compatibility index of regions, images and sizes
+            'CATALOG_INDEX_LIFETIME': 24 * 60 * 60,
+            # Lifetime in seconds of cached responses of regions, images and sizes endpoints
+            'CATALOG_RESPONSE_LIFETIME': 60 * 60,
+            # Defaults for parallel synchronization of service settings, see sync.SyncRunner
+            'SYNC_POOL': 'thread',
+            'SYNC_WORKERS': 8,
+            'SYNC_TOKEN_CONCURRENCY': 1,
+            'SYNC_MAX_CONCURRENT_REQUESTS': 16,
+            # Number of the latest synchronization records kept per service settings, see models.SyncRun
+            'SYNC_RUN_HISTORY_SIZE': 100,
+            # Registry of keep-alive API clients shared by backends of the process, see client.ClientPool
+            'CLIENT_POOL_SIZE': 100,
+            'CLIENT_IDLE_TIMEOUT': 5 * 60,
+            'CLIENT_CONNECTIONS': 10,
+            'REQUEST_TIMEOUT': 60,
+            # Lifetime in seconds of droplets cached by API clients and maximum number of them per process,
+            # see client.DropletCache
+            'DROPLET_CACHE_TTL': 5,
+            'DROPLET_CACHE_SIZE': 10000,
+            # Collector of backend call metrics, see metrics module
+            'METRICS_COLLECTOR': 'waldur_digitalocean.metrics.InMemoryCollector',
+            # Period in seconds after which metrics of CacheCollector are reset
+            'METRICS_CACHE_TIMEOUT': 24 * 60 * 60,
+            'METRICS_DURATION_BUCKETS': (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+            # Prediction of droplet action durations and polling schedule, see models.Action
+            'ACTION_HISTORY_SIZE': 50,
+            'ACTION_HISTORY_MIN_SAMPLES': 3,
+            'ACTION_DEFAULT_DURATIONS': {
+                'create': 60,
+                'power_on': 20,
+                'shutdown': 20,
+                'reboot': 30,
+                'resize': 120,
+            },
+            'ACTION_POLL_MIN_DELAY': 5,
+            'ACTION_POLL_MAX_DELAY': 5 * 60,
+            # Finished actions are deleted after this number of days,
+            # the latest ACTION_HISTORY_SIZE completed actions of each type are kept, see tasks.cleanup_actions
+            'ACTION_RETENTION_DAYS': 30,
+            # Maximum number of concurrent API calls if batch action is started for each droplet separately
+            'BATCH_ACTION_CONCURRENCY': 10,
+            # Maximum number of droplets created by a single API request
+            'BATCH_CREATE_SIZE': 10,
+            # Maximum number of droplets requested by a single batch create call
+            'BATCH_CREATE_MAX_DROPLETS': 50,
+            # Share of token rate limit which is reserved from API calls of given priority, see client.RateLimiter
+            'RATE_LIMIT_RESERVE': {
+                'sync': 0.5,
+                'polling': 0.2,
+                'provisioning': 0,
+            },
+        }
+
     @staticmethod
     def django_app():
         return 'waldur_digitalocean'
@@ -14,6 +75,22 @@ class DigitalOceanExtension(WaldurExtension):
         from .urls import register_in
         return register_in
 
+    @staticmethod
+    def celery_tasks():
+        from datetime import timedelta
+        return {
+            'waldur-digitalocean-poll-actions': {
+                'task': 'waldur_digitalocean.poll_actions',
+                'schedule': timedelta(seconds=5),
+                'args': (),
+            },
+            'waldur-digitalocean-cleanup-actions': {
+                'task': 'waldur_digitalocean.cleanup_actions',
+                'schedule': timedelta(hours=24),
+                'args': (),
+            },
+        }
+
     @staticmethod
     def get_cleanup_executor():
         from .executors import DigitalOceanCleanupExecutor
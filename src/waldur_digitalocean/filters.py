@@ -1,3 +1,4 @@
+import django_filters
 from django_filters import OrderingFilter
 
 from waldur_core.structure import filters as structure_filters
@@ -29,3 +30,11 @@ class RegionFilter(structure_filters.BaseServicePropertyFilter):
 class DropletFilter(structure_filters.BaseResourceFilter):
     class Meta(structure_filters.BaseResourceFilter.Meta):
         model = models.Droplet
+
+
+class SyncRunFilter(django_filters.FilterSet):
+    settings_uuid = django_filters.UUIDFilter(name='settings__uuid')
+
+    class Meta(object):
+        model = models.SyncRun
+        fields = ('state',)
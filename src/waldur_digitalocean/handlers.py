@@ -1,7 +1,8 @@
 from waldur_core.core import models as core_models, tasks as core_tasks, utils as core_utils
 from waldur_core.structure import models as structure_models, filters as structure_filters
 
-from . import models
+from . import catalog, models
+from .cost_tracking import DropletStrategy
 
 
 def remove_ssh_keys_from_service(sender, structure, user, role, **kwargs):
@@ -12,17 +13,19 @@ def remove_ssh_keys_from_service(sender, structure, user, role, **kwargs):
         lost_services = models.DigitalOceanService.objects.filter(customer=structure)
     else:
         return
-    lost_settings = [service.settings for service in lost_services]
+    lost_settings_ids = set(lost_services.values_list('settings_id', flat=True))
     visible_services = structure_filters.filter_queryset_for_user(models.DigitalOceanService.objects.all(), user)
-    visible_settings = [service.settings for service in visible_services]
-    settings_list = set([settings for settings in lost_settings if settings not in visible_settings])
+    visible_settings_ids = set(visible_services.values_list('settings_id', flat=True))
+    settings_list = structure_models.ServiceSettings.objects.filter(pk__in=lost_settings_ids - visible_settings_ids)
 
-    ssh_keys = core_models.SshPublicKey.objects.filter(user=user)
+    fingerprints = list(core_models.SshPublicKey.objects.filter(user=user).values_list('fingerprint', flat=True))
+    if not fingerprints:
+        return
+    models.SshKey.objects.filter(settings__in=settings_list, fingerprint__in=fingerprints).delete()
+    # Keys are removed by single task per settings, so that account keys are listed only once
     for settings in settings_list:
         serialized_settings = core_utils.serialize_instance(settings)
-        for ssh_key in ssh_keys:
-            core_tasks.IndependentBackendMethodTask().delay(
-                serialized_settings, 'remove_ssh_key', ssh_key.name, ssh_key.fingerprint)
+        core_tasks.IndependentBackendMethodTask().delay(serialized_settings, 'remove_ssh_keys', fingerprints)
 
 
 def remove_ssh_key_from_service_settings_on_deletion(sender, instance, **kwargs):
@@ -30,7 +33,18 @@ def remove_ssh_key_from_service_settings_on_deletion(sender, instance, **kwargs)
     user = ssh_key.user
     services = structure_filters.filter_queryset_for_user(models.DigitalOceanService.objects.all(), user)
     settings_list = structure_models.ServiceSettings.objects.filter(digitaloceanservice=services)
+    models.SshKey.objects.filter(settings__in=settings_list, fingerprint=ssh_key.fingerprint).delete()
     for settings in settings_list:
         serialized_settings = core_utils.serialize_instance(settings)
         core_tasks.IndependentBackendMethodTask().delay(
             serialized_settings, 'remove_ssh_key', ssh_key.name, ssh_key.fingerprint)
+
+
+def invalidate_consumable_items(sender, instance, **kwargs):
+    """ Sizes edited one by one, for example via admin, change consumable items of droplets. """
+    DropletStrategy.invalidate_consumable_items()
+
+
+def invalidate_catalog(sender, **kwargs):
+    """ Regions, images and sizes edited one by one, for example via admin, change compatibility index. """
+    catalog.invalidate()
@@ -0,0 +1,56 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...sync import SyncRunner, SyncReport
+
+
+class Command(BaseCommand):
+    help = """ Synchronize DigitalOcean service settings concurrently and print summary report """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--service-settings', dest='settings_uuids', nargs='+', metavar='UUID',
+                            help='UUIDs of service settings to synchronize. All settings are used by default.')
+        parser.add_argument('--pool', choices=(SyncRunner.THREAD, SyncRunner.PROCESS),
+                            help='Type of worker pool.')
+        parser.add_argument('--workers', type=int, help='Number of workers.')
+        parser.add_argument('--token-concurrency', type=int,
+                            help='Maximum number of settings with the same token synchronized at a time.')
+        parser.add_argument('--max-concurrent-requests', type=int,
+                            help='Maximum number of concurrent API calls, 0 disables the limit.')
+
+    def handle(self, *args, **options):
+        runner = SyncRunner(
+            pool=options['pool'],
+            workers=options['workers'],
+            token_concurrency=options['token_concurrency'],
+            max_concurrent_requests=options['max_concurrent_requests'],
+        )
+
+        settings_list = runner.get_settings()
+        if options['settings_uuids']:
+            settings_list = self.filter_settings(settings_list, options['settings_uuids'])
+
+        start = time.time()
+        reports = runner.run(settings_list)
+        for report in reports:
+            self.stdout.write('%-40s %-32s %8.2fs %-6s %s' % (
+                report.settings_name, report.settings_uuid, report.duration, report.state, report.error_message))
+
+        erred_count = len([report for report in reports if report.state == SyncReport.ERRED])
+        self.stdout.write('%s service settings synchronized, %s erred, total time %.2fs' % (
+            len(reports), erred_count, time.time() - start))
+
+    def filter_settings(self, settings_list, settings_uuids):
+        try:
+            settings_uuids = {uuid.UUID(settings_uuid).hex for settings_uuid in settings_uuids}
+        except ValueError as e:
+            raise CommandError('Invalid UUID of service settings: %s' % e)
+
+        settings_list = list(settings_list.filter(uuid__in=settings_uuids))
+        unknown_uuids = settings_uuids - {service_settings.uuid.hex for service_settings in settings_list}
+        if unknown_uuids:
+            raise CommandError('DigitalOcean service settings in OK or erred state are not found: %s' %
+                               ', '.join(sorted(unknown_uuids)))
+        return settings_list
@@ -0,0 +1,278 @@
+"""
+Metrics of DigitalOcean backend calls.
+
+Backend calls are reported to collector which is configured by METRICS_COLLECTOR setting.
+Collector receives counter increments and histogram observations labeled by name-value pairs,
+so that it can be replaced by adapter to any metrics system.
+By default metrics are kept in memory of each process by InMemoryCollector. CacheCollector stores them
+in Django cache instead, so that metrics of Celery workers are visible to web workers at the cost of
+cache round-trips per call. They are rendered in Prometheus text format by PrometheusTextExporter.
+"""
+from __future__ import unicode_literals
+
+import bisect
+import collections
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.utils import six
+from django.utils.module_loading import import_string
+
+
+BACKEND_CALLS = 'waldur_digitalocean_backend_calls_total'
+BACKEND_ERRORS = 'waldur_digitalocean_backend_errors_total'
+BACKEND_CALL_DURATION = 'waldur_digitalocean_backend_call_duration_seconds'
+API_REQUESTS = 'waldur_digitalocean_api_requests_total'
+
+DESCRIPTIONS = {
+    BACKEND_CALLS: 'Number of calls of DigitalOcean backend methods.',
+    BACKEND_ERRORS: 'Number of failed calls of DigitalOcean backend methods by error class.',
+    BACKEND_CALL_DURATION: 'Duration of calls of DigitalOcean backend methods.',
+    API_REQUESTS: 'Number of DigitalOcean API requests, each of them consumes rate limit budget.',
+}
+
+
+class BaseCollector(object):
+    """ Collector which discards all metrics. """
+
+    def __init__(self):
+        self.buckets = tuple(django_settings.WALDUR_DIGITALOCEAN['METRICS_DURATION_BUCKETS'])
+
+    def inc(self, name, labels, value=1):
+        pass
+
+    def observe(self, name, labels, value):
+        pass
+
+    def reset(self):
+        pass
+
+    def get_samples(self):
+        """
+        Return counters and histograms keyed by metric name and sorted tuple of labels.
+        Histogram is a list of counts per bucket including +Inf followed by sum and count of observations.
+        """
+        return {}, {}
+
+    def get_counter(self, name, **labels):
+        counters, _ = self.get_samples()
+        return counters.get((name, self._get_labels_key(labels)), 0)
+
+    def get_histogram_count(self, name, **labels):
+        _, histograms = self.get_samples()
+        histogram = histograms.get((name, self._get_labels_key(labels)))
+        return histogram[-1] if histogram else 0
+
+    def _get_labels_key(self, labels):
+        return tuple(sorted(labels.items()))
+
+
+class InMemoryCollector(BaseCollector):
+    """ Collector which keeps metrics in memory of the process. """
+
+    def __init__(self):
+        super(InMemoryCollector, self).__init__()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = collections.defaultdict(int)
+            self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, self._get_labels_key(labels))] += value
+
+    def observe(self, name, labels, value):
+        key = (name, self._get_labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [0] * (len(self.buckets) + 3))
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def get_samples(self):
+        with self.lock:
+            return dict(self.counters), {key: list(values) for key, values in self.histograms.items()}
+
+
+class CacheCollector(BaseCollector):
+    """
+    Collector which keeps metrics in Django cache, so that metrics of web and Celery workers are aggregated.
+
+    Each value is a cache counter which is incremented atomically. Series are registered in numbered
+    slots, so that they can be listed without scanning cache keys. Sum of histogram is stored in microseconds.
+    Keys belong to period of METRICS_CACHE_TIMEOUT seconds and expire after the next period,
+    so counters are reset once per period, which is handled by rate functions of Prometheus.
+    """
+    PREFIX = 'waldur_digitalocean:metrics'
+    COUNTER = 'counter'
+    HISTOGRAM = 'histogram'
+
+    def __init__(self):
+        super(CacheCollector, self).__init__()
+        self.timeout = django_settings.WALDUR_DIGITALOCEAN['METRICS_CACHE_TIMEOUT']
+        # Series which have been registered by the process, keyed by period
+        self.registered = set()
+
+    def inc(self, name, labels, value=1):
+        series = (name, self._get_labels_key(labels), self.COUNTER)
+        self._incr(self._get_prefix(), series, 'value', value)
+
+    def observe(self, name, labels, value):
+        series = (name, self._get_labels_key(labels), self.HISTOGRAM)
+        prefix = self._get_prefix()
+        self._incr(prefix, series, 'bucket%s' % bisect.bisect_left(self.buckets, value), 1)
+        self._incr(prefix, series, 'sum', int(value * 1000000))
+        self._incr(prefix, series, 'count', 1)
+
+    def reset(self):
+        prefix = self._get_prefix()
+        slots = self._get_slots(prefix)
+        keys = [self._get_marker_key(prefix, series) for series in slots]
+        for series in slots:
+            keys.extend(self._get_value_key(prefix, series, suffix) for suffix in self._get_suffixes(series))
+        cache.delete_many(keys + self._get_slot_keys(prefix, len(slots)) + [self._get_count_key(prefix)])
+        self.registered.clear()
+
+    def get_samples(self):
+        prefix = self._get_prefix()
+        slots = self._get_slots(prefix)
+        keys = [self._get_value_key(prefix, series, suffix)
+                for series in slots for suffix in self._get_suffixes(series)]
+        values = cache.get_many(keys)
+
+        counters = {}
+        histograms = {}
+        for series in slots:
+            name, labels, series_type = series
+            series_values = [values.get(self._get_value_key(prefix, series, suffix), 0)
+                             for suffix in self._get_suffixes(series)]
+            if series_type == self.COUNTER:
+                counters[(name, labels)] = series_values[0]
+            else:
+                series_values[-2] /= 1000000.0
+                histograms[(name, labels)] = series_values
+        return counters, histograms
+
+    def _incr(self, prefix, series, suffix, delta):
+        if (prefix, series) not in self.registered:
+            self._register(prefix, series)
+        key = self._get_value_key(prefix, series, suffix)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Value is missing because it is new or cache has been cleared
+            self._register(prefix, series)
+            cache.add(key, 0, self._get_key_timeout())
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                # Value has been evicted again, metrics must not break backend calls
+                pass
+
+    def _register(self, prefix, series):
+        timeout = self._get_key_timeout()
+        if cache.add(self._get_marker_key(prefix, series), True, timeout):
+            cache.add(self._get_count_key(prefix), 0, timeout)
+            slot = cache.incr(self._get_count_key(prefix))
+            cache.set(self._get_slot_keys(prefix, slot)[-1], series, timeout)
+        self.registered.add((prefix, series))
+
+    def _get_slots(self, prefix):
+        count = cache.get(self._get_count_key(prefix), 0)
+        slots = cache.get_many(self._get_slot_keys(prefix, count))
+        return [slots[key] for key in self._get_slot_keys(prefix, count) if key in slots]
+
+    def _get_suffixes(self, series):
+        if series[2] == self.COUNTER:
+            return ['value']
+        return ['bucket%s' % index for index in range(len(self.buckets) + 1)] + ['sum', 'count']
+
+    def _get_prefix(self):
+        return '%s:%s' % (self.PREFIX, int(time.time() // self.timeout))
+
+    def _get_key_timeout(self):
+        # Keys which are created at the end of period should live until it is over
+        return 2 * self.timeout
+
+    def _get_digest(self, series):
+        # sha1 is used to build short cache keys, not for security
+        return hashlib.sha1(json.dumps(series).encode('utf-8')).hexdigest()  # nosec
+
+    def _get_count_key(self, prefix):
+        return '%s:series_count' % prefix
+
+    def _get_slot_keys(self, prefix, count):
+        return ['%s:series:%s' % (prefix, slot) for slot in range(1, count + 1)]
+
+    def _get_marker_key(self, prefix, series):
+        return '%s:registered:%s' % (prefix, self._get_digest(series))
+
+    def _get_value_key(self, prefix, series, suffix):
+        return '%s:%s:%s' % (prefix, self._get_digest(series), suffix)
+
+
+class PrometheusTextExporter(object):
+    """ Render metrics of collector in Prometheus text exposition format. """
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, collector):
+        self.collector = collector
+
+    def render(self):
+        counters, histograms = self.collector.get_samples()
+        counters = sorted(counters.items())
+        histograms = sorted(histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name, metric_type):
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP %s %s' % (name, DESCRIPTIONS.get(name, name)))
+                lines.append('# TYPE %s %s' % (name, metric_type))
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append('%s%s %s' % (name, self._format_labels(labels), value))
+
+        for (name, labels), values in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            bounds = [six.text_type(bound) for bound in self.collector.buckets] + ['+Inf']
+            for bound, count in zip(bounds, values[:-2]):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (name, self._format_labels(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %s' % (name, self._format_labels(labels), values[-2]))
+            lines.append('%s_count%s %s' % (name, self._format_labels(labels), values[-1]))
+
+        return '\n'.join(lines) + '\n'
+
+    def _format_labels(self, labels):
+        if not labels:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, self._escape(value)) for name, value in labels)
+
+    def _escape(self, value):
+        return six.text_type(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+_collector = None
+_collector_lock = threading.Lock()
+
+
+def get_collector():
+    global _collector
+    if _collector is None:
+        with _collector_lock:
+            if _collector is None:
+                _collector = import_string(django_settings.WALDUR_DIGITALOCEAN['METRICS_COLLECTOR'])()
+    return _collector
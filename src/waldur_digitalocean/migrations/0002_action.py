@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0052_customer_subnets'),
+        ('waldur_digitalocean', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Action',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend_id', models.CharField(max_length=255)),
+                ('action_type', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('in-progress', 'In progress'), ('completed', 'Completed'), ('errored', 'Errored')], default='in-progress', max_length=30)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('droplet', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='actions', to='waldur_digitalocean.Droplet')),
+                ('settings', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='structure.ServiceSettings')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='action',
+            unique_together=set([('settings', 'backend_id')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_digitalocean', '0002_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='action',
+            name='eta',
+            field=models.DateTimeField(blank=True, help_text='Predicted completion time', null=True),
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='next_poll_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='region_name',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='size_name',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AlterIndexTogether(
+            name='action',
+            index_together=set([('status', 'next_poll_at')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_digitalocean', '0004_batch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='batch',
+            name='action_type',
+            field=models.CharField(choices=[('create', 'Create'), ('start', 'Start'), ('stop', 'Stop'), ('restart', 'Restart')], max_length=30),
+        ),
+    ]
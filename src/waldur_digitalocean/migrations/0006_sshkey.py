@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0052_customer_subnets'),
+        ('waldur_digitalocean', '0005_batch_create'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SshKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=47)),
+                ('backend_id', models.CharField(max_length=255)),
+                ('settings', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='structure.ServiceSettings')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='sshkey',
+            unique_together=set([('settings', 'fingerprint')]),
+        ),
+    ]
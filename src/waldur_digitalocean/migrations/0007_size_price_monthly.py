@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_digitalocean', '0006_sshkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='size',
+            name='price_monthly',
+            field=models.DecimalField(blank=True, decimal_places=5, max_digits=11, null=True, verbose_name='Monthly price rate'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import waldur_core.core.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0052_customer_subnets'),
+        ('waldur_digitalocean', '0007_size_price_monthly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncPhase',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('duration', models.FloatField(default=0, help_text='Wall time in seconds')),
+                ('api_calls', models.PositiveIntegerField(default=0)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', waldur_core.core.fields.UUIDField()),
+                ('state', models.CharField(choices=[('running', 'Running'), ('ok', 'OK'), ('erred', 'Erred'), ('deferred', 'Deferred')], default='running', max_length=30)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True)),
+                ('settings', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='structure.ServiceSettings')),
+            ],
+            options={
+                'ordering': ('-started_at',),
+            },
+        ),
+        migrations.AddField(
+            model_name='syncphase',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phases', to='waldur_digitalocean.SyncRun'),
+        ),
+    ]
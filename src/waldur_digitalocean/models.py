@@ -1,9 +1,15 @@
 from __future__ import unicode_literals
 
+import datetime
+
+from django.conf import settings as django_settings
 from django.db import models
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
+from model_utils.models import TimeStampedModel
 
+from waldur_core.core import models as core_models
 from waldur_core.quotas.fields import CounterQuotaField
 from waldur_core.quotas.models import QuotaModelMixin
 from waldur_core.structure import models as structure_models
@@ -97,6 +103,8 @@ class Size(structure_models.GeneralServiceProperty):
     disk = models.PositiveIntegerField(help_text=_('Disk size in MiB'))
     transfer = models.PositiveIntegerField(help_text=_('Amount of transfer bandwidth in MiB'))
     price = models.DecimalField(_('Hourly price rate'), default=0, max_digits=11, decimal_places=5)
+    price_monthly = models.DecimalField(_('Monthly price rate'), null=True, blank=True,
+                                        max_digits=11, decimal_places=5)
 
     @classmethod
     def get_url_name(cls):
@@ -104,7 +112,7 @@ class Size(structure_models.GeneralServiceProperty):
 
     @classmethod
     def get_backend_fields(cls):
-        return super(Size, cls).get_backend_fields() + ('cores', 'ram', 'disk', 'transfer', 'price')
+        return super(Size, cls).get_backend_fields() + ('cores', 'ram', 'disk', 'transfer', 'price', 'price_monthly')
 
 
 class Droplet(structure_models.VirtualMachine):
@@ -126,6 +134,12 @@ class Droplet(structure_models.VirtualMachine):
         self.service_project_link.add_quota_usage(self.service_project_link.Quotas.ram, -self.ram)
         self.service_project_link.add_quota_usage(self.service_project_link.Quotas.vcpu, -self.cores)
 
+    def get_tags(self):
+        # Tags prefetched for list of droplets are used instead of querying them for each droplet
+        if 'tags' in getattr(self, '_prefetched_objects_cache', {}):
+            return [tag.name for tag in self.tags.all()]
+        return super(Droplet, self).get_tags()
+
     @property
     def external_ips(self):
         return [self.ip_address]
@@ -141,3 +155,205 @@ class Droplet(structure_models.VirtualMachine):
     @classmethod
     def get_backend_fields(cls):
         return super(Droplet, cls).get_backend_fields() + ('state', 'runtime_state', 'image_name')
+
+
+@python_2_unicode_compatible
+class Batch(core_models.UuidMixin, TimeStampedModel):
+    """ The same action requested for many droplets at once. """
+    class ActionTypes(object):
+        CREATE = 'create'
+        START = 'start'
+        STOP = 'stop'
+        RESTART = 'restart'
+
+        POWER_CHOICES = ((START, _('Start')), (STOP, _('Stop')), (RESTART, _('Restart')))
+        CHOICES = ((CREATE, _('Create')),) + POWER_CHOICES
+
+    # Backend action type and runtime state of droplet after successful action
+    BACKEND_ACTIONS = {
+        ActionTypes.CREATE: ('create', Droplet.RuntimeStates.ONLINE),
+        ActionTypes.START: ('power_on', Droplet.RuntimeStates.ONLINE),
+        ActionTypes.STOP: ('shutdown', Droplet.RuntimeStates.OFFLINE),
+        ActionTypes.RESTART: ('reboot', Droplet.RuntimeStates.ONLINE),
+    }
+
+    action_type = models.CharField(max_length=30, choices=ActionTypes.CHOICES)
+    created_by = models.ForeignKey(django_settings.AUTH_USER_MODEL, related_name='+', null=True,
+                                   on_delete=models.SET_NULL)
+    droplets = models.ManyToManyField(Droplet, related_name='+')
+
+    @property
+    def backend_action_type(self):
+        return self.BACKEND_ACTIONS[self.action_type][0]
+
+    @property
+    def success_runtime_state(self):
+        return self.BACKEND_ACTIONS[self.action_type][1]
+
+    @property
+    def tag_name(self):
+        """ Name of DigitalOcean tag which is used to address droplets of the batch. """
+        return 'waldur-batch-%s' % self.uuid.hex
+
+    @classmethod
+    def get_url_name(cls):
+        return 'digitalocean-batch'
+
+    def __str__(self):
+        return '{} of {} droplets'.format(self.action_type, self.droplets.count())
+
+
+@python_2_unicode_compatible
+class Action(models.Model):
+    """
+    Droplet action which is tracked until it is finished at backend.
+    Pending actions of all droplets are polled in batches by poll_actions task.
+    Durations of finished actions are used to predict completion time of new ones.
+    """
+    class Statuses(object):
+        IN_PROGRESS = 'in-progress'
+        COMPLETED = 'completed'
+        ERRORED = 'errored'
+
+        CHOICES = (
+            (IN_PROGRESS, _('In progress')),
+            (COMPLETED, _('Completed')),
+            (ERRORED, _('Errored')),
+        )
+
+    settings = models.ForeignKey(structure_models.ServiceSettings, related_name='+', on_delete=models.CASCADE)
+    droplet = models.ForeignKey(Droplet, related_name='actions', null=True, on_delete=models.SET_NULL)
+    batch = models.ForeignKey(Batch, related_name='actions', null=True, blank=True, on_delete=models.SET_NULL)
+    backend_id = models.CharField(max_length=255)
+    action_type = models.CharField(max_length=50)
+    size_name = models.CharField(max_length=150, blank=True)
+    region_name = models.CharField(max_length=150, blank=True)
+    status = models.CharField(max_length=30, choices=Statuses.CHOICES, default=Statuses.IN_PROGRESS)
+    started_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    eta = models.DateTimeField(null=True, blank=True, help_text=_('Predicted completion time'))
+    next_poll_at = models.DateTimeField(default=timezone.now)
+
+    class Meta(object):
+        unique_together = ('settings', 'backend_id')
+        # Pending actions which are due are looked up by poll_actions task
+        index_together = ('status', 'next_poll_at')
+
+    @property
+    def is_finished(self):
+        return self.status != self.Statuses.IN_PROGRESS
+
+    def get_expected_duration(self):
+        """
+        Median duration in seconds of recently completed actions of the same type.
+        Actions with the same size and region are preferred if there are enough of them.
+        """
+        conf = django_settings.WALDUR_DIGITALOCEAN
+        completed_actions = Action.objects.filter(
+            action_type=self.action_type, status=self.Statuses.COMPLETED, completed_at__isnull=False)
+
+        for lookup in ({'size_name': self.size_name, 'region_name': self.region_name},
+                       {'size_name': self.size_name},
+                       {}):
+            rows = completed_actions.filter(**lookup).order_by('-completed_at').values_list(
+                'started_at', 'completed_at')[:conf['ACTION_HISTORY_SIZE']]
+            durations = sorted((completed_at - started_at).total_seconds() for started_at, completed_at in rows)
+            if len(durations) >= conf['ACTION_HISTORY_MIN_SAMPLES']:
+                return durations[len(durations) // 2]
+
+        return conf['ACTION_DEFAULT_DURATIONS'].get(self.action_type, conf['ACTION_POLL_MAX_DELAY'])
+
+    def get_poll_delay(self, now=None):
+        """
+        Delay in seconds before the next poll of the action.
+
+        Before ETA half of remaining time is waited, so polls are sparse early
+        and dense near expected completion. After ETA the delay equals the time
+        the action is overdue, so it grows exponentially.
+        """
+        conf = django_settings.WALDUR_DIGITALOCEAN
+        now = now or timezone.now()
+        eta = self.eta or self.started_at
+        remaining = (eta - now).total_seconds()
+        delay = remaining / 2 if remaining > 0 else -remaining
+        return min(max(delay, conf['ACTION_POLL_MIN_DELAY']), conf['ACTION_POLL_MAX_DELAY'])
+
+    def schedule_next_poll(self, now=None):
+        now = now or timezone.now()
+        self.next_poll_at = now + datetime.timedelta(seconds=self.get_poll_delay(now))
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.action_type, self.backend_id, self.status)
+
+
+@python_2_unicode_compatible
+class SshKey(models.Model):
+    """
+    DigitalOcean ID of SSH public key which has been registered using token of service settings.
+    It allows to pass SSH key to a new droplet without looking it up at backend first.
+    """
+    settings = models.ForeignKey(structure_models.ServiceSettings, related_name='+', on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=47)
+    backend_id = models.CharField(max_length=255)
+
+    class Meta(object):
+        unique_together = ('settings', 'fingerprint')
+
+    def __str__(self):
+        return '{} of {}'.format(self.fingerprint, self.settings)
+
+
+@python_2_unicode_compatible
+class SyncRun(core_models.UuidMixin, models.Model):
+    """ Synchronization of service settings with backend, see DigitalOceanBackend.sync. """
+    class States(object):
+        RUNNING = 'running'
+        OK = 'ok'
+        ERRED = 'erred'
+        DEFERRED = 'deferred'
+
+        CHOICES = ((RUNNING, _('Running')), (OK, _('OK')), (ERRED, _('Erred')), (DEFERRED, _('Deferred')))
+
+    class Permissions(object):
+        customer_path = 'settings__customer'
+        extra_query = dict(settings__shared=True)
+
+    settings = models.ForeignKey(structure_models.ServiceSettings, related_name='+', on_delete=models.CASCADE)
+    state = models.CharField(max_length=30, choices=States.CHOICES, default=States.RUNNING)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error_message = models.TextField(blank=True)
+
+    class Meta(object):
+        ordering = ('-started_at',)
+
+    @property
+    def duration(self):
+        if self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+
+    @classmethod
+    def get_url_name(cls):
+        return 'digitalocean-sync-run'
+
+    def __str__(self):
+        return 'Synchronization of {} at {}'.format(self.settings, self.started_at)
+
+
+@python_2_unicode_compatible
+class SyncPhase(models.Model):
+    """ Wall time, API calls, SQL queries and written rows of a single phase of synchronization. """
+    run = models.ForeignKey(SyncRun, related_name='phases', on_delete=models.CASCADE)
+    name = models.CharField(max_length=50)
+    duration = models.FloatField(default=0, help_text=_('Wall time in seconds'))
+    api_calls = models.PositiveIntegerField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+
+    class Meta(object):
+        ordering = ('pk',)
+
+    def __str__(self):
+        return '{} of {}'.format(self.name, self.run)
@@ -1,7 +1,11 @@
 from __future__ import unicode_literals
 
+import collections
 import re
 
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.db.models import Prefetch
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -9,7 +13,7 @@ from rest_framework.exceptions import ValidationError
 from waldur_core.core import serializers as core_serializers
 from waldur_core.structure import serializers as structure_serializers
 
-from . import models
+from . import catalog, client, models
 from .backend import DigitalOceanBackendError
 
 
@@ -51,6 +55,10 @@ class ImageSerializer(structure_serializers.BasePropertySerializer):
 
     regions = RegionSerializer(many=True, read_only=True)
 
+    @staticmethod
+    def eager_load(queryset):
+        return queryset.prefetch_related('regions')
+
 
 class SizeSerializer(structure_serializers.BasePropertySerializer):
 
@@ -63,6 +71,10 @@ class SizeSerializer(structure_serializers.BasePropertySerializer):
 
     regions = RegionSerializer(many=True, read_only=True)
 
+    @staticmethod
+    def eager_load(queryset):
+        return queryset.prefetch_related('regions')
+
 
 class ServiceProjectLinkSerializer(structure_serializers.BaseServiceProjectLinkSerializer):
 
@@ -106,10 +118,13 @@ class DropletSerializer(structure_serializers.VirtualMachineSerializer):
         queryset=models.Size.objects.all(),
         write_only=True)
 
+    action_eta = serializers.SerializerMethodField(
+        help_text=_('Predicted completion time of action which is in progress'))
+
     class Meta(structure_serializers.VirtualMachineSerializer.Meta):
         model = models.Droplet
         fields = structure_serializers.VirtualMachineSerializer.Meta.fields + (
-            'region', 'image', 'size', 'runtime_state', 'region_name',
+            'region', 'image', 'size', 'runtime_state', 'region_name', 'action_eta',
         )
         protected_fields = structure_serializers.VirtualMachineSerializer.Meta.protected_fields + (
             'region', 'image', 'size',
@@ -118,6 +133,20 @@ class DropletSerializer(structure_serializers.VirtualMachineSerializer):
             'runtime_state', 'region_name',
         )
 
+    @staticmethod
+    def eager_load(queryset):
+        queryset = structure_serializers.VirtualMachineSerializer.eager_load(queryset)
+        pending_actions = models.Action.objects.filter(status=models.Action.Statuses.IN_PROGRESS)
+        return queryset.prefetch_related(
+            'tags', Prefetch('actions', queryset=pending_actions, to_attr='pending_actions'))
+
+    def get_action_eta(self, droplet):
+        pending_actions = getattr(droplet, 'pending_actions', None)
+        if pending_actions is None:
+            pending_actions = droplet.actions.filter(status=models.Action.Statuses.IN_PROGRESS)
+        etas = [action.eta for action in pending_actions if action.eta]
+        return max(etas) if etas else None
+
     def validate(self, attrs):
         attrs = super(DropletSerializer, self).validate(attrs)
 
@@ -136,12 +165,13 @@ class DropletSerializer(structure_serializers.VirtualMachineSerializer):
                     'ssh_public_key': _('SSH public key is required for this image')
                 })
 
-            if not image.regions.filter(pk=region.pk).exists():
+            index = catalog.get_compatibility_index()
+            if not index.has_image(region.pk, image.pk):
                 raise serializers.ValidationError({
                     'image': _('Image is missing in region %s') % region
                 })
 
-            if not size.regions.filter(pk=region.pk).exists():
+            if not index.has_size(region.pk, size.pk):
                 raise serializers.ValidationError({
                     'size': _('Size is missing in region %s') % region
                 })
@@ -162,6 +192,58 @@ class DropletSerializer(structure_serializers.VirtualMachineSerializer):
         return super(DropletSerializer, self).create(validated_data)
 
 
+class DropletBatchCreateSerializer(DropletSerializer):
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=150),
+        write_only=True,
+        help_text=_('Names of droplets which are created with the same configuration.'))
+
+    class Meta(DropletSerializer.Meta):
+        fields = DropletSerializer.Meta.fields + ('names',)
+
+    def get_fields(self):
+        fields = super(DropletBatchCreateSerializer, self).get_fields()
+        fields['name'].required = False
+        return fields
+
+    def validate_names(self, names):
+        max_count = django_settings.WALDUR_DIGITALOCEAN['BATCH_CREATE_MAX_DROPLETS']
+        if not names:
+            raise serializers.ValidationError(_('At least one name should be specified.'))
+        if len(names) > max_count:
+            raise serializers.ValidationError(_('No more than %s droplets can be created at once.') % max_count)
+        if len(set(names)) != len(names):
+            raise serializers.ValidationError(_('Names should be unique.'))
+        for name in names:
+            if not re.match(r'[a-zA-Z0-9.-]+$', name):
+                raise serializers.ValidationError(
+                    _('Only valid hostname characters are allowed. (a-z, A-Z, 0-9, . and -)'))
+        return names
+
+    def validate(self, attrs):
+        # All droplets share configuration, so it is validated only once
+        attrs['name'] = attrs['names'][0]
+        return super(DropletBatchCreateSerializer, self).validate(attrs)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """ Create droplets and reserve quotas for all of them or for none of them. """
+        names = validated_data.pop('names')
+        spl = validated_data['service_project_link']
+        count = len(names)
+        spl.validate_quota_change({
+            spl.Quotas.storage.name: validated_data['disk'] * count,
+            spl.Quotas.ram.name: validated_data['ram'] * count,
+            spl.Quotas.vcpu.name: validated_data['cores'] * count,
+        }, raise_exception=True)
+        spl.service.validate_quota_change({
+            spl.service.Quotas.droplet_count.name: count,
+        }, raise_exception=True)
+
+        create = super(DropletBatchCreateSerializer, self).create
+        return [create(dict(validated_data, name=name)) for name in names]
+
+
 class DropletImportSerializer(structure_serializers.BaseResourceImportSerializer):
 
     class Meta(structure_serializers.BaseResourceImportSerializer.Meta):
@@ -172,7 +254,8 @@ class DropletImportSerializer(structure_serializers.BaseResourceImportSerializer
         backend_id = validated_data['backend_id']
         service_project_link = validated_data['service_project_link']
         try:
-            return backend.import_droplet(backend_id, service_project_link)
+            with client.rate_limiter.priority(client.Priorities.PROVISIONING):
+                return backend.import_droplet(backend_id, service_project_link)
         except DigitalOceanBackendError:
             raise serializers.ValidationError(
                 {'backend_id': _("Can't find droplet with ID %s") % backend_id})
@@ -209,3 +292,77 @@ class DropletResizeSerializer(serializers.Serializer):
         return (new_size.disk == self.instance.disk and
                 new_size.cores == self.instance.cores and
                 new_size.ram == self.instance.ram)
+
+
+class DropletBatchActionSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=models.Batch.ActionTypes.POWER_CHOICES)
+    droplets = serializers.HyperlinkedRelatedField(
+        view_name='digitalocean-droplet-detail',
+        lookup_field='uuid',
+        queryset=models.Droplet.objects.all(),
+        many=True,
+        required=False,
+        help_text=_('Droplets to apply action to. Filtered droplets are used if list is not specified.'))
+
+
+class BatchSerializer(serializers.HyperlinkedModelSerializer):
+    droplets = serializers.HyperlinkedRelatedField(
+        view_name='digitalocean-droplet-detail',
+        lookup_field='uuid',
+        many=True,
+        read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta(object):
+        model = models.Batch
+        fields = ('url', 'uuid', 'action_type', 'created', 'droplets', 'progress')
+        extra_kwargs = {
+            'url': {'lookup_field': 'uuid', 'view_name': 'digitalocean-batch-detail'},
+        }
+
+    @staticmethod
+    def eager_load(queryset):
+        return queryset.prefetch_related(
+            Prefetch('droplets', queryset=models.Droplet.objects.only('uuid')),
+            Prefetch('actions', queryset=models.Action.objects.only('batch', 'status')),
+        )
+
+    def get_progress(self, batch):
+        Statuses = models.Action.Statuses
+        # Count prefetched rows in Python so that listing of batches does not query database per batch
+        counts = collections.Counter(action.status for action in batch.actions.all())
+        progress = {
+            'total': len(batch.droplets.all()),
+            'in_progress': counts.get(Statuses.IN_PROGRESS, 0),
+            'completed': counts.get(Statuses.COMPLETED, 0),
+            'errored': counts.get(Statuses.ERRORED, 0),
+        }
+        progress['not_started'] = progress['total'] - sum(counts.values())
+        return progress
+
+
+class SyncPhaseSerializer(serializers.ModelSerializer):
+    class Meta(object):
+        model = models.SyncPhase
+        fields = ('name', 'duration', 'api_calls', 'queries', 'created', 'updated', 'deleted')
+
+
+class SyncRunSerializer(serializers.HyperlinkedModelSerializer):
+    settings = serializers.HyperlinkedRelatedField(
+        view_name='servicesettings-detail',
+        lookup_field='uuid',
+        read_only=True)
+    settings_uuid = serializers.ReadOnlyField(source='settings.uuid')
+    phases = SyncPhaseSerializer(many=True, read_only=True)
+
+    class Meta(object):
+        model = models.SyncRun
+        fields = ('url', 'uuid', 'settings', 'settings_uuid', 'state', 'started_at', 'finished_at', 'duration',
+                  'error_message', 'phases')
+        extra_kwargs = {
+            'url': {'lookup_field': 'uuid', 'view_name': 'digitalocean-sync-run-detail'},
+        }
+
+    @staticmethod
+    def eager_load(queryset):
+        return queryset.select_related('settings').prefetch_related('phases')
@@ -0,0 +1,148 @@
+from __future__ import unicode_literals
+
+import collections
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings as django_settings
+from django.db import connection, connections
+from django.utils import six
+
+from waldur_core.structure import ServiceBackendError, models as structure_models
+
+from .apps import DigitalOceanConfig
+from .backend import requests_limiter
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncReport(collections.namedtuple('SyncReport', (
+        'settings_uuid', 'settings_name', 'duration', 'state', 'error_message'))):
+    """ Outcome of synchronization of single service settings. """
+
+    OK = 'OK'
+    ERRED = 'ERRED'
+
+
+def sync_settings(service_settings):
+    """
+    Pull service settings from backend and update their state.
+    State handling mirrors ServiceSettingsBackgroundPullTask.
+    """
+    start = time.time()
+    error_message = ''
+    try:
+        service_settings.get_backend().sync()
+    except ServiceBackendError as e:
+        error_message = six.text_type(e)
+        service_settings.set_erred()
+        service_settings.error_message = error_message
+        service_settings.save(update_fields=['state', 'error_message'])
+    except Exception as e:
+        # Unexpected error should not stop synchronization of other settings.
+        logger.exception('Unable to synchronize DigitalOcean service settings %s.', service_settings.uuid.hex)
+        error_message = six.text_type(e)
+    else:
+        if service_settings.state == service_settings.States.ERRED:
+            service_settings.recover()
+            service_settings.error_message = ''
+            service_settings.save(update_fields=['state', 'error_message'])
+
+    return SyncReport(
+        settings_uuid=service_settings.uuid.hex,
+        settings_name=service_settings.name,
+        duration=time.time() - start,
+        state=SyncReport.ERRED if error_message else SyncReport.OK,
+        error_message=error_message,
+    )
+
+
+def sync_shard(settings_pks):
+    """ Synchronize shard of service settings one by one. It is executed by pool worker. """
+    try:
+        return [sync_settings(service_settings)
+                for service_settings in structure_models.ServiceSettings.objects.filter(pk__in=settings_pks)]
+    finally:
+        connection.close()
+
+
+def init_process_worker(semaphore):
+    requests_limiter.configure(semaphore)
+
+
+class SyncRunner(object):
+    """
+    Run synchronization of many DigitalOcean service settings concurrently.
+
+    Settings which share the same token are split into at most `token_concurrency`
+    shards and each shard is processed sequentially by one worker, so that no more
+    than `token_concurrency` synchronizations use the same token at a time.
+    Number of API calls executed concurrently by all workers is limited by
+    `max_concurrent_requests`.
+    """
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+    def __init__(self, pool=None, workers=None, token_concurrency=None, max_concurrent_requests=None):
+        conf = django_settings.WALDUR_DIGITALOCEAN
+        self.pool = pool or conf['SYNC_POOL']
+        self.workers = workers or conf['SYNC_WORKERS']
+        self.token_concurrency = token_concurrency or conf['SYNC_TOKEN_CONCURRENCY']
+        if max_concurrent_requests is None:
+            max_concurrent_requests = conf['SYNC_MAX_CONCURRENT_REQUESTS']
+        self.max_concurrent_requests = max_concurrent_requests
+
+        if self.pool not in (self.THREAD, self.PROCESS):
+            raise ValueError('Pool should be either "%s" or "%s".' % (self.THREAD, self.PROCESS))
+
+    @staticmethod
+    def get_settings():
+        States = structure_models.ServiceSettings.States
+        return structure_models.ServiceSettings.objects.filter(
+            type=DigitalOceanConfig.service_name, state__in=[States.OK, States.ERRED])
+
+    def get_shards(self, settings_list):
+        settings_by_token = collections.defaultdict(list)
+        for service_settings in settings_list:
+            settings_by_token[service_settings.token].append(service_settings.pk)
+
+        shards = []
+        for pks in settings_by_token.values():
+            shards.extend(pks[index::self.token_concurrency]
+                          for index in range(min(self.token_concurrency, len(pks))))
+        # Start with the largest shards to keep workers busy till the end.
+        return sorted(shards, key=len, reverse=True)
+
+    def run(self, settings_list=None):
+        if settings_list is None:
+            settings_list = self.get_settings()
+
+        shards = self.get_shards(settings_list)
+        if not shards:
+            return []
+
+        workers = min(self.workers, len(shards))
+        if self.pool == self.PROCESS:
+            semaphore = self.max_concurrent_requests and multiprocessing.BoundedSemaphore(self.max_concurrent_requests)
+            # Forked workers should not share database connection of parent process.
+            connections.close_all()
+            pool = multiprocessing.Pool(workers, initializer=init_process_worker, initargs=(semaphore or None,))
+        else:
+            semaphore = self.max_concurrent_requests and threading.BoundedSemaphore(self.max_concurrent_requests)
+            requests_limiter.configure(semaphore or None)
+            pool = ThreadPool(workers)
+
+        try:
+            results = pool.map(sync_shard, shards, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            if self.pool == self.THREAD:
+                requests_limiter.configure(None)
+
+        return sorted(itertools.chain.from_iterable(results), key=lambda report: report.settings_name)
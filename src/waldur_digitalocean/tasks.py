@@ -1,32 +1,185 @@
+import collections
+import datetime
 import logging
 import sys
 
+from celery import shared_task
 from celery.task import Task as CeleryTask
-from django.utils import six
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.utils import six, timezone
 
 from waldur_core.core import utils
 from waldur_core.core.tasks import BackendMethodTask, Task
+from waldur_core.structure import ServiceBackendError, models as structure_models
 
-from . import backend, log
+from . import backend, client, log, models
 
 logger = logging.getLogger(__name__)
 
 
 class WaitForActionComplete(CeleryTask):
+    """
+    Wait until droplet action is finished.
+    Status of action is updated by poll_actions task, so this task does not call backend until action is completed.
+    Retries are scheduled shortly after the next poll of the action.
+    """
     max_retries = 300
     default_retry_delay = 5
 
     def run(self, action_id, serialized_droplet):
         droplet = utils.deserialize_instance(serialized_droplet)
-        backend = droplet.get_backend()
-        action = backend.manager.get_action(action_id)
-        if action.status == 'completed':
-            backend_droplet = backend.get_droplet(droplet.backend_id)
-            droplet.ip_address = backend_droplet.ip_address
-            droplet.save(update_fields=['ip_address'])
+        action, _ = models.Action.objects.get_or_create(
+            settings=droplet.service_project_link.service.settings,
+            backend_id=action_id,
+            defaults={'droplet': droplet},
+        )
+        if action.status == models.Action.Statuses.IN_PROGRESS:
+            countdown = (action.next_poll_at - timezone.now()).total_seconds()
+            conf = django_settings.WALDUR_DIGITALOCEAN
+            return self.retry(countdown=max(countdown, 0) + conf['ACTION_POLL_MIN_DELAY'])
+        if action.status == models.Action.Statuses.ERRORED:
+            raise backend.DigitalOceanBackendError(
+                'DigitalOcean action %s of droplet %s has failed.' % (action_id, droplet.name))
+
+        # IP address is assigned only when droplet is created
+        if action.action_type != 'create' and droplet.ip_address:
             return True
-        else:
-            self.retry()
+
+        try:
+            # Droplet cached before the action has been completed may lack IP address
+            with client.rate_limiter.priority(client.Priorities.POLLING):
+                backend_droplet = droplet.get_backend().get_droplet(droplet.backend_id, cached=False)
+        except backend.RateLimitError:
+            logger.info('Pull of DigitalOcean droplet %s is postponed due to rate limit.', droplet.backend_id)
+            return self.retry()
+        except client.RateLimitDeferred as e:
+            logger.info('Pull of DigitalOcean droplet %s is postponed due to rate limit.', droplet.backend_id)
+            return self.retry(countdown=e.countdown)
+        droplet.ip_address = backend_droplet.ip_address
+        droplet.save(update_fields=['ip_address'])
+        return True
+
+
+@shared_task(name='waldur_digitalocean.poll_actions')
+def poll_actions():
+    """ Schedule polling of pending actions which are due, one task per token and API end point. """
+    settings_by_token = {}
+    due_actions = models.Action.objects.filter(
+        status=models.Action.Statuses.IN_PROGRESS, next_poll_at__lte=timezone.now())
+    for settings_id, token, backend_url in due_actions.values_list(
+            'settings_id', 'settings__token', 'settings__backend_url').distinct():
+        settings_by_token.setdefault((token, backend_url or None), []).append(settings_id)
+
+    for settings_ids in settings_by_token.values():
+        poll_token_actions.delay(sorted(settings_ids))
+
+
+@shared_task(name='waldur_digitalocean.poll_token_actions')
+def poll_token_actions(settings_ids):
+    """ Update status of pending actions of service settings which share the same token. """
+    lock_key = 'waldur_digitalocean:poll_actions_lock:%s' % settings_ids[0]
+    if not cache.add(lock_key, True, 60):
+        logger.debug('Actions of DigitalOcean service settings %s are being polled already.', settings_ids)
+        return
+
+    try:
+        service_settings = structure_models.ServiceSettings.objects.get(pk=settings_ids[0])
+        actions = models.Action.objects.filter(
+            settings_id__in=settings_ids, status=models.Action.Statuses.IN_PROGRESS)
+        with client.rate_limiter.priority(client.Priorities.POLLING):
+            service_settings.get_backend().pull_actions(actions)
+    except client.RateLimitDeferred as e:
+        # Actions remain due, so they are polled again when budget is reset
+        logger.info('Polling of actions of DigitalOcean service settings %s is skipped: %s', settings_ids, e)
+    except ServiceBackendError as e:
+        logger.warning('Unable to poll actions of DigitalOcean service settings %s: %s', settings_ids, e)
+    finally:
+        cache.delete(lock_key)
+
+
+@shared_task(name='waldur_digitalocean.cleanup_actions')
+def cleanup_actions():
+    """
+    Delete finished actions older than ACTION_RETENTION_DAYS.
+    The latest completed actions of each type are kept, because they are used to predict durations of new ones.
+    """
+    conf = django_settings.WALDUR_DIGITALOCEAN
+    Statuses = models.Action.Statuses
+    old_actions = models.Action.objects.filter(
+        status__in=[Statuses.COMPLETED, Statuses.ERRORED],
+        started_at__lt=timezone.now() - datetime.timedelta(days=conf['ACTION_RETENTION_DAYS']),
+    )
+    kept_pks = []
+    for action_type in old_actions.values_list('action_type', flat=True).distinct():
+        kept_pks.extend(models.Action.objects.filter(
+            action_type=action_type, status=Statuses.COMPLETED, completed_at__isnull=False,
+        ).order_by('-completed_at').values_list('pk', flat=True)[:conf['ACTION_HISTORY_SIZE']])
+
+    deleted_count, _ = old_actions.exclude(pk__in=kept_pks).delete()
+    if deleted_count:
+        logger.info('%s finished DigitalOcean actions have been deleted.', deleted_count)
+
+
+@shared_task(name='waldur_digitalocean.run_batch_action')
+def run_batch_action(batch_uuid):
+    """ Start actions of the batch, one backend call per service settings. """
+    batch = models.Batch.objects.get(uuid=batch_uuid)
+    States = models.Droplet.States
+    droplets_by_settings = collections.defaultdict(list)
+    for droplet in batch.droplets.filter(state=States.UPDATE_SCHEDULED).select_related(
+            'service_project_link__service__settings'):
+        droplets_by_settings[droplet.service_project_link.service.settings].append(droplet)
+
+    for service_settings, droplets in droplets_by_settings.items():
+        for droplet in droplets:
+            droplet.begin_updating()
+            droplet.save(update_fields=['state'])
+        try:
+            with client.rate_limiter.priority(client.Priorities.PROVISIONING):
+                errors = service_settings.get_backend().batch_action(batch, droplets)
+        except ServiceBackendError as e:
+            logger.exception('Unable to start %s action for droplets of batch %s.', batch.action_type, batch_uuid)
+            errors = {droplet.backend_id: six.text_type(e) for droplet in droplets}
+
+        for droplet in droplets:
+            if droplet.backend_id in errors:
+                droplet.set_erred()
+                droplet.error_message = errors[droplet.backend_id]
+                droplet.save(update_fields=['state', 'error_message'])
+            else:
+                droplet.runtime_state = batch.success_runtime_state
+                droplet.save(update_fields=['runtime_state'])
+
+
+@shared_task(name='waldur_digitalocean.run_batch_create')
+def run_batch_create(batch_uuid, **kwargs):
+    """ Create droplets of the batch, droplets are grouped into as few backend calls as possible. """
+    batch = models.Batch.objects.get(uuid=batch_uuid)
+    States = models.Droplet.States
+    droplets = list(batch.droplets.filter(state=States.CREATION_SCHEDULED).select_related(
+        'service_project_link__service__settings').order_by('pk'))
+    if not droplets:
+        return
+
+    for droplet in droplets:
+        droplet.begin_creating()
+        droplet.runtime_state = 'provisioning'
+        droplet.save(update_fields=['state', 'runtime_state'])
+    # Droplets of the batch are created with the same configuration in the same service settings
+    service_settings = droplets[0].service_project_link.service.settings
+    try:
+        with client.rate_limiter.priority(client.Priorities.PROVISIONING):
+            errors = service_settings.get_backend().batch_create_droplets(batch, droplets, **kwargs)
+    except ServiceBackendError as e:
+        logger.exception('Unable to create droplets of batch %s.', batch_uuid)
+        errors = {droplet.uuid.hex: six.text_type(e) for droplet in droplets}
+
+    for droplet in droplets:
+        if droplet.uuid.hex in errors:
+            droplet.set_erred()
+            droplet.error_message = errors[droplet.uuid.hex]
+            droplet.save(update_fields=['state', 'error_message'])
 
 
 class LogDropletResized(Task):
@@ -45,12 +198,13 @@ class SafeBackendMethodTask(BackendMethodTask):
     """
     Open alert if token scope is read-only.
     Close alert if token scope if read-write.
-    It should be applied to droplet provisioning tasks.
+    It should be applied to droplet provisioning tasks, their API calls have provisioning priority.
     """
 
     def execute(self, droplet, *args, **kwargs):
         try:
-            result = super(SafeBackendMethodTask, self).execute(droplet, *args, **kwargs)
+            with client.rate_limiter.priority(client.Priorities.PROVISIONING):
+                result = super(SafeBackendMethodTask, self).execute(droplet, *args, **kwargs)
         except backend.TokenScopeError:
             droplet.service_project_link.service.raise_readonly_token_alert()
             six.reraise(*sys.exc_info())
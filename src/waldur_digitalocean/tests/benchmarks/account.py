@@ -0,0 +1,134 @@
+"""
+Synthetic DigitalOcean account which is served to the real API client without network access.
+"""
+from __future__ import unicode_literals
+
+import random
+
+from django.utils.six.moves.urllib import parse as urlparse
+
+
+DISTRIBUTIONS = ('Ubuntu', 'Debian', 'CentOS', 'Fedora', 'CoreOS', 'FreeBSD')
+
+
+class SyntheticAccount(object):
+    """ Regions, sizes, images and droplets generated deterministically from the seed. """
+
+    def __init__(self, regions=15, sizes=150, images=5000, droplets=10000, seed=0):
+        generator = random.Random(seed)
+        region_slugs = ['region%s' % index for index in range(regions)]
+
+        self.regions = [{
+            'slug': slug,
+            'name': 'Region %s' % index,
+            'available': True,
+            'features': ['private_networking', 'backups'],
+        } for index, slug in enumerate(region_slugs)]
+
+        self.sizes = []
+        for index in range(sizes):
+            vcpus = 2 ** (index % 6)
+            self.sizes.append({
+                'slug': 's-%s-%s' % (index, vcpus),
+                'vcpus': vcpus,
+                'memory': 1024 * vcpus,
+                'disk': 25 * vcpus,
+                'transfer': float(vcpus),
+                'price_hourly': 0.00744 * vcpus,
+                'price_monthly': 5.0 * vcpus,
+                'available': True,
+                'regions': generator.sample(region_slugs, generator.randint(1, regions)),
+            })
+
+        self.images = []
+        for index in range(images):
+            distribution = generator.choice(DISTRIBUTIONS)
+            self.images.append({
+                'id': 1000000 + index,
+                'name': '%s.%s x64' % (index // 100, index % 100),
+                'distribution': distribution,
+                'slug': 'image-%s' % index if index % 10 == 0 else None,
+                'type': 'snapshot' if index % 10 else 'base',
+                'public': index % 10 == 0,
+                'min_disk_size': generator.choice((20, 25, 30, 40)),
+                'created_at': '2018-01-%02dT10:00:00Z' % (index % 28 + 1),
+                'regions': generator.sample(region_slugs, generator.randint(1, 3)),
+            })
+
+        self.droplets = []
+        for index in range(droplets):
+            size = generator.choice(self.sizes)
+            image = generator.choice(self.images)
+            self.droplets.append({
+                'id': 5000000 + index,
+                'name': 'droplet-%s' % index,
+                'status': generator.choice(('active', 'active', 'active', 'off', 'new')),
+                'vcpus': size['vcpus'],
+                'memory': size['memory'],
+                'disk': size['disk'],
+                'size_slug': size['slug'],
+                'size': {'slug': size['slug'], 'transfer': size['transfer'], 'price_monthly': size['price_monthly']},
+                'image': {'id': image['id'], 'name': image['name'], 'distribution': image['distribution']},
+                'region': {'slug': generator.choice(size['regions'])},
+                'created_at': '2018-02-%02dT10:00:00Z' % (index % 28 + 1),
+                'networks': {'v4': [{
+                    'type': 'public',
+                    'ip_address': '10.%s.%s.%s' % (index // 65536, index // 256 % 256, index % 256),
+                }]},
+                'tags': [],
+            })
+
+    def get_collections(self):
+        return {
+            'regions': self.regions,
+            'sizes': self.sizes,
+            'images': self.images,
+            'droplets': self.droplets,
+        }
+
+
+class SyntheticResponse(object):
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = 'Not Found' if status_code == 404 else 'OK'
+        self.headers = {}
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class SyntheticSession(object):
+    """
+    Replacement of requests session of DigitalOceanClient which serves list endpoints
+    of the synthetic account page by page, the same way as DigitalOcean API does.
+    """
+
+    def __init__(self, account):
+        self.collections = account.get_collections()
+        self.requests = 0
+
+    def request(self, method, url, params=None, json=None, timeout=None):
+        self.requests += 1
+        parts = urlparse.urlsplit(url)
+        query = dict(urlparse.parse_qsl(parts.query))
+        query.update(params or {})
+        key = parts.path.rstrip('/').rsplit('/', 1)[-1]
+
+        if method != 'GET' or key not in self.collections:
+            return SyntheticResponse(404, {'id': 'not_found',
+                                           'message': 'The resource you were accessing could not be found.'})
+
+        items = self.collections[key]
+        per_page = int(query.get('per_page', 20))
+        page = int(query.get('page', 1))
+        payload = {key: items[(page - 1) * per_page:page * per_page], 'links': {}, 'meta': {'total': len(items)}}
+        if page * per_page < len(items):
+            next_query = urlparse.urlencode({'page': page + 1, 'per_page': per_page})
+            payload['links']['pages'] = {'next': urlparse.urlunsplit(parts._replace(query=next_query))}
+        return SyntheticResponse(200, payload)
+
+    def close(self):
+        pass
@@ -0,0 +1,189 @@
+"""
+Benchmarks of catalog and droplet synchronization against a synthetic DigitalOcean account.
+
+They are skipped by default. Run them with WALDUR_DIGITALOCEAN_BENCHMARKS=1 to compare
+results with saved baselines, or with WALDUR_DIGITALOCEAN_BENCHMARKS=update to save new baselines.
+Numbers of API requests, SQL queries and written rows should not exceed baselines,
+wall time and peak memory may exceed them at most WALDUR_DIGITALOCEAN_BENCHMARK_TOLERANCE times.
+Peak memory is growth of resident set size of the process, so that it is measured the same way
+on Python 2 and 3. It is not checked on platforms without procfs and resource module.
+"""
+from __future__ import print_function, unicode_literals
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import unittest
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from waldur_core.structure.tests import factories as structure_factories
+
+from .account import SyntheticAccount, SyntheticSession
+from .. import factories
+from ... import client, models
+from ...apps import DigitalOceanConfig
+from ...backend import PullResult, SyncRecorder
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+BENCHMARKS = os.environ.get('WALDUR_DIGITALOCEAN_BENCHMARKS')
+TOLERANCE = float(os.environ.get('WALDUR_DIGITALOCEAN_BENCHMARK_TOLERANCE', 2))
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Share of synthetic droplets which have been already imported
+IMPORTED_DROPLETS_RATIO = 0.8
+
+COUNTERS = ('api_calls', 'queries', 'created', 'updated', 'deleted')
+MEASUREMENTS = ('duration', 'peak_memory')
+# Wall time and peak memory below these values are treated as noise
+MEASUREMENT_FLOORS = {'duration': 0.1, 'peak_memory': 1024}
+
+PROC_STATUS_PATH = '/proc/self/status'
+PROC_CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+
+@contextlib.contextmanager
+def measure_peak_memory(result):
+    """
+    Store peak growth of resident set size of the process during the block in KiB,
+    or None if neither procfs nor resource module is available.
+    """
+    if os.access(PROC_CLEAR_REFS_PATH, os.W_OK):
+        # Linux allows to reset peak resident set size, so that each block is measured separately
+        with open(PROC_CLEAR_REFS_PATH, 'w') as clear_refs:
+            clear_refs.write('5')
+        before = get_proc_status('VmRSS')
+        try:
+            yield
+        finally:
+            # Resident set size may shrink after it is read
+            result['peak_memory'] = max(get_proc_status('VmHWM') - before, 0)
+    elif resource:
+        # Maximum resident set size grows only if the block exceeds peak of the process so far
+        before = get_max_rss()
+        try:
+            yield
+        finally:
+            result['peak_memory'] = get_max_rss() - before
+    else:
+        result['peak_memory'] = None
+        yield
+
+
+def get_proc_status(name):
+    """ Return memory size in KiB from status of the process, for example VmRSS. """
+    with open(PROC_STATUS_PATH) as status_file:
+        for line in status_file:
+            if line.startswith(name + ':'):
+                return int(line.split()[1])
+
+
+def get_max_rss():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB on Linux
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+@unittest.skipUnless(BENCHMARKS, 'Set WALDUR_DIGITALOCEAN_BENCHMARKS to run benchmarks.')
+class SyncBenchmark(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        client.pool.clear()
+        self.account = SyntheticAccount()
+        self.settings = structure_factories.ServiceSettingsFactory(
+            type=DigitalOceanConfig.service_name, token='BENCHMARK_TOKEN')
+        self.backend = self.settings.get_backend()
+        self.backend.manager.session = SyntheticSession(self.account)
+
+        service = factories.DigitalOceanServiceFactory(settings=self.settings)
+        self.spl = factories.DigitalOceanServiceProjectLinkFactory(service=service)
+        imported = self.account.droplets[:int(len(self.account.droplets) * IMPORTED_DROPLETS_RATIO)]
+        models.Droplet.objects.bulk_create(models.Droplet(
+            service_project_link=self.spl,
+            backend_id=str(droplet['id']),
+            name=droplet['name'],
+            state=models.Droplet.States.OK,
+            runtime_state=models.Droplet.RuntimeStates.ONLINE,
+        ) for droplet in imported)
+
+    def tearDown(self):
+        client.pool.clear()
+        cache.clear()
+
+    def test_sync(self):
+        recorder = SyncRecorder()
+        results = collections.OrderedDict()
+
+        phases = (
+            ('pull_regions', self.backend.pull_regions),
+            ('pull_images', self.backend.pull_images),
+            ('pull_sizes', self.backend.pull_sizes),
+            ('pull_droplets', self.backend.pull_droplets),
+            ('pull_droplets_unchanged', self.backend.pull_droplets),
+            ('get_resources_for_import', self.backend.get_resources_for_import),
+        )
+        for name, method in phases:
+            result = results[name] = {}
+            with measure_peak_memory(result), recorder.phase(name) as stats:
+                output = method()
+            if isinstance(output, PullResult):
+                stats.add_result(output)
+            result.update(vars(stats))
+
+        self.report(results)
+        if BENCHMARKS == 'update':
+            self.save_baselines(results)
+        else:
+            self.compare_with_baselines(results)
+
+    def report(self, results):
+        columns = MEASUREMENTS + COUNTERS
+        lines = ['', '%-26s' % 'phase' + ''.join('%13s' % column for column in columns)]
+        for name, result in results.items():
+            lines.append('%-26s' % name + ''.join(self.format_value(column, result[column]) for column in columns))
+        print('\n'.join(lines), file=sys.stderr)
+
+    def format_value(self, column, value):
+        if value is None:
+            return '%13s' % '-'
+        if column == 'duration':
+            return '%13.3f' % value
+        return '%13d' % value
+
+    def save_baselines(self, results):
+        with open(BASELINES_PATH, 'w') as baselines_file:
+            for result in results.values():
+                result['duration'] = round(result['duration'], 3)
+            json.dump(results, baselines_file, indent=2, sort_keys=True, separators=(',', ': '))
+            baselines_file.write('\n')
+
+    def compare_with_baselines(self, results):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+
+        regressions = []
+        for name, result in results.items():
+            baseline = baselines.get(name)
+            if baseline is None:
+                continue
+            for column in COUNTERS:
+                if result[column] > baseline[column]:
+                    regressions.append('%s %s: %s, baseline %s' % (name, column, result[column], baseline[column]))
+            for column in MEASUREMENTS:
+                if result[column] is None or baseline[column] is None:
+                    continue
+                if result[column] > max(baseline[column], MEASUREMENT_FLOORS[column]) * TOLERANCE:
+                    regressions.append('%s %s: %s, baseline %s, tolerance %s' % (
+                        name, column, result[column], baseline[column], TOLERANCE))
+
+        if regressions:
+            self.fail('Benchmark regressions:\n' + '\n'.join(regressions))
@@ -92,6 +92,10 @@ class SizeFactory(factory.DjangoModelFactory):
             size = SizeFactory()
         return 'http://testserver' + reverse('digitalocean-size-detail', kwargs={'uuid': size.uuid})
 
+    @classmethod
+    def get_list_url(cls):
+        return 'http://testserver' + reverse('digitalocean-size-list')
+
 
 class DropletFactory(factory.DjangoModelFactory):
     class Meta(object):
@@ -118,3 +122,30 @@ class DropletFactory(factory.DjangoModelFactory):
     @classmethod
     def get_list_url(cls):
         return 'http://testserver' + reverse('digitalocean-droplet-list')
+
+
+class ActionFactory(factory.DjangoModelFactory):
+    class Meta(object):
+        model = models.Action
+
+    settings = factory.SelfAttribute('droplet.service_project_link.service.settings')
+    droplet = factory.SubFactory(DropletFactory)
+    backend_id = factory.Sequence(lambda n: '%s' % (1000 + n))
+    action_type = 'power_on'
+
+
+class SyncRunFactory(factory.DjangoModelFactory):
+    class Meta(object):
+        model = models.SyncRun
+
+    settings = factory.SubFactory(structure_factories.ServiceSettingsFactory)
+
+    @classmethod
+    def get_url(cls, sync_run=None):
+        if sync_run is None:
+            sync_run = SyncRunFactory()
+        return 'http://testserver' + reverse('digitalocean-sync-run-detail', kwargs={'uuid': sync_run.uuid})
+
+    @classmethod
+    def get_list_url(cls):
+        return 'http://testserver' + reverse('digitalocean-sync-run-list')
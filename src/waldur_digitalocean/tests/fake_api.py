@@ -0,0 +1,483 @@
+"""
+In-process stand-in for DigitalOcean API v2 which is served over HTTP on localhost.
+
+Backend is pointed to it by backend_url of service settings, so that the real API client,
+error handler, executors and action polling can be exercised without network access.
+Droplets are stateful and their actions are completed after configurable delays.
+Latency, rate limit throttling, server errors and page size can be injected.
+"""
+from __future__ import unicode_literals
+
+import base64
+import datetime
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+
+from django.utils import six
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib import parse as urlparse
+
+
+NOT_FOUND_MESSAGE = 'The resource you were accessing could not be found.'
+RATE_LIMIT_MESSAGE = 'API Rate limit exceeded.'
+
+DEFAULT_REGIONS = [
+    {'slug': 'nyc1', 'name': 'New York 1', 'available': True},
+    {'slug': 'ams2', 'name': 'Amsterdam 2', 'available': True},
+]
+
+DEFAULT_SIZES = [
+    {'slug': 's-1vcpu-1gb', 'vcpus': 1, 'memory': 1024, 'disk': 25, 'transfer': 1.0,
+     'price_hourly': 0.00744, 'price_monthly': 5.0, 'available': True, 'regions': ['nyc1', 'ams2']},
+    {'slug': 's-2vcpu-4gb', 'vcpus': 2, 'memory': 4096, 'disk': 80, 'transfer': 4.0,
+     'price_hourly': 0.02976, 'price_monthly': 20.0, 'available': True, 'regions': ['nyc1']},
+]
+
+DEFAULT_IMAGES = [
+    {'id': 100, 'name': '16.04 x64', 'distribution': 'Ubuntu', 'slug': 'ubuntu-16-04-x64', 'type': 'snapshot',
+     'public': True, 'min_disk_size': 20, 'created_at': '2018-01-01T10:00:00Z', 'regions': ['nyc1', 'ams2']},
+    {'id': 200, 'name': '9 x64', 'distribution': 'Debian', 'slug': 'debian-9-x64', 'type': 'snapshot',
+     'public': True, 'min_disk_size': 20, 'created_at': '2018-01-01T10:00:00Z', 'regions': ['nyc1']},
+]
+
+# Status of droplet after successful action
+ACTION_STATUSES = {
+    'create': 'active',
+    'power_on': 'active',
+    'reboot': 'active',
+    'power_cycle': 'active',
+    'shutdown': 'off',
+    'power_off': 'off',
+}
+
+
+class FakeApiError(Exception):
+
+    def __init__(self, status_code, error_id, message):
+        super(FakeApiError, self).__init__(message)
+        self.status_code = status_code
+        self.error_id = error_id
+        self.message = message
+
+
+def format_time(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status_code, payload, headers = self.server.api.handle(method, self.path, body)
+
+        content = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class FakeDigitalOceanAPI(object):
+    """
+    Usage:
+
+        with FakeDigitalOceanAPI(action_delays={'create': 30}) as api:
+            service_settings.backend_url = api.url
+            ...
+            api.advance(30)  # complete pending actions without waiting
+    """
+
+    def __init__(self, regions=None, sizes=None, images=None, action_delays=None, latency=0,
+                 rate_limit=5000, max_per_page=200, failed_action_types=()):
+        self.regions = list(DEFAULT_REGIONS if regions is None else regions)
+        self.sizes = list(DEFAULT_SIZES if sizes is None else sizes)
+        self.images = list(DEFAULT_IMAGES if images is None else images)
+        # Seconds after which action of the given type is completed
+        self.action_delays = action_delays or {}
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_remaining = rate_limit
+        self.max_per_page = max_per_page
+        self.failed_action_types = set(failed_action_types)
+
+        self.droplets = {}
+        self.actions = {}
+        self.ssh_keys = {}
+        self.tags = {}
+        # Requests which have been received, as (method, path) tuples
+        self.requests = []
+        self.failures = []
+        self.time_offset = 0
+        self.ids = itertools.count(1000)
+        self.lock = threading.RLock()
+        self.server = None
+        self.thread = None
+
+        self.routes = [(method, re.compile('^%s$' % pattern), handler) for method, pattern, handler in (
+            ('GET', r'account', self.get_account),
+            ('GET', r'regions', self.list_regions),
+            ('GET', r'sizes', self.list_sizes),
+            ('GET', r'images', self.list_images),
+            ('GET', r'droplets', self.list_droplets),
+            ('POST', r'droplets', self.create_droplets),
+            ('POST', r'droplets/actions', self.tag_droplet_action),
+            ('GET', r'droplets/(\d+)', self.get_droplet),
+            ('DELETE', r'droplets/(\d+)', self.destroy_droplet),
+            ('POST', r'droplets/(\d+)/actions', self.droplet_action),
+            ('GET', r'actions', self.list_actions),
+            ('GET', r'actions/(\d+)', self.get_action),
+            ('GET', r'account/keys', self.list_ssh_keys),
+            ('POST', r'account/keys', self.create_ssh_key),
+            ('GET', r'account/keys/([^/]+)', self.get_ssh_key),
+            ('DELETE', r'account/keys/([^/]+)', self.destroy_ssh_key),
+            ('POST', r'tags', self.create_tag),
+            ('POST', r'tags/([^/]+)/resources', self.tag_resources),
+            ('DELETE', r'tags/([^/]+)', self.delete_tag),
+        )]
+
+    def start(self):
+        self.server = HTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.api = self
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/v2/' % self.server.server_address[1]
+
+    def now(self):
+        return time.time() + self.time_offset
+
+    def advance(self, seconds):
+        """ Move clock of the API forward, so that pending actions are completed without waiting. """
+        with self.lock:
+            self.time_offset += seconds
+
+    def inject_failure(self, status_code=500, count=1, path='', message='Server Error'):
+        """ Fail the next `count` requests whose path starts with `path`. """
+        with self.lock:
+            self.failures.append({'status_code': status_code, 'count': count, 'path': path, 'message': message})
+
+    def throttle(self, remaining=0):
+        """ Set remaining rate limit budget, requests are rejected with 429 when it is exhausted. """
+        with self.lock:
+            self.rate_remaining = remaining
+
+    def add_droplet(self, status='active', **extra):
+        """ Create droplet directly, without create action. """
+        with self.lock:
+            droplet = self._build_droplet(
+                name=extra.pop('name', 'droplet-%s' % len(self.droplets)),
+                region=extra.pop('region', self.regions[0]['slug']),
+                size=extra.pop('size', self.sizes[0]['slug']),
+                image=extra.pop('image', self.images[0]['id']),
+            )
+            droplet.update(status=status, **extra)
+            return droplet
+
+    def handle(self, method, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            self.requests.append((method, path))
+            headers = {}
+            try:
+                self._consume_rate_limit(headers)
+                self._raise_injected_failure(path)
+                self._complete_actions()
+
+                parts = urlparse.urlsplit(path)
+                resource_path = parts.path.strip('/')
+                if resource_path.startswith('v2/'):
+                    resource_path = resource_path[3:]
+                query = dict(urlparse.parse_qsl(parts.query))
+                data = json.loads(body.decode('utf-8')) if body else {}
+
+                for route_method, pattern, handler in self.routes:
+                    match = pattern.match(resource_path)
+                    if route_method == method and match:
+                        status_code, payload = handler(query, data, *match.groups())
+                        return status_code, payload, headers
+                raise FakeApiError(404, 'not_found', NOT_FOUND_MESSAGE)
+            except FakeApiError as e:
+                return e.status_code, {'id': e.error_id, 'message': e.message}, headers
+
+    def _consume_rate_limit(self, headers):
+        headers.update({
+            'Ratelimit-Limit': six.text_type(self.rate_limit),
+            'Ratelimit-Remaining': six.text_type(max(self.rate_remaining - 1, 0)),
+            'Ratelimit-Reset': six.text_type(int(time.time()) + 60),
+        })
+        if self.rate_remaining <= 0:
+            raise FakeApiError(429, 'too_many_requests', RATE_LIMIT_MESSAGE)
+        self.rate_remaining -= 1
+
+    def _raise_injected_failure(self, path):
+        for failure in self.failures:
+            if failure['count'] > 0 and path.lstrip('/').replace('v2/', '', 1).startswith(failure['path']):
+                failure['count'] -= 1
+                raise FakeApiError(failure['status_code'], 'server_error', failure['message'])
+
+    def _complete_actions(self):
+        now = self.now()
+        for action in self.actions.values():
+            if action['status'] != 'in-progress' or action['_complete_at'] > now:
+                continue
+
+            action['completed_at'] = format_time(action['_complete_at'])
+            droplet = self.droplets.get(action['resource_id'])
+            if action['type'] in self.failed_action_types:
+                action['status'] = 'errored'
+                continue
+
+            action['status'] = 'completed'
+            if droplet is None:
+                continue
+            if action['type'] == 'resize':
+                droplet.update(self._get_size_fields(action['_params']['size']))
+            elif action['type'] in ACTION_STATUSES:
+                droplet['status'] = ACTION_STATUSES[action['type']]
+
+    def _paginate(self, key, items, query, path):
+        per_page = min(int(query.get('per_page', 20)), self.max_per_page)
+        page = int(query.get('page', 1))
+        payload = {key: items[(page - 1) * per_page:page * per_page], 'links': {}, 'meta': {'total': len(items)}}
+        if page * per_page < len(items):
+            next_query = dict(query, page=page + 1, per_page=per_page)
+            payload['links']['pages'] = {'next': '%s%s?%s' % (self.url, path, urlparse.urlencode(next_query))}
+        return 200, payload
+
+    def _get_droplet(self, droplet_id):
+        try:
+            return self.droplets[int(droplet_id)]
+        except KeyError:
+            raise FakeApiError(404, 'not_found', NOT_FOUND_MESSAGE)
+
+    def _get_ssh_key(self, key_id_or_fingerprint):
+        for ssh_key in self.ssh_keys.values():
+            if key_id_or_fingerprint in (six.text_type(ssh_key['id']), ssh_key['fingerprint']):
+                return ssh_key
+        raise FakeApiError(404, 'not_found', NOT_FOUND_MESSAGE)
+
+    def _get_size_fields(self, size_slug):
+        for size in self.sizes:
+            if size['slug'] == size_slug:
+                return {
+                    'size_slug': size['slug'],
+                    'size': {'slug': size['slug'], 'transfer': size['transfer'],
+                             'price_monthly': size['price_monthly']},
+                    'vcpus': size['vcpus'],
+                    'memory': size['memory'],
+                    'disk': size['disk'],
+                }
+        raise FakeApiError(422, 'unprocessable_entity', 'You specified an invalid size for Droplet creation.')
+
+    def _build_droplet(self, name, region, size, image, ssh_keys=(), tags=()):
+        if region not in [r['slug'] for r in self.regions]:
+            raise FakeApiError(422, 'unprocessable_entity', 'You specified an invalid region for Droplet creation.')
+        images = [i for i in self.images if six.text_type(image) in (six.text_type(i['id']), i['slug'])]
+        if not images:
+            raise FakeApiError(422, 'unprocessable_entity', 'You specified an invalid image for Droplet creation.')
+        for key in ssh_keys:
+            try:
+                self._get_ssh_key(six.text_type(key))
+            except FakeApiError:
+                raise FakeApiError(422, 'unprocessable_entity',
+                                   'You specified invalid ssh key ids for Droplet creation.')
+
+        droplet_id = next(self.ids)
+        droplet = {
+            'id': droplet_id,
+            'name': name,
+            'status': 'new',
+            'locked': False,
+            'created_at': format_time(self.now()),
+            'image': {key: images[0][key] for key in ('id', 'name', 'distribution', 'slug')},
+            'region': {'slug': region},
+            'networks': {'v4': [{
+                'ip_address': '10.0.%s.%s' % (droplet_id // 256 % 256, droplet_id % 256),
+                'type': 'public',
+            }]},
+            'tags': list(tags),
+        }
+        droplet.update(self._get_size_fields(size))
+        self.droplets[droplet_id] = droplet
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(droplet_id)
+        return droplet
+
+    def _start_action(self, droplet, action_type, params=None):
+        action_id = next(self.ids)
+        started_at = self.now()
+        action = self.actions[action_id] = {
+            'id': action_id,
+            'status': 'in-progress',
+            'type': action_type,
+            'started_at': format_time(started_at),
+            'completed_at': None,
+            'resource_id': droplet['id'],
+            'resource_type': 'droplet',
+            'region_slug': droplet['region']['slug'],
+            '_complete_at': started_at + self.action_delays.get(action_type, 0),
+            '_params': params or {},
+        }
+        return action
+
+    def _render_action(self, action):
+        return {key: value for key, value in action.items() if not key.startswith('_')}
+
+    def _render_action_link(self, action):
+        return {'id': action['id'], 'rel': action['type'], 'href': '%sactions/%s' % (self.url, action['id'])}
+
+    def get_account(self, query, data):
+        return 200, {'account': {
+            'droplet_limit': 25, 'email': 'admin@example.com', 'uuid': 'fake', 'email_verified': True,
+            'status': 'active', 'status_message': '',
+        }}
+
+    def list_regions(self, query, data):
+        return self._paginate('regions', self.regions, query, 'regions')
+
+    def list_sizes(self, query, data):
+        return self._paginate('sizes', self.sizes, query, 'sizes')
+
+    def list_images(self, query, data):
+        return self._paginate('images', self.images, query, 'images')
+
+    def list_droplets(self, query, data):
+        droplets = sorted(self.droplets.values(), key=lambda droplet: droplet['id'])
+        if query.get('tag_name'):
+            droplets = [droplet for droplet in droplets if query['tag_name'] in droplet['tags']]
+        return self._paginate('droplets', droplets, query, 'droplets')
+
+    def create_droplets(self, query, data):
+        names = data['names'] if 'names' in data else [data['name']]
+        droplets = [self._build_droplet(
+            name, data['region'], data['size'], data['image'], data.get('ssh_keys', []), data.get('tags', []))
+            for name in names]
+        actions = [self._start_action(droplet, 'create') for droplet in droplets]
+        links = {'actions': [self._render_action_link(action) for action in actions]}
+        if 'names' in data:
+            return 202, {'droplets': droplets, 'links': links}
+        return 202, {'droplet': droplets[0], 'links': links}
+
+    def get_droplet(self, query, data, droplet_id):
+        return 200, {'droplet': self._get_droplet(droplet_id)}
+
+    def destroy_droplet(self, query, data, droplet_id):
+        droplet = self._get_droplet(droplet_id)
+        del self.droplets[droplet['id']]
+        for droplet_ids in self.tags.values():
+            droplet_ids.discard(droplet['id'])
+        return 204, None
+
+    def droplet_action(self, query, data, droplet_id):
+        droplet = self._get_droplet(droplet_id)
+        params = dict(data)
+        action = self._start_action(droplet, params.pop('type'), params)
+        return 201, {'action': self._render_action(action)}
+
+    def tag_droplet_action(self, query, data):
+        params = dict(data)
+        action_type = params.pop('type')
+        droplet_ids = sorted(self.tags.get(query.get('tag_name'), ()))
+        actions = [self._start_action(self.droplets[droplet_id], action_type, params) for droplet_id in droplet_ids]
+        return 201, {'actions': [self._render_action(action) for action in actions]}
+
+    def list_actions(self, query, data):
+        # Actions are listed from the newest to the oldest
+        actions = [self._render_action(action) for action in sorted(
+            self.actions.values(), key=lambda action: action['id'], reverse=True)]
+        return self._paginate('actions', actions, query, 'actions')
+
+    def get_action(self, query, data, action_id):
+        try:
+            return 200, {'action': self._render_action(self.actions[int(action_id)])}
+        except KeyError:
+            raise FakeApiError(404, 'not_found', NOT_FOUND_MESSAGE)
+
+    def list_ssh_keys(self, query, data):
+        ssh_keys = sorted(self.ssh_keys.values(), key=lambda ssh_key: ssh_key['id'])
+        return self._paginate('ssh_keys', ssh_keys, query, 'account/keys')
+
+    def create_ssh_key(self, query, data):
+        try:
+            key_body = base64.b64decode(data['public_key'].split()[1].encode('ascii'))
+        except (IndexError, TypeError, ValueError):
+            key_body = data['public_key'].encode('utf-8')
+        digest = hashlib.md5(key_body).hexdigest()  # nosec
+        fingerprint = ':'.join(digest[index:index + 2] for index in range(0, len(digest), 2))
+        if any(ssh_key['fingerprint'] == fingerprint for ssh_key in self.ssh_keys.values()):
+            raise FakeApiError(422, 'unprocessable_entity', 'SSH Key is already in use on your account')
+
+        ssh_key_id = next(self.ids)
+        ssh_key = self.ssh_keys[ssh_key_id] = {
+            'id': ssh_key_id, 'name': data['name'], 'public_key': data['public_key'], 'fingerprint': fingerprint,
+        }
+        return 201, {'ssh_key': ssh_key}
+
+    def get_ssh_key(self, query, data, key_id_or_fingerprint):
+        return 200, {'ssh_key': self._get_ssh_key(key_id_or_fingerprint)}
+
+    def destroy_ssh_key(self, query, data, key_id_or_fingerprint):
+        del self.ssh_keys[self._get_ssh_key(key_id_or_fingerprint)['id']]
+        return 204, None
+
+    def create_tag(self, query, data):
+        self.tags.setdefault(data['name'], set())
+        return 201, {'tag': {'name': data['name']}}
+
+    def tag_resources(self, query, data, name):
+        droplet_ids = self.tags.setdefault(name, set())
+        for resource in data['resources']:
+            droplet = self._get_droplet(resource['resource_id'])
+            droplet_ids.add(droplet['id'])
+            if name not in droplet['tags']:
+                droplet['tags'].append(name)
+        return 204, None
+
+    def delete_tag(self, query, data, name):
+        for droplet_id in self.tags.pop(name, ()):
+            droplet = self.droplets.get(droplet_id)
+            if droplet and name in droplet['tags']:
+                droplet['tags'].remove(name)
+        return 204, None
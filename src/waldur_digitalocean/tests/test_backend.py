@@ -0,0 +1,569 @@
+import collections
+import datetime
+import decimal
+import threading
+
+import digitalocean
+import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import signals
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from waldur_core.structure.tests import factories as structure_factories
+
+from .. import backend, client, metrics, models, tasks
+from ..apps import DigitalOceanConfig
+from . import factories
+
+
+BackendRegion = collections.namedtuple('BackendRegion', ('slug', 'name', 'available'))
+BackendSize = collections.namedtuple('BackendSize', (
+    'slug', 'vcpus', 'memory', 'disk', 'transfer', 'price_hourly', 'price_monthly', 'regions'))
+
+
+def get_write_queries(queries):
+    return [query['sql'] for query in queries
+            if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+class BaseBackendTest(TestCase):
+    def setUp(self):
+        client.pool.clear()
+        self.manager_patcher = mock.patch('waldur_digitalocean.client.DigitalOceanClient')
+        self.manager_api = self.manager_patcher.start()
+
+        self.settings = structure_factories.ServiceSettingsFactory(
+            type=DigitalOceanConfig.service_name,
+            token='VALID_TOKEN',
+        )
+        self.backend = self.settings.get_backend()
+
+    def tearDown(self):
+        self.manager_patcher.stop()
+        client.pool.clear()
+        cache.clear()
+
+
+class RemoveSshKeyTest(BaseBackendTest):
+
+    def test_stored_ssh_key_id_is_forgotten_when_key_is_removed(self):
+        models.SshKey.objects.create(settings=self.settings, fingerprint='aa:bb', backend_id='100')
+        self.manager_api().get_ssh_key.return_value = digitalocean.SSHKey(id=100, fingerprint='aa:bb')
+
+        self.backend.remove_ssh_key('key', 'aa:bb')
+
+        self.manager_api().destroy_ssh_key.assert_called_once_with(100)
+        self.assertFalse(models.SshKey.objects.exists())
+
+    def test_many_ssh_keys_are_matched_with_single_listing(self):
+        models.SshKey.objects.create(settings=self.settings, fingerprint='aa:bb', backend_id='100')
+        self.manager_api().get_all_ssh_keys.return_value = [
+            digitalocean.SSHKey(id=100, fingerprint='aa:bb'),
+            digitalocean.SSHKey(id=101, fingerprint='cc:dd'),
+            digitalocean.SSHKey(id=102, fingerprint='ee:ff'),
+        ]
+        # Child mock is created on first access without lock, so pool threads could record calls in
+        # different children if the first access were concurrent. Calls of the same child are recorded reliably.
+        self.manager_api().destroy_ssh_key.return_value = None
+
+        self.backend.remove_ssh_keys(['aa:bb', 'ee:ff', '00:11'])
+
+        self.manager_api().get_all_ssh_keys.assert_called_once_with()
+        self.assertFalse(self.manager_api().get_ssh_key.called)
+        destroyed_ids = {call[0][0] for call in self.manager_api().destroy_ssh_key.call_args_list}
+        self.assertEqual(destroyed_ids, {100, 102})
+        self.assertFalse(models.SshKey.objects.exists())
+
+    def test_ssh_keys_are_removed_in_context_of_calling_thread(self):
+        self.manager_api().get_all_ssh_keys.return_value = [
+            digitalocean.SSHKey(id=100, fingerprint='aa:bb'),
+            digitalocean.SSHKey(id=102, fingerprint='ee:ff'),
+        ]
+        priorities = []
+
+        def destroy_ssh_key(backend_id):
+            client.request_counter.increment()
+            priorities.append(client.rate_limiter.get_priority())
+
+        self.manager_api().destroy_ssh_key.side_effect = destroy_ssh_key
+        initial_api_calls = client.request_counter.get()
+        # Calling thread holds the only permit while it waits for pool threads
+        backend.requests_limiter.configure(threading.BoundedSemaphore(1))
+        try:
+            with client.rate_limiter.priority(client.Priorities.SYNC):
+                self.backend.remove_ssh_keys(['aa:bb', 'ee:ff'])
+        finally:
+            backend.requests_limiter.configure(None)
+
+        self.assertEqual(priorities, [client.Priorities.SYNC] * 2)
+        self.assertEqual(client.request_counter.get() - initial_api_calls, 2)
+
+
+class BackendMetricsTest(BaseBackendTest):
+
+    def setUp(self):
+        super(BackendMetricsTest, self).setUp()
+        metrics.get_collector().reset()
+        self.labels = {'method': 'get_droplet'}
+
+    def test_successful_call_is_counted_and_timed(self):
+        self.backend.get_droplet('VALID_ID')
+
+        collector = metrics.get_collector()
+        self.assertEqual(collector.get_counter(metrics.BACKEND_CALLS, **self.labels), 1)
+        self.assertEqual(collector.get_histogram_count(metrics.BACKEND_CALL_DURATION, **self.labels), 1)
+        self.assertEqual(collector.get_counter(metrics.BACKEND_ERRORS, error='NotFoundError', **self.labels), 0)
+
+    def test_failed_call_is_counted_by_error_class(self):
+        self.manager_api().get_droplet.side_effect = digitalocean.DataReadError(backend.NOT_FOUND_MESSAGE)
+
+        self.assertRaises(backend.NotFoundError, self.backend.get_droplet, 'INVALID_ID')
+
+        collector = metrics.get_collector()
+        self.assertEqual(collector.get_counter(metrics.BACKEND_CALLS, **self.labels), 1)
+        self.assertEqual(collector.get_histogram_count(metrics.BACKEND_CALL_DURATION, **self.labels), 1)
+        self.assertEqual(collector.get_counter(metrics.BACKEND_ERRORS, error='NotFoundError', **self.labels), 1)
+
+    def test_end_of_paged_listing_is_not_counted_as_error(self):
+        pages = iter([])
+
+        self.assertRaises(StopIteration, self.backend._get_next_page, pages)
+
+        labels = dict(self.labels, method='_get_next_page')
+        collector = metrics.get_collector()
+        self.assertEqual(collector.get_counter(metrics.BACKEND_CALLS, **labels), 1)
+        self.assertEqual(collector.get_counter(metrics.BACKEND_ERRORS, error='StopIteration', **labels), 0)
+
+
+class PullRegionsTest(BaseBackendTest):
+
+    def test_new_regions_are_created(self):
+        self.manager_api().get_all_regions.return_value = [
+            BackendRegion(slug='nyc1', name='New York 1', available=True),
+            BackendRegion(slug='ams2', name='Amsterdam 2', available=True),
+        ]
+
+        result = self.backend.pull_regions()
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(set(models.Region.objects.values_list('backend_id', 'name')),
+                         {('nyc1', 'New York 1'), ('ams2', 'Amsterdam 2')})
+
+    def test_unavailable_and_stale_regions_are_deleted(self):
+        factories.RegionFactory(backend_id='nyc1')
+        factories.RegionFactory(backend_id='sfo1')
+        self.manager_api().get_all_regions.return_value = [
+            BackendRegion(slug='nyc1', name='New York 1', available=False),
+        ]
+
+        result = self.backend.pull_regions()
+
+        self.assertEqual(result.deleted, 2)
+        self.assertFalse(models.Region.objects.exists())
+
+    def test_only_changed_regions_are_updated(self):
+        factories.RegionFactory(backend_id='nyc1', name='New York 1')
+        factories.RegionFactory(backend_id='ams2', name='Amsterdam')
+        self.manager_api().get_all_regions.return_value = [
+            BackendRegion(slug='nyc1', name='New York 1', available=True),
+            BackendRegion(slug='ams2', name='Amsterdam 2', available=True),
+        ]
+
+        result = self.backend.pull_regions()
+
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(models.Region.objects.get(backend_id='ams2').name, 'Amsterdam 2')
+
+
+class PullSizesTest(BaseBackendTest):
+
+    def setUp(self):
+        super(PullSizesTest, self).setUp()
+        self.manager_api().get_all_sizes.return_value = [
+            BackendSize(slug='s-1vcpu-1gb', vcpus=1, memory=1024, disk=25,
+                        transfer=1.0, price_hourly=0.00744, price_monthly=5.0, regions=[]),
+        ]
+
+    def test_size_is_created_with_rounded_price(self):
+        self.backend.pull_sizes()
+
+        size = models.Size.objects.get(backend_id='s-1vcpu-1gb')
+        self.assertEqual(size.price, decimal.Decimal('0.00744'))
+        self.assertEqual(size.price_monthly, decimal.Decimal('5'))
+        self.assertEqual(size.disk, 25 * 1024)
+
+    def test_unchanged_sizes_are_not_written(self):
+        self.backend.pull_sizes()
+
+        with CaptureQueriesContext(connection) as context:
+            result = self.backend.pull_sizes()
+
+        self.assertFalse(result.changed)
+        self.assertEqual(get_write_queries(context.captured_queries), [])
+
+    def test_size_regions_are_reconciled(self):
+        nyc1 = factories.RegionFactory(backend_id='nyc1')
+        ams2 = factories.RegionFactory(backend_id='ams2')
+        sfo1 = factories.RegionFactory(backend_id='sfo1')
+        size = factories.SizeFactory(backend_id='s-1vcpu-1gb')
+        size.regions.add(nyc1, sfo1)
+        self.manager_api().get_all_sizes.return_value = [
+            BackendSize(slug='s-1vcpu-1gb', vcpus=1, memory=1024, disk=25,
+                        transfer=1.0, price_hourly=0.00744, price_monthly=5.0, regions=['nyc1', 'ams2', 'unknown']),
+        ]
+
+        self.backend.pull_sizes()
+
+        self.assertEqual(set(size.regions.all()), {nyc1, ams2})
+
+
+class MonthlyCostEstimateTest(BaseBackendTest):
+
+    def setUp(self):
+        super(MonthlyCostEstimateTest, self).setUp()
+        factories.SizeFactory(name='s-1vcpu-1gb', price_monthly=5)
+        self.droplet = factories.DropletFactory(size_name='s-1vcpu-1gb')
+        self.unknown_size_droplet = factories.DropletFactory(size_name='unknown', backend_id='200')
+        self.manager_api().get_droplet.return_value = digitalocean.Droplet(size={'price_monthly': 10.5})
+
+    def test_estimate_is_based_on_pulled_size(self):
+        self.assertEqual(self.backend.get_monthly_cost_estimate(self.droplet), decimal.Decimal('5'))
+        self.assertFalse(self.manager_api().get_droplet.called)
+
+    def test_droplet_is_fetched_if_its_size_is_unknown(self):
+        estimate = self.backend.get_monthly_cost_estimate(self.unknown_size_droplet)
+
+        self.assertEqual(estimate, decimal.Decimal('10.5'))
+        self.manager_api().get_droplet.assert_called_once_with('200')
+
+    def test_estimates_of_many_droplets_are_priced_with_single_query(self):
+        factories.DropletFactory.create_batch(3, size_name='s-1vcpu-1gb')
+        droplets = models.Droplet.objects.exclude(pk=self.unknown_size_droplet.pk)
+
+        with CaptureQueriesContext(connection) as context:
+            estimates = self.backend.get_monthly_cost_estimates(droplets)
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(len(estimates), 4)
+        self.assertEqual(set(estimates.values()), {decimal.Decimal('5')})
+        self.assertFalse(self.manager_api().get_droplet.called)
+
+
+class PullServicePropertiesTest(BaseBackendTest):
+
+    def setUp(self):
+        super(PullServicePropertiesTest, self).setUp()
+        self.manager_api().get_all_regions.return_value = [
+            BackendRegion(slug='nyc1', name='New York 1', available=True),
+        ]
+        self.manager_api().get_all_images.return_value = []
+        self.manager_api().get_all_sizes.return_value = [
+            BackendSize(slug='s-1vcpu-1gb', vcpus=1, memory=1024, disk=25,
+                        transfer=1.0, price_hourly=0.00744, price_monthly=5.0, regions=['nyc1']),
+        ]
+
+    def test_catalog_is_stored(self):
+        self.backend.pull_service_properties()
+
+        size = models.Size.objects.get(backend_id='s-1vcpu-1gb')
+        self.assertEqual([region.backend_id for region in size.regions.all()], ['nyc1'])
+
+    def test_unchanged_catalog_is_not_queried_for_other_settings(self):
+        self.backend.pull_service_properties()
+        other_settings = structure_factories.ServiceSettingsFactory(
+            type=DigitalOceanConfig.service_name, token='OTHER_TOKEN')
+
+        with CaptureQueriesContext(connection) as context:
+            other_settings.get_backend().pull_service_properties()
+
+        self.assertEqual(context.captured_queries, [])
+
+    def test_changed_catalog_is_stored(self):
+        self.backend.pull_service_properties()
+        self.manager_api().get_all_regions.return_value.append(
+            BackendRegion(slug='ams2', name='Amsterdam 2', available=True))
+
+        self.backend.pull_service_properties()
+
+        self.assertTrue(models.Region.objects.filter(backend_id='ams2').exists())
+
+    def test_catalog_is_not_stored_while_it_is_pulled_by_another_worker(self):
+        with mock.patch('waldur_digitalocean.backend.cache.add', return_value=False):
+            self.backend.pull_service_properties()
+
+        self.assertFalse(models.Region.objects.exists())
+
+
+BackendDroplet = collections.namedtuple('BackendDroplet', ('id', 'status', 'image'))
+
+
+class PullDropletsTest(BaseBackendTest):
+
+    def setUp(self):
+        super(PullDropletsTest, self).setUp()
+        service = factories.DigitalOceanServiceFactory(settings=self.settings)
+        link = factories.DigitalOceanServiceProjectLinkFactory(service=service)
+        self.droplet = factories.DropletFactory(
+            service_project_link=link,
+            backend_id='100',
+            image_name='Ubuntu 16.04',
+            state=models.Droplet.States.OK,
+            runtime_state=models.Droplet.RuntimeStates.ONLINE,
+        )
+        self.image = {'distribution': 'Ubuntu', 'name': '16.04'}
+
+    def set_backend_droplets(self, *pages):
+        self.manager_api().iter_droplet_pages.side_effect = lambda **kwargs: iter(pages)
+
+    def test_changed_droplet_is_updated(self):
+        self.set_backend_droplets([
+            BackendDroplet(id=100, status='off', image=self.image),
+        ])
+
+        result = self.backend.pull_droplets()
+
+        self.droplet.refresh_from_db()
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(self.droplet.runtime_state, models.Droplet.RuntimeStates.OFFLINE)
+
+    def test_unchanged_droplet_is_not_written(self):
+        self.set_backend_droplets([
+            BackendDroplet(id=100, status='active', image=self.image),
+        ])
+
+        with CaptureQueriesContext(connection) as context:
+            result = self.backend.pull_droplets()
+
+        self.assertEqual(result.updated, 0)
+        self.assertEqual(get_write_queries(context.captured_queries), [])
+
+    def test_stale_droplet_is_marked_as_erred(self):
+        self.set_backend_droplets([])
+
+        self.backend.pull_droplets()
+
+        self.droplet.refresh_from_db()
+        self.assertEqual(self.droplet.state, models.Droplet.States.ERRED)
+
+    def test_droplets_are_not_queried_if_listing_and_local_state_are_unchanged(self):
+        self.set_backend_droplets([
+            BackendDroplet(id=100, status='off', image=self.image),
+        ])
+        self.backend.pull_droplets()
+
+        with CaptureQueriesContext(connection) as context:
+            self.backend.pull_droplets()
+
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_local_change_invalidates_listing_fingerprint(self):
+        self.set_backend_droplets([
+            BackendDroplet(id=100, status='active', image=self.image),
+        ])
+        self.backend.pull_droplets()
+        self.droplet.state = models.Droplet.States.ERRED
+        self.droplet.save()
+
+        self.backend.pull_droplets()
+
+        self.droplet.refresh_from_db()
+        self.assertEqual(self.droplet.state, models.Droplet.States.OK)
+
+    def test_bulk_update_of_local_droplets_invalidates_listing_fingerprint(self):
+        self.set_backend_droplets([
+            BackendDroplet(id=100, status='active', image=self.image),
+        ])
+        self.backend.pull_droplets()
+        models.Droplet.objects.filter(pk=self.droplet.pk).update(state=models.Droplet.States.ERRED)
+
+        self.backend.pull_droplets()
+
+        self.droplet.refresh_from_db()
+        self.assertEqual(self.droplet.state, models.Droplet.States.OK)
+
+    def test_changed_droplet_is_saved_with_changed_fields_only(self):
+        self.set_backend_droplets([
+            BackendDroplet(id=100, status='off', image=self.image),
+        ])
+        handler = mock.Mock()
+        signals.post_save.connect(handler, sender=models.Droplet)
+        try:
+            self.backend.pull_droplets()
+        finally:
+            signals.post_save.disconnect(handler, sender=models.Droplet)
+
+        self.assertEqual(handler.call_count, 1)
+        self.assertEqual(set(handler.call_args[1]['update_fields']), {'runtime_state'})
+
+    def test_droplets_are_pulled_page_by_page(self):
+        other_droplet = factories.DropletFactory(
+            service_project_link=self.droplet.service_project_link,
+            backend_id='200',
+            state=models.Droplet.States.OK,
+        )
+        self.set_backend_droplets(
+            [BackendDroplet(id=100, status='off', image=self.image)],
+            [BackendDroplet(id=200, status='off', image=self.image)],
+        )
+
+        result = self.backend.pull_droplets()
+
+        self.assertEqual(result.updated, 2)
+        other_droplet.refresh_from_db()
+        self.assertEqual(other_droplet.runtime_state, models.Droplet.RuntimeStates.OFFLINE)
+
+    def test_only_changed_page_is_queried(self):
+        factories.DropletFactory(service_project_link=self.droplet.service_project_link, backend_id='200')
+        first_page = [BackendDroplet(id=100, status='active', image=self.image)]
+        self.set_backend_droplets(first_page, [BackendDroplet(id=200, status='active', image=self.image)])
+        self.backend.pull_droplets()
+        self.set_backend_droplets(first_page, [BackendDroplet(id=200, status='off', image=self.image)])
+
+        with CaptureQueriesContext(connection) as context:
+            self.backend.pull_droplets()
+
+        droplet_queries = [query['sql'] for query in context.captured_queries
+                           if query['sql'].startswith('SELECT') and '"backend_id" IN' in query['sql']]
+        self.assertEqual(len(droplet_queries), 1)
+        self.assertIn("'200'", droplet_queries[0])
+
+
+class DropletActionsTest(BaseBackendTest):
+
+    def setUp(self):
+        super(DropletActionsTest, self).setUp()
+        service = factories.DigitalOceanServiceFactory(settings=self.settings)
+        self.droplet = factories.DropletFactory(service_project_link__service=service, backend_id='100')
+        self.manager_api().droplet_action.return_value = digitalocean.Action(id=200, type='power_on')
+
+    def test_action_is_posted_without_fetching_droplet(self):
+        action_id = self.backend.start(self.droplet)
+
+        self.assertEqual(action_id, 200)
+        self.manager_api().droplet_action.assert_called_once_with('100', 'power_on')
+        self.assertFalse(self.manager_api().get_droplet.called)
+        self.assertTrue(models.Action.objects.filter(backend_id='200', droplet=self.droplet).exists())
+
+    def test_missing_droplet_is_reported_as_not_found(self):
+        self.manager_api().droplet_action.side_effect = digitalocean.DataReadError(
+            'The resource you were accessing could not be found.')
+
+        with self.assertRaises(backend.NotFoundError):
+            self.backend.stop(self.droplet)
+
+    def test_droplet_is_destroyed_without_fetching_it(self):
+        self.backend.destroy(self.droplet)
+
+        self.manager_api().destroy_droplet.assert_called_once_with('100')
+        self.assertFalse(self.manager_api().get_droplet.called)
+
+
+class PullActionsTest(BaseBackendTest):
+
+    def setUp(self):
+        super(PullActionsTest, self).setUp()
+        service = factories.DigitalOceanServiceFactory(settings=self.settings)
+        self.droplet = factories.DropletFactory(service_project_link__service=service)
+
+    def get_backend_action(self, action_id, status='completed'):
+        return digitalocean.Action(id=action_id, status=status, completed_at='2018-01-01T10:00:00Z')
+
+    def test_actions_are_updated_from_listing_pages_down_to_oldest_pending_action(self):
+        first_action = factories.ActionFactory(droplet=self.droplet, backend_id='105')
+        second_action = factories.ActionFactory(droplet=self.droplet, backend_id='103')
+        pages = [
+            [self.get_backend_action(106), self.get_backend_action(105, 'in-progress')],
+            [self.get_backend_action(104), self.get_backend_action(103, 'errored')],
+            [self.get_backend_action(102)],
+        ]
+        self.manager_api().iter_action_pages.side_effect = lambda: iter(pages)
+
+        self.backend.pull_actions(models.Action.objects.all())
+
+        first_action.refresh_from_db()
+        second_action.refresh_from_db()
+        self.assertEqual(first_action.status, models.Action.Statuses.IN_PROGRESS)
+        self.assertEqual(second_action.status, models.Action.Statuses.ERRORED)
+        self.assertIsNotNone(second_action.completed_at)
+        self.assertFalse(self.manager_api().get_action.called)
+
+    def test_action_missing_in_listing_is_fetched_directly(self):
+        action = factories.ActionFactory(droplet=self.droplet, backend_id='100')
+        self.manager_api().iter_action_pages.side_effect = lambda: iter([[self.get_backend_action(99)]])
+        self.manager_api().get_action.return_value = self.get_backend_action(100)
+
+        self.backend.pull_actions(models.Action.objects.all())
+
+        action.refresh_from_db()
+        self.assertEqual(action.status, models.Action.Statuses.COMPLETED)
+        self.manager_api().get_action.assert_called_once_with('100')
+
+    def test_polling_of_unchanged_actions_is_postponed_with_query_per_delay(self):
+        now = timezone.now()
+        eta = now + datetime.timedelta(minutes=2)
+        actions = [
+            factories.ActionFactory(droplet=self.droplet, backend_id=str(100 + index), eta=eta, next_poll_at=now)
+            for index in range(3)
+        ]
+        late_action = factories.ActionFactory(droplet=self.droplet, backend_id='103', eta=now, next_poll_at=now)
+        self.manager_api().iter_action_pages.side_effect = lambda: iter([[
+            self.get_backend_action(action_id, 'in-progress') for action_id in (103, 102, 101, 100)
+        ]])
+
+        with CaptureQueriesContext(connection) as context:
+            self.backend.pull_actions(models.Action.objects.all())
+
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        for action in actions:
+            action.refresh_from_db()
+            self.assertAlmostEqual((action.next_poll_at - now).total_seconds(), 60, delta=2)
+        late_action.refresh_from_db()
+        self.assertAlmostEqual((late_action.next_poll_at - now).total_seconds(), 5, delta=2)
+
+
+class PollActionsTest(BaseBackendTest):
+
+    @mock.patch('waldur_digitalocean.tasks.poll_token_actions')
+    def test_actions_are_polled_once_per_token(self, poll_token_actions):
+        first_settings = factories.DigitalOceanServiceFactory(settings=self.settings).settings
+        second_settings = structure_factories.ServiceSettingsFactory(
+            type=DigitalOceanConfig.service_name, token=self.settings.token)
+        third_settings = structure_factories.ServiceSettingsFactory(
+            type=DigitalOceanConfig.service_name, token='OTHER_TOKEN')
+        for service_settings in (first_settings, second_settings, second_settings, third_settings):
+            service = factories.DigitalOceanServiceFactory(settings=service_settings)
+            factories.ActionFactory(droplet__service_project_link__service=service)
+
+        tasks.poll_actions()
+
+        self.assertEqual(
+            sorted(call[0][0] for call in poll_token_actions.delay.call_args_list),
+            sorted([[first_settings.pk, second_settings.pk], [third_settings.pk]]))
+
+
+@override_settings(WALDUR_DIGITALOCEAN=dict(settings.WALDUR_DIGITALOCEAN, ACTION_HISTORY_SIZE=1))
+class CleanupActionsTest(TestCase):
+
+    def setUp(self):
+        self.droplet = factories.DropletFactory()
+        self.old = timezone.now() - datetime.timedelta(days=60)
+
+    def create_action(self, status, started_at, **kwargs):
+        return factories.ActionFactory(droplet=self.droplet, status=status, started_at=started_at, **kwargs)
+
+    def test_old_finished_actions_are_deleted_except_latest_completed_one(self):
+        Statuses = models.Action.Statuses
+        self.create_action(Statuses.COMPLETED, self.old, completed_at=self.old)
+        latest = self.create_action(Statuses.COMPLETED, self.old, completed_at=self.old + datetime.timedelta(1))
+        self.create_action(Statuses.ERRORED, self.old)
+        pending = self.create_action(Statuses.IN_PROGRESS, self.old)
+        recent = self.create_action(Statuses.ERRORED, timezone.now())
+
+        tasks.cleanup_actions()
+
+        self.assertEqual(set(models.Action.objects.values_list('pk', flat=True)), {latest.pk, pending.pk, recent.pk})
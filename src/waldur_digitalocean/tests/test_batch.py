@@ -0,0 +1,292 @@
+import digitalocean
+import mock
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from . import factories, fixtures
+from .. import client, models
+from ..views import DropletViewSet
+from .test_provision import DigitalOceanBackendTest
+
+
+class BaseBatchTest(DigitalOceanBackendTest):
+
+    def setUp(self):
+        super(BaseBatchTest, self).setUp()
+        DropletViewSet.async_executor = False
+        self.fixture = fixtures.DigitalOceanFixture()
+        self.client.force_authenticate(self.fixture.owner)
+
+    def tearDown(self):
+        super(BaseBatchTest, self).tearDown()
+        DropletViewSet.async_executor = True
+
+
+class BatchActionTest(BaseBatchTest):
+
+    def setUp(self):
+        super(BatchActionTest, self).setUp()
+        self.droplets = [
+            factories.DropletFactory(
+                service_project_link=self.fixture.spl,
+                backend_id=str(100 + index),
+                runtime_state=models.Droplet.RuntimeStates.ONLINE,
+            ) for index in range(3)
+        ]
+        self.url = factories.DropletFactory.get_list_url() + 'batch_action/'
+        self.project_url = self.url + '?project_uuid=%s' % self.fixture.project.uuid.hex
+
+    def get_payload(self, action, droplets=None):
+        payload = {'action': action}
+        if droplets is not None:
+            payload['droplets'] = [factories.DropletFactory.get_url(droplet) for droplet in droplets]
+        return payload
+
+    def test_restart_is_started_for_each_droplet(self):
+        self.manager_api().droplet_action.side_effect = lambda droplet_id, action_type: digitalocean.Action(
+            id=int(droplet_id) + 1000, type=action_type)
+
+        response = self.client.post(self.project_url, self.get_payload('restart'))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['progress']['in_progress'], 3)
+        self.assertEqual(response.data['skipped_droplets'], [])
+        self.assertEqual(self.manager_api().droplet_action.call_count, 3)
+        batch = models.Batch.objects.get(uuid=response.data['uuid'])
+        self.assertEqual(set(batch.actions.values_list('backend_id', flat=True)), {'1100', '1101', '1102'})
+        for droplet in self.droplets:
+            droplet.refresh_from_db()
+            self.assertEqual(droplet.state, models.Droplet.States.UPDATING)
+
+    def test_actions_are_started_with_provisioning_priority(self):
+        priorities = []
+
+        def droplet_action(droplet_id, action_type):
+            priorities.append(client.rate_limiter.get_priority())
+            return digitalocean.Action(id=int(droplet_id) + 1000, type=action_type)
+
+        self.manager_api().droplet_action.side_effect = droplet_action
+        self.client.post(self.project_url, self.get_payload('restart'))
+
+        self.assertEqual(priorities, [client.Priorities.PROVISIONING] * 3)
+
+    def test_stop_is_started_for_tagged_droplets(self):
+        self.manager_api().tag_droplet_action.return_value = [
+            digitalocean.Action(id=1000 + index, type='shutdown', resource_id=int(droplet.backend_id))
+            for index, droplet in enumerate(self.droplets[:2])
+        ]
+
+        response = self.client.post(self.url, self.get_payload('stop', self.droplets[:2]))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        tag_name = 'waldur-batch-%s' % response.data['uuid']
+        self.manager_api().tag_droplets.assert_called_once_with(tag_name, ['100', '101'])
+        self.manager_api().tag_droplet_action.assert_called_once_with(tag_name, 'shutdown')
+        self.manager_api().delete_tag.assert_called_once_with(tag_name)
+        self.assertFalse(self.manager_api().droplet_action.called)
+
+        self.droplets[2].refresh_from_db()
+        self.assertEqual(self.droplets[2].state, models.Droplet.States.OK)
+
+    def test_droplet_is_erred_if_its_action_is_not_started(self):
+        self.manager_api().droplet_action.side_effect = digitalocean.DataReadError('Droplet is locked.')
+
+        self.client.post(self.url, self.get_payload('restart', self.droplets[:1]))
+
+        self.droplets[0].refresh_from_db()
+        self.assertEqual(self.droplets[0].state, models.Droplet.States.ERRED)
+        self.assertEqual(self.droplets[0].error_message, 'Droplet is locked.')
+
+    def test_batch_is_rejected_if_any_droplet_is_in_invalid_state(self):
+        response = self.client.post(self.project_url, self.get_payload('start'))
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(models.Batch.objects.exists())
+
+    def test_batch_is_rejected_without_droplets_and_filters(self):
+        response = self.client.post(self.url, self.get_payload('restart'))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('droplets', response.data)
+        self.assertFalse(models.Batch.objects.exists())
+
+    def test_droplet_changed_by_concurrent_action_is_skipped(self):
+        self.manager_api().droplet_action.side_effect = lambda droplet_id, action_type: digitalocean.Action(
+            id=int(droplet_id) + 1000, type=action_type)
+        changed_droplet = self.droplets[0]
+
+        def change_droplet_concurrently(*args, **kwargs):
+            models.Droplet.objects.filter(pk=changed_droplet.pk).update(state=models.Droplet.States.UPDATING)
+
+        with mock.patch('waldur_digitalocean.views.structure_permissions.is_administrator',
+                        side_effect=change_droplet_concurrently):
+            response = self.client.post(self.url, self.get_payload('restart', self.droplets[:2]))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['skipped_droplets'], [changed_droplet.name])
+        self.assertEqual(response.data['progress']['total'], 1)
+        self.manager_api().droplet_action.assert_called_once_with(self.droplets[1].backend_id, 'reboot')
+
+    def test_user_without_access_to_droplets_can_not_start_batch(self):
+        self.client.force_authenticate(self.fixture.admin)
+        other_project_droplet = factories.DropletFactory(runtime_state=models.Droplet.RuntimeStates.ONLINE)
+
+        response = self.client.post(self.url, self.get_payload('restart', [other_project_droplet]))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.manager_api().droplet_action.called)
+
+    def test_droplet_state_is_updated_when_action_is_finished(self):
+        self.manager_api().droplet_action.side_effect = lambda droplet_id, action_type: digitalocean.Action(
+            id=int(droplet_id) + 1000, type=action_type)
+        response = self.client.post(self.url, self.get_payload('restart', self.droplets[:2]))
+        self.manager_api().iter_action_pages.side_effect = lambda: iter([[
+            digitalocean.Action(id=1100, status='completed'),
+            digitalocean.Action(id=1101, status='errored'),
+        ]])
+
+        self.fixture.service.settings.get_backend().pull_actions(models.Action.objects.all())
+
+        self.droplets[0].refresh_from_db()
+        self.droplets[1].refresh_from_db()
+        self.assertEqual(self.droplets[0].state, models.Droplet.States.OK)
+        self.assertEqual(self.droplets[1].state, models.Droplet.States.ERRED)
+
+        response = self.client.get(response.data['url'])
+        self.assertEqual(response.data['progress'], {
+            'total': 2, 'in_progress': 0, 'completed': 1, 'errored': 1, 'not_started': 0})
+
+    def test_number_of_queries_does_not_depend_on_number_of_batches(self):
+        def get_queries_count():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('digitalocean-batch-list'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        def create_batch():
+            batch = models.Batch.objects.create(
+                action_type=models.Batch.ActionTypes.RESTART, created_by=self.fixture.owner)
+            batch.droplets.add(*self.droplets)
+            for index, droplet in enumerate(self.droplets):
+                models.Action.objects.create(
+                    settings=self.fixture.service.settings, droplet=droplet, batch=batch,
+                    backend_id='%s-%s' % (batch.pk, index), action_type='reboot')
+
+        create_batch()
+        queries_count = get_queries_count()
+        create_batch()
+        create_batch()
+        self.assertEqual(get_queries_count(), queries_count)
+
+
+@override_settings(WALDUR_DIGITALOCEAN=dict(settings.WALDUR_DIGITALOCEAN, BATCH_CREATE_SIZE=2))
+class BatchCreateTest(BaseBatchTest):
+
+    def setUp(self):
+        super(BatchCreateTest, self).setUp()
+        self.manager_api().create_droplets.side_effect = self.create_droplets
+        self.url = factories.DropletFactory.get_list_url() + 'batch_create/'
+
+    def create_droplets(self, names, **kwargs):
+        droplets = []
+        for name in names:
+            droplet_id = 100 + models.Droplet.objects.get(name=name).pk
+            droplet = digitalocean.Droplet(id=droplet_id, name=name, ip_address='10.0.0.%s' % droplet_id)
+            droplet.action_ids = [droplet_id + 1000]
+            droplets.append(droplet)
+        return droplets
+
+    def get_payload(self, names):
+        return {
+            'names': names,
+            'service_project_link': factories.DigitalOceanServiceProjectLinkFactory.get_url(self.fixture.spl),
+            'region': factories.RegionFactory.get_url(self.fixture.region),
+            'image': factories.ImageFactory.get_url(self.fixture.image),
+            'size': factories.SizeFactory.get_url(self.fixture.size),
+        }
+
+    def test_droplets_are_created_in_chunks(self):
+        response = self.client.post(self.url, self.get_payload(['web-1', 'web-2', 'web-3']))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['progress']['in_progress'], 3)
+        calls = self.manager_api().create_droplets.call_args_list
+        self.assertEqual([call[1]['names'] for call in calls], [['web-1', 'web-2'], ['web-3']])
+        tag_name = 'waldur-batch-%s' % response.data['uuid']
+        self.assertEqual(calls[0][1]['tags'], [tag_name])
+        self.assertEqual(calls[0][1]['size'], self.fixture.size.backend_id)
+
+        for droplet in models.Droplet.objects.all():
+            self.assertEqual(droplet.state, models.Droplet.States.CREATING)
+            self.assertEqual(droplet.actions.get().backend_id, str(int(droplet.backend_id) + 1000))
+
+    def test_quota_is_reserved_for_whole_batch(self):
+        spl = self.fixture.spl
+        spl.set_quota_limit(spl.Quotas.vcpu, self.fixture.size.cores * 2)
+
+        response = self.client.post(self.url, self.get_payload(['web-1', 'web-2', 'web-3']))
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(models.Droplet.objects.exists())
+        self.assertEqual(spl.quotas.get(name=spl.Quotas.vcpu).usage, 0)
+        self.assertFalse(self.manager_api().create_droplets.called)
+
+    def test_names_should_be_unique(self):
+        response = self.client.post(self.url, self.get_payload(['web-1', 'web-1']))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('names', response.data)
+
+    def test_droplets_are_erred_if_their_chunk_is_not_created(self):
+        def create_droplets(names, **kwargs):
+            if 'web-3' in names:
+                raise digitalocean.DataReadError('Droplet limit is exceeded.')
+            return self.create_droplets(names)
+
+        self.manager_api().create_droplets.side_effect = create_droplets
+
+        self.client.post(self.url, self.get_payload(['web-1', 'web-2', 'web-3']))
+
+        droplet = models.Droplet.objects.get(name='web-3')
+        self.assertEqual(droplet.state, models.Droplet.States.ERRED)
+        self.assertEqual(droplet.error_message, 'Droplet limit is exceeded.')
+        self.assertEqual(models.Droplet.objects.filter(state=models.Droplet.States.CREATING).count(), 2)
+
+    def test_droplets_are_online_when_create_actions_are_finished(self):
+        response = self.client.post(self.url, self.get_payload(['web-1', 'web-2']))
+        created_droplets = self.create_droplets(['web-1', 'web-2'])
+        self.manager_api().iter_action_pages.side_effect = lambda: iter([[
+            digitalocean.Action(id=droplet.action_ids[0], status='completed') for droplet in created_droplets
+        ]])
+        self.manager_api().iter_droplet_pages.side_effect = lambda tag_name=None: iter([created_droplets])
+
+        self.fixture.service.settings.get_backend().pull_actions(models.Action.objects.all())
+
+        tag_name = 'waldur-batch-%s' % response.data['uuid']
+        self.manager_api().iter_droplet_pages.assert_called_once_with(tag_name=tag_name)
+        self.manager_api().delete_tag.assert_called_once_with(tag_name)
+        for droplet in models.Droplet.objects.all():
+            self.assertEqual(droplet.state, models.Droplet.States.OK)
+            self.assertEqual(droplet.runtime_state, models.Droplet.RuntimeStates.ONLINE)
+            self.assertEqual(droplet.ip_address, '10.0.0.%s' % droplet.backend_id)
+            # Start time is set by handler of droplet save
+            self.assertIsNotNone(droplet.start_time)
+
+    def test_batch_tag_is_kept_until_all_droplets_are_created(self):
+        self.client.post(self.url, self.get_payload(['web-1', 'web-2']))
+        created_droplets = self.create_droplets(['web-1', 'web-2'])
+        self.manager_api().iter_action_pages.side_effect = lambda: iter([[
+            digitalocean.Action(id=created_droplets[0].action_ids[0], status='completed'),
+            digitalocean.Action(id=created_droplets[1].action_ids[0], status='in-progress'),
+        ]])
+        self.manager_api().iter_droplet_pages.side_effect = lambda tag_name=None: iter([created_droplets[:1]])
+
+        self.fixture.service.settings.get_backend().pull_actions(models.Action.objects.all())
+
+        self.assertFalse(self.manager_api().delete_tag.called)
+        self.assertEqual(models.Droplet.objects.get(name='web-1').state, models.Droplet.States.OK)
+        self.assertEqual(models.Droplet.objects.get(name='web-2').state, models.Droplet.States.CREATING)
@@ -0,0 +1,118 @@
+import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status, test
+
+from . import factories, fixtures
+from .. import catalog, models
+
+
+class CompatibilityIndexTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.DigitalOceanFixture()
+        self.region = self.fixture.region
+        self.small_size = factories.SizeFactory(disk=10 * 1024)
+        self.large_size = factories.SizeFactory(disk=50 * 1024)
+        self.small_size.regions.add(self.region)
+        self.large_size.regions.add(self.region)
+        self.image = factories.ImageFactory(min_disk_size=20 * 1024)
+        self.image.regions.add(self.region)
+        self.other_region_image = factories.ImageFactory()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_index_is_not_rebuilt_if_catalog_has_not_changed(self):
+        catalog.get_compatibility_index()
+
+        with CaptureQueriesContext(connection) as context:
+            index = catalog.get_compatibility_index()
+
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertTrue(index.has_image(self.region.pk, self.image.pk))
+        self.assertFalse(index.has_image(self.region.pk, self.other_region_image.pk))
+
+    def test_index_is_rebuilt_when_regions_are_changed(self):
+        catalog.get_compatibility_index()
+
+        self.other_region_image.regions.add(self.region)
+
+        index = catalog.get_compatibility_index()
+        self.assertTrue(index.has_image(self.region.pk, self.other_region_image.pk))
+
+    def test_image_created_while_index_is_built_is_skipped(self):
+        through_objects = models.Image.regions.through.objects
+        values_list = through_objects.values_list
+
+        def create_image_concurrently(*args, **kwargs):
+            factories.ImageFactory().regions.add(self.region)
+            return values_list(*args, **kwargs)
+
+        with mock.patch.object(through_objects, 'values_list', side_effect=create_image_concurrently):
+            index = catalog.CompatibilityIndex.build()
+
+        self.assertTrue(index.has_image(self.region.pk, self.image.pk))
+        self.assertEqual(len(index.get_pairs(self.region.pk)), 1)
+
+    def test_only_sizes_with_enough_disk_are_paired_with_image(self):
+        self.client.force_authenticate(self.fixture.owner)
+        url = factories.RegionFactory.get_url(self.region) + 'configurations/'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        configurations = {item['image']: set(item['sizes']) for item in response.data}
+        self.assertEqual(configurations[factories.ImageFactory.get_url(self.image)], {
+            factories.SizeFactory.get_url(self.large_size),
+        })
+        self.assertNotIn(factories.ImageFactory.get_url(self.other_region_image), configurations)
+
+
+class CatalogConditionalGetTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.DigitalOceanFixture()
+        self.image = self.fixture.image
+        self.url = factories.ImageFactory.get_list_url()
+        self.client.force_authenticate(self.fixture.owner)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_not_modified_is_returned_for_current_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_not_modified_is_returned_if_catalog_has_not_changed_since_given_date(self):
+        response = self.client.get(self.url)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_is_changed_when_catalog_is_changed(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.image.name = 'Ubuntu 18.04'
+        self.image.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['name'], 'Ubuntu 18.04')
+
+    def test_cached_response_is_served_without_catalog_queries(self):
+        response = self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as context:
+            cached_response = self.client.get(self.url)
+
+        self.assertEqual(cached_response.data, response.data)
+        self.assertEqual(cached_response['X-Result-Count'], response['X-Result-Count'])
+        self.assertFalse([query for query in context.captured_queries
+                          if 'waldur_digitalocean_image' in query['sql']])
@@ -0,0 +1,276 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import digitalocean
+import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.conf import settings
+
+from .. import client
+
+
+def get_response(status_code=200, payload=None, headers=None):
+    response = mock.Mock(status_code=status_code, ok=status_code < 400, reason='Error', headers=headers or {})
+    response.json.return_value = payload
+    return response
+
+
+class ClientPoolTest(TestCase):
+
+    def setUp(self):
+        self.pool = client.ClientPool()
+
+    def tearDown(self):
+        self.pool.clear()
+
+    def test_client_is_reused_for_the_same_token(self):
+        self.assertIs(self.pool.get('TOKEN_1'), self.pool.get('TOKEN_1'))
+        self.assertIsNot(self.pool.get('TOKEN_1'), self.pool.get('TOKEN_2'))
+
+    def test_least_recently_used_client_is_evicted_when_pool_is_full(self):
+        conf = dict(settings.WALDUR_DIGITALOCEAN, CLIENT_POOL_SIZE=2)
+        with override_settings(WALDUR_DIGITALOCEAN=conf):
+            first_client = self.pool.get('TOKEN_1')
+            self.pool.get('TOKEN_2')
+            self.pool.get('TOKEN_1')
+            self.pool.get('TOKEN_3')
+
+        self.assertEqual(set(token for token, _ in self.pool.clients), {'TOKEN_1', 'TOKEN_3'})
+        self.assertIs(self.pool.get('TOKEN_1'), first_client)
+
+    def test_idle_client_is_evicted(self):
+        idle_client = self.pool.get('TOKEN_1')
+        idle_client.last_used -= settings.WALDUR_DIGITALOCEAN['CLIENT_IDLE_TIMEOUT'] + 1
+
+        self.pool.get('TOKEN_2')
+
+        self.assertNotIn(('TOKEN_1', None), self.pool.clients)
+
+    def test_client_used_by_backend_is_not_evicted_before_idle_client(self):
+        conf = dict(settings.WALDUR_DIGITALOCEAN, CLIENT_POOL_SIZE=2)
+        with override_settings(WALDUR_DIGITALOCEAN=conf):
+            used_client = self.pool.get('TOKEN_1')
+            self.pool.get('TOKEN_2').last_used -= 10
+            with used_client.in_use():
+                self.pool.get('TOKEN_3')
+
+        self.assertEqual(set(token for token, _ in self.pool.clients), {'TOKEN_1', 'TOKEN_3'})
+
+    def test_evicted_client_is_closed_when_its_requests_are_finished(self):
+        conf = dict(settings.WALDUR_DIGITALOCEAN, CLIENT_POOL_SIZE=1)
+        evicted_client = self.pool.get('TOKEN_1')
+        with mock.patch.object(evicted_client.session, 'close') as close:
+            with override_settings(WALDUR_DIGITALOCEAN=conf), evicted_client.in_use():
+                evicted_client.last_used -= 10
+                self.pool.get('TOKEN_2')
+                self.assertNotIn(('TOKEN_1', None), self.pool.clients)
+                self.assertFalse(close.called)
+
+            close.assert_called_once_with()
+
+
+class DigitalOceanClientTest(TestCase):
+
+    def setUp(self):
+        self.client = client.DigitalOceanClient('TOKEN')
+        self.session_patcher = mock.patch.object(self.client.session, 'request')
+        self.session_request = self.session_patcher.start()
+
+    def tearDown(self):
+        self.session_patcher.stop()
+
+    def test_error_message_is_reported_as_data_read_error(self):
+        self.session_request.return_value = get_response(404, {
+            'id': 'not_found',
+            'message': 'The resource you were accessing could not be found.',
+        })
+
+        with self.assertRaisesMessage(digitalocean.DataReadError,
+                                      'The resource you were accessing could not be found.'):
+            self.client.get_droplet(1)
+
+    def test_all_pages_are_fetched(self):
+        self.session_request.side_effect = [
+            get_response(payload={
+                'regions': [{'slug': 'nyc1'}],
+                'links': {'pages': {'next': 'https://api.digitalocean.com/v2/regions?page=2'}},
+            }),
+            get_response(payload={'regions': [{'slug': 'ams2'}], 'links': {}}),
+        ]
+
+        regions = self.client.get_all_regions()
+
+        self.assertEqual([region.slug for region in regions], ['nyc1', 'ams2'])
+        self.assertEqual(self.session_request.call_count, 2)
+
+
+class RateLimiterTest(TestCase):
+
+    def setUp(self):
+        self.client = client.DigitalOceanClient('TOKEN')
+        self.session_patcher = mock.patch.object(self.client.session, 'request')
+        self.session_request = self.session_patcher.start()
+
+    def tearDown(self):
+        self.session_patcher.stop()
+        cache.clear()
+
+    def set_budget(self, remaining, limit=100):
+        self.session_request.return_value = get_response(payload={'account': {}}, headers={
+            'Ratelimit-Limit': str(limit),
+            'Ratelimit-Remaining': str(remaining),
+            'Ratelimit-Reset': str(int(time.time()) + 600),
+        })
+        self.client.get_account()
+        self.session_request.reset_mock()
+
+    def test_budget_is_shared_between_clients_of_the_same_token(self):
+        self.set_budget(remaining=52)
+        self.session_request.return_value = get_response(payload={'account': {}})
+        other_client = client.DigitalOceanClient('TOKEN')
+
+        with mock.patch.object(other_client.session, 'request', self.session_request), \
+                client.rate_limiter.priority(client.Priorities.SYNC):
+            other_client.get_account()
+            self.client.get_account()
+            self.assertRaises(client.RateLimitDeferred, other_client.get_account)
+
+        self.assertEqual(self.session_request.call_count, 2)
+
+    def test_sync_is_throttled_before_provisioning(self):
+        self.set_budget(remaining=40)
+
+        with client.rate_limiter.priority(client.Priorities.SYNC):
+            with self.assertRaises(client.RateLimitDeferred) as context:
+                self.client.get_account()
+
+        self.assertGreater(context.exception.countdown, 500)
+        with client.rate_limiter.priority(client.Priorities.PROVISIONING):
+            self.client.get_account()
+        self.assertEqual(self.session_request.call_count, 1)
+
+    def test_call_without_priority_does_not_consume_reserved_budget(self):
+        self.set_budget(remaining=40)
+
+        self.assertRaises(client.RateLimitDeferred, self.client.get_account)
+        self.assertFalse(self.session_request.called)
+
+    def test_provisioning_is_rejected_when_budget_is_exhausted(self):
+        self.set_budget(remaining=0)
+
+        with client.rate_limiter.priority(client.Priorities.PROVISIONING):
+            with self.assertRaisesMessage(digitalocean.DataReadError, client.RATE_LIMIT_MESSAGE):
+                self.client.get_account()
+
+        self.assertFalse(self.session_request.called)
+
+    def test_budget_of_other_token_is_not_affected(self):
+        self.set_budget(remaining=0)
+        self.session_request.return_value = get_response(payload={'account': {}})
+        other_client = client.DigitalOceanClient('OTHER_TOKEN')
+        with mock.patch.object(other_client.session, 'request', self.session_request):
+            other_client.get_account()
+
+        self.assertEqual(self.session_request.call_count, 1)
+
+
+class DropletCacheTest(TestCase):
+
+    def setUp(self):
+        self.client = client.DigitalOceanClient('TOKEN', droplet_cache_ttl=60)
+        self.session_patcher = mock.patch.object(self.client.session, 'request')
+        self.session_request = self.session_patcher.start()
+        self.session_request.return_value = get_response(payload={
+            'droplet': {'id': 1, 'status': 'active', 'networks': {}}})
+
+    def tearDown(self):
+        self.session_patcher.stop()
+        client.droplet_cache.clear()
+        cache.clear()
+
+    def test_droplet_is_fetched_once_within_ttl(self):
+        self.client.get_droplet(1)
+        droplet = self.client.get_droplet(1)
+
+        self.assertEqual(droplet.status, 'active')
+        self.assertEqual(self.session_request.call_count, 1)
+
+    def test_droplet_is_fetched_again_after_action(self):
+        self.client.get_droplet(1)
+        self.session_request.return_value = get_response(payload={'action': {'id': 10, 'type': 'power_on'}})
+        self.client.droplet_action(1, 'power_on')
+        self.session_request.return_value = get_response(payload={
+            'droplet': {'id': 1, 'status': 'off', 'networks': {}}})
+
+        self.assertEqual(self.client.get_droplet(1).status, 'off')
+        self.assertEqual(self.session_request.call_count, 3)
+
+    def test_listed_droplets_are_not_cached(self):
+        self.session_request.return_value = get_response(payload={
+            'droplets': [{'id': 1, 'status': 'active', 'networks': {}}, {'id': 2, 'status': 'off', 'networks': {}}],
+            'links': {},
+        })
+        self.client.get_all_droplets()
+
+        self.assertFalse(client.droplet_cache.entries)
+
+    def test_expired_droplet_is_dropped_on_access(self):
+        self.client.get_droplet(1)
+        expires_at, droplet = client.droplet_cache.entries[(self.client.droplet_cache_scope, '1')]
+        client.droplet_cache.entries[(self.client.droplet_cache_scope, '1')] = (time.time() - 1, droplet)
+
+        self.client.get_droplet(2)
+
+        self.assertEqual(list(client.droplet_cache.entries), [(self.client.droplet_cache_scope, '2')])
+        self.assertEqual(self.session_request.call_count, 2)
+
+    def test_number_of_droplets_of_all_clients_is_limited(self):
+        other_client = client.DigitalOceanClient('OTHER_TOKEN', droplet_cache_ttl=60)
+        conf = dict(settings.WALDUR_DIGITALOCEAN, DROPLET_CACHE_SIZE=2)
+        with override_settings(WALDUR_DIGITALOCEAN=conf), \
+                mock.patch.object(other_client.session, 'request', self.session_request):
+            self.client.get_droplet(1)
+            other_client.get_droplet(1)
+            other_client.get_droplet(2)
+
+        self.assertEqual(list(client.droplet_cache.entries), [
+            (other_client.droplet_cache_scope, '1'),
+            (other_client.droplet_cache_scope, '2'),
+        ])
+
+    def test_concurrent_lookups_share_single_call(self):
+        droplet_cache = client.DropletCache()
+        release = threading.Event()
+        fetched = []
+
+        def fetch():
+            fetched.append(True)
+            release.wait()
+            return digitalocean.Droplet(id=1)
+
+        pool = ThreadPool(5)
+        leader = pool.apply_async(droplet_cache.get, ('TOKEN', 1, fetch, 60))
+        while not droplet_cache.flights:
+            time.sleep(0.01)
+        followers = [pool.apply_async(droplet_cache.get, ('TOKEN', 1, fetch, 60)) for _ in range(4)]
+        release.set()
+
+        droplets = [leader.get(timeout=5)] + [follower.get(timeout=5) for follower in followers]
+        pool.close()
+        pool.join()
+
+        self.assertEqual(len(fetched), 1)
+        self.assertTrue(all(droplet is droplets[0] for droplet in droplets))
+
+    def test_droplet_invalidated_while_in_flight_is_not_cached(self):
+        droplet_cache = client.DropletCache()
+
+        def fetch():
+            droplet_cache.invalidate('TOKEN', 1)
+            return digitalocean.Droplet(id=1)
+
+        droplet_cache.get('TOKEN', 1, fetch, 60)
+
+        self.assertFalse(droplet_cache.entries)
@@ -1,4 +1,5 @@
 import mock
+from django.utils import timezone
 from rest_framework import status, test
 
 from .. import models
@@ -122,6 +123,16 @@ class DropletCreateTest(test.APITransactionTestCase):
         self.assertEqual(self.fixture.size.ram, actual_ram_usage)
         self.assertEqual(self.fixture.size.cores, actual_vcpu_usage)
 
+    def test_droplet_is_not_created_if_size_is_missing_in_region(self):
+        self.client.force_authenticate(self.fixture.owner)
+        payload = self._get_valid_payload()
+        self.fixture.size.regions.clear()
+
+        response = self.client.post(self.url, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('size', response.data)
+
     def _get_valid_payload(self):
         return {
             'name': 'droplet-name',
@@ -160,3 +171,26 @@ class DropletDeleteTest(test.APITransactionTestCase):
         self.assertEqual(0, actual_storage_usage)
         self.assertEqual(0, actual_ram_usage)
         self.assertEqual(0, actual_vcpu_usage)
+
+
+class DropletActionEtaTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.DigitalOceanFixture()
+        self.client.force_authenticate(self.fixture.owner)
+
+    def test_eta_of_pending_action_is_exposed(self):
+        action = factories.ActionFactory(droplet=self.fixture.droplet, eta=timezone.now())
+
+        response = self.client.get(factories.DropletFactory.get_url(self.fixture.droplet))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['action_eta'], action.eta)
+
+    def test_eta_is_empty_if_action_is_completed(self):
+        factories.ActionFactory(droplet=self.fixture.droplet, eta=timezone.now(),
+                                status=models.Action.Statuses.COMPLETED)
+
+        response = self.client.get(factories.DropletFactory.get_list_url())
+
+        self.assertIsNone(response.data[0]['action_eta'])
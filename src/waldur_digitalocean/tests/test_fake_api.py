@@ -0,0 +1,133 @@
+import mock
+from django.core.cache import cache
+from rest_framework import status, test
+
+from waldur_core.core import utils as core_utils
+from waldur_core.structure.models import CustomerRole, ServiceSettings
+from waldur_core.structure.tasks import ServiceSettingsBackgroundPullTask
+from waldur_core.structure.tests import factories as structure_factories
+
+from . import factories
+from .fake_api import FakeDigitalOceanAPI
+from .test_provision import poll_actions_and_retry
+from .. import backend, client, models, tasks
+from ..apps import DigitalOceanConfig
+from ..views import DropletViewSet
+
+
+class FakeApiTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        client.pool.clear()
+        self.api = FakeDigitalOceanAPI().start()
+        self.settings = structure_factories.ServiceSettingsFactory(
+            type=DigitalOceanConfig.service_name,
+            token='FAKE_TOKEN',
+            backend_url=self.api.url,
+        )
+        self.backend = self.settings.get_backend()
+
+    def tearDown(self):
+        self.api.stop()
+        client.pool.clear()
+        cache.clear()
+
+
+class FakeApiBackendTest(FakeApiTest):
+
+    def test_catalog_is_pulled(self):
+        self.backend.pull_service_properties()
+
+        self.assertEqual(set(models.Region.objects.values_list('backend_id', flat=True)), {'nyc1', 'ams2'})
+        size = models.Size.objects.get(backend_id='s-2vcpu-4gb')
+        self.assertEqual([region.backend_id for region in size.regions.all()], ['nyc1'])
+
+    def test_droplets_are_listed_page_by_page(self):
+        self.api.max_per_page = 2
+        for _ in range(5):
+            self.api.add_droplet()
+
+        droplets = self.backend.get_all_droplets()
+
+        self.assertEqual(len(droplets), 5)
+        self.assertEqual(len([path for method, path in self.api.requests if path.startswith('/v2/droplets')]), 3)
+
+    def test_throttled_request_is_reported_as_rate_limit_error(self):
+        self.api.throttle()
+
+        self.assertRaises(backend.RateLimitError, self.backend.get_all_regions)
+
+    def test_sync_is_deferred_when_budget_is_low(self):
+        self.api.throttle(remaining=100)
+
+        ServiceSettingsBackgroundPullTask().run(core_utils.serialize_instance(self.settings))
+
+        self.settings.refresh_from_db()
+        self.assertEqual(self.settings.state, ServiceSettings.States.OK)
+        run = models.SyncRun.objects.get(settings=self.settings)
+        self.assertEqual(run.state, models.SyncRun.States.DEFERRED)
+        # Only the first call is made, it reports that budget is below reserve of sync
+        self.assertEqual(len(self.api.requests), 1)
+
+    def test_server_error_is_reported_as_backend_error(self):
+        self.api.inject_failure(status_code=503, path='regions', message='Service Unavailable')
+
+        self.assertRaises(backend.DigitalOceanBackendError, self.backend.get_all_regions)
+        self.assertEqual(len(self.backend.get_all_regions()), 2)
+
+    def test_action_is_completed_after_delay(self):
+        self.api.action_delays = {'power_on': 60}
+        droplet = self.api.add_droplet(status='off')
+        action = self.backend.manager.droplet_action(droplet['id'], 'power_on')
+
+        self.assertEqual(self.backend.get_action(action.id).status, 'in-progress')
+        self.api.advance(60)
+        self.assertEqual(self.backend.get_action(action.id).status, 'completed')
+        self.assertEqual(self.backend.get_droplet(droplet['id']).status, 'active')
+
+
+class FakeApiProvisionTest(FakeApiTest):
+
+    def setUp(self):
+        super(FakeApiProvisionTest, self).setUp()
+        self.backend.pull_service_properties()
+
+        self.customer = structure_factories.CustomerFactory()
+        self.settings.customer = self.customer
+        self.settings.save()
+        service = factories.DigitalOceanServiceFactory(customer=self.customer, settings=self.settings)
+        project = structure_factories.ProjectFactory(customer=self.customer)
+        self.link = factories.DigitalOceanServiceProjectLinkFactory(service=service, project=project)
+
+        owner = structure_factories.UserFactory()
+        self.customer.add_user(owner, CustomerRole.OWNER)
+        self.client.force_authenticate(owner)
+        self.ssh_public_key = structure_factories.SshPublicKeyFactory(user=owner)
+
+        DropletViewSet.async_executor = False
+        self.retry_patcher = mock.patch.object(tasks.WaitForActionComplete, 'retry', poll_actions_and_retry)
+        self.retry_patcher.start()
+
+    def tearDown(self):
+        super(FakeApiProvisionTest, self).tearDown()
+        self.retry_patcher.stop()
+        DropletViewSet.async_executor = True
+
+    def test_droplet_is_provisioned(self):
+        response = self.client.post(factories.DropletFactory.get_list_url(), {
+            'service_project_link': factories.DigitalOceanServiceProjectLinkFactory.get_url(self.link),
+            'region': factories.RegionFactory.get_url(models.Region.objects.get(backend_id='nyc1')),
+            'image': factories.ImageFactory.get_url(models.Image.objects.get(backend_id='100')),
+            'size': factories.SizeFactory.get_url(models.Size.objects.get(backend_id='s-1vcpu-1gb')),
+            'ssh_public_key': structure_factories.SshPublicKeyFactory.get_url(self.ssh_public_key),
+            'name': 'fake-droplet',
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        droplet = models.Droplet.objects.get(name='fake-droplet')
+        self.assertEqual(droplet.state, models.Droplet.States.OK)
+        self.assertEqual(droplet.runtime_state, models.Droplet.RuntimeStates.ONLINE)
+        backend_droplet = self.api.droplets[int(droplet.backend_id)]
+        self.assertEqual(backend_droplet['status'], 'active')
+        self.assertEqual(droplet.ip_address, backend_droplet['networks']['v4'][0]['ip_address'])
+        self.assertEqual(len(self.api.ssh_keys), 1)
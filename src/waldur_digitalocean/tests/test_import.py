@@ -7,13 +7,14 @@ from rest_framework import status, test
 from waldur_core.structure import ServiceBackend
 from waldur_core.structure.tests import factories as structure_factories
 
-from .. import models
+from .. import client, models
 from . import factories
 
 
-@mock.patch('digitalocean.Manager')
+@mock.patch('waldur_digitalocean.client.DigitalOceanClient')
 class ImportDroptetTest(test.APITransactionTestCase):
     def setUp(self):
+        client.pool.clear()
         self.link = factories.DigitalOceanServiceProjectLinkFactory()
         self.import_url = factories.DigitalOceanServiceFactory.get_url(self.link.service, 'link')
         self.project_url = structure_factories.ProjectFactory.get_url(self.link.project)
@@ -36,6 +37,9 @@ class ImportDroptetTest(test.APITransactionTestCase):
             image={'distribution': 'CentOS', 'name': '7.1 x64'}
         )
 
+    def tearDown(self):
+        client.pool.clear()
+
     def test_user_can_import_droplet(self, mocked_manager):
         mocked_manager().get_droplet.return_value = self.mocked_droplet
 
@@ -9,8 +9,9 @@ from waldur_core.structure.models import CustomerRole
 from waldur_core.structure.tests import factories as structure_factories
 
 from . import factories
+from .. import client, models, tasks
 from ..apps import DigitalOceanConfig
-from ..backend import TokenScopeError
+from ..backend import DigitalOceanBackendError, TokenScopeError
 from ..models import Droplet
 from ..views import DropletViewSet
 
@@ -19,21 +20,21 @@ class DigitalOceanBackendTest(test.APITransactionTestCase):
     def setUp(self):
         super(DigitalOceanBackendTest, self).setUp()
 
-        self.manager_patcher = mock.patch('digitalocean.Manager')
+        client.pool.clear()
+        self.manager_patcher = mock.patch('waldur_digitalocean.client.DigitalOceanClient')
         self.manager_api = self.manager_patcher.start()
 
-        self.droplet_patcher = mock.patch('digitalocean.Droplet')
-        self.droplet_api = self.droplet_patcher.start()
-
-        self.ssh_patcher = mock.patch('digitalocean.SSHKey')
-        self.ssh_api = self.ssh_patcher.start()
-
     def tearDown(self):
         super(DigitalOceanBackendTest, self).tearDown()
 
         self.manager_patcher.stop()
-        self.droplet_patcher.stop()
-        self.ssh_patcher.stop()
+        client.pool.clear()
+
+
+def poll_actions_and_retry(task, *args, **kwargs):
+    settings_ids = models.Action.objects.values_list('settings_id', flat=True).distinct()
+    tasks.poll_token_actions(list(settings_ids))
+    return task.run(*task.request.args)
 
 
 class BaseDropletProvisionTest(DigitalOceanBackendTest):
@@ -76,8 +77,13 @@ class BaseDropletProvisionTest(DigitalOceanBackendTest):
         self.mock_backend()
         DropletViewSet.async_executor = False
 
+        # Actions are polled by periodic task, so it is executed before each retry of waiting task.
+        self.retry_patcher = mock.patch.object(tasks.WaitForActionComplete, 'retry', poll_actions_and_retry)
+        self.retry_patcher.start()
+
     def tearDown(self):
         super(BaseDropletProvisionTest, self).tearDown()
+        self.retry_patcher.stop()
         DropletViewSet.async_executor = True
 
     def mock_backend(self):
@@ -85,17 +91,17 @@ class BaseDropletProvisionTest(DigitalOceanBackendTest):
         self.mock_key.id = 'VALID_SSH_ID'
         self.mock_key.name = self.ssh_public_key.name
         self.mock_key.fingerprint = self.ssh_public_key.fingerprint
-        self.ssh_api.return_value = self.mock_key
+        self.manager_api().get_ssh_key.return_value = self.mock_key
+        self.manager_api().create_ssh_key.return_value = self.mock_key
 
         self.mock_droplet = mock.Mock()
         self.mock_droplet.id = 'VALID_DROPLET_ID'
-        self.mock_droplet.action_ids = ['VALID_ACTION_ID']
+        self.mock_droplet.action_ids = [100]
         self.mock_droplet.ip_address = '10.0.0.1'
-        self.droplet_api.return_value = self.mock_droplet
+        self.manager_api().create_droplet.return_value = self.mock_droplet
 
-        mock_action = mock.Mock()
-        mock_action.status = 'completed'
-        self.manager_api().get_action.return_value = mock_action
+        mock_action = digitalocean.Action(id=100, status='completed', completed_at='2018-01-01T10:00:00Z')
+        self.manager_api().iter_action_pages.side_effect = lambda: iter([[mock_action]])
         self.manager_api().get_droplet.return_value = self.mock_droplet
 
     def get_valid_data(self, **extra):
@@ -114,31 +120,26 @@ class BaseDropletProvisionTest(DigitalOceanBackendTest):
             ssh_public_key=self.ssh_url
         ))
 
-        self.ssh_api.assert_called_once_with(
-            token=mock.ANY,
-            fingerprint=self.ssh_public_key.fingerprint,
-            name=self.ssh_public_key.name,
-            id=None
-        )
-        self.ssh_api().load.assert_called_once()
-        self.assertFalse(self.ssh_api.create.called)
+        self.manager_api().get_ssh_key.assert_called_once_with(self.ssh_public_key.fingerprint)
+        self.assertFalse(self.manager_api().create_ssh_key.called)
 
     def test_ssh_key_is_created_if_it_does_not_exist_yet(self):
-        self.ssh_api().load.side_effect = digitalocean.DataReadError(
+        self.manager_api().get_ssh_key.side_effect = digitalocean.DataReadError(
             'The resource you were accessing could not be found.'
         )
         self.client.post(self.url, self.get_valid_data(
             ssh_public_key=self.ssh_url
         ))
-        self.ssh_api().load.assert_called_once()
-        self.ssh_api().create.assert_called_once()
+        self.manager_api().get_ssh_key.assert_called_once()
+        self.manager_api().create_ssh_key.assert_called_once_with(
+            self.ssh_public_key.name, self.ssh_public_key.public_key)
 
     def test_if_ssh_key_is_not_specified_it_is_not_used(self):
         self.client.post(self.url, self.get_valid_data())
 
-        self.assertFalse(self.ssh_api().load.called)
-        self.assertFalse(self.ssh_api().create.called)
-        self.droplet_api().create.assert_called_once()
+        self.assertFalse(self.manager_api().get_ssh_key.called)
+        self.assertFalse(self.manager_api().create_ssh_key.called)
+        self.manager_api().create_droplet.assert_called_once()
 
         droplet = Droplet.objects.get(backend_id=self.mock_droplet.id)
         self.assertEqual(droplet.key_name, '')
@@ -152,29 +153,81 @@ class BaseDropletProvisionTest(DigitalOceanBackendTest):
         self.assertEqual(droplet.key_name, self.mock_key.name)
         self.assertEqual(droplet.key_fingerprint, self.mock_key.fingerprint)
 
+    def test_if_ssh_key_id_is_known_it_is_not_pulled(self):
+        models.SshKey.objects.create(
+            settings=self.settings, fingerprint=self.ssh_public_key.fingerprint, backend_id='KNOWN_SSH_ID')
+
+        self.client.post(self.url, self.get_valid_data(ssh_public_key=self.ssh_url))
+
+        self.assertFalse(self.manager_api().get_ssh_key.called)
+        self.assertEqual(self.manager_api().create_droplet.call_args[1]['ssh_keys'], ['KNOWN_SSH_ID'])
+
+    def test_ssh_key_id_is_stored_when_key_is_pulled(self):
+        self.client.post(self.url, self.get_valid_data(ssh_public_key=self.ssh_url))
+
+        ssh_key = models.SshKey.objects.get(settings=self.settings, fingerprint=self.ssh_public_key.fingerprint)
+        self.assertEqual(ssh_key.backend_id, self.mock_key.id)
+
+    def test_if_known_ssh_key_id_is_stale_it_is_resolved_again(self):
+        models.SshKey.objects.create(
+            settings=self.settings, fingerprint=self.ssh_public_key.fingerprint, backend_id='STALE_SSH_ID')
+
+        def get_ssh_key(key_id_or_fingerprint):
+            if key_id_or_fingerprint == 'STALE_SSH_ID':
+                raise digitalocean.DataReadError('The resource you were accessing could not be found.')
+            return self.mock_key
+
+        def create_droplet(ssh_keys, **kwargs):
+            if ssh_keys == ['STALE_SSH_ID']:
+                raise digitalocean.DataReadError('You specified invalid ssh key ids for Droplet creation.')
+            return self.mock_droplet
+
+        self.manager_api().get_ssh_key.side_effect = get_ssh_key
+        self.manager_api().create_droplet.side_effect = create_droplet
+
+        self.client.post(self.url, self.get_valid_data(ssh_public_key=self.ssh_url))
+
+        self.assertEqual(self.manager_api().create_droplet.call_count, 2)
+        self.assertEqual(self.manager_api().create_droplet.call_args[1]['ssh_keys'], [self.mock_key.id])
+        self.assertEqual(models.SshKey.objects.get(settings=self.settings).backend_id, self.mock_key.id)
+        droplet = Droplet.objects.get(backend_id=self.mock_droplet.id)
+        self.assertEqual(droplet.state, Droplet.States.OK)
+
+    def test_if_ssh_key_can_not_be_checked_original_error_is_reported(self):
+        models.SshKey.objects.create(
+            settings=self.settings, fingerprint=self.ssh_public_key.fingerprint, backend_id='KNOWN_SSH_ID')
+        self.manager_api().get_ssh_key.side_effect = digitalocean.DataReadError('Server was unable to respond.')
+        self.manager_api().create_droplet.side_effect = digitalocean.DataReadError('Droplet limit is exceeded.')
+
+        with self.assertRaisesMessage(DigitalOceanBackendError, 'Droplet limit is exceeded.'):
+            self.client.post(self.url, self.get_valid_data(ssh_public_key=self.ssh_url))
+
+        self.assertEqual(self.manager_api().create_droplet.call_count, 1)
+        self.assertTrue(models.SshKey.objects.exists())
+
     def test_when_droplet_is_created_backend_is_called(self):
         self.client.post(self.url, self.get_valid_data(
             name='VALID-NAME',
             ssh_public_key=self.ssh_url
         ))
 
-        self.droplet_api.assert_called_once_with(
-            token=mock.ANY,
+        self.manager_api().create_droplet.assert_called_once_with(
             name='VALID-NAME',
             user_data='',
             region=self.region.backend_id,
             image=self.image.backend_id,
-            size_slug=self.size.backend_id,
+            size=self.size.backend_id,
             ssh_keys=[self.mock_key.id]
         )
-        self.droplet_api().create.assert_called_once()
 
-    def test_when_droplet_is_created_last_action_is_pulled(self):
+    def test_when_droplet_is_created_last_action_is_tracked(self):
         self.client.post(self.url, self.get_valid_data(
             ssh_public_key=self.ssh_url
         ))
-        action_id = self.mock_droplet.action_ids[-1]
-        self.manager_api().get_action.assert_called_once_with(action_id)
+        action = models.Action.objects.get(backend_id=self.mock_droplet.action_ids[-1])
+        self.assertEqual(action.status, models.Action.Statuses.COMPLETED)
+        self.assertEqual(action.droplet.backend_id, self.mock_droplet.id)
+        self.assertFalse(self.manager_api().get_action.called)
 
     def test_when_droplet_is_created_external_ip_is_pulled(self):
         self.client.post(self.url, self.get_valid_data(
@@ -194,7 +247,7 @@ class BaseDropletProvisionTest(DigitalOceanBackendTest):
         self.assertEqual(droplet.backend_id, self.mock_droplet.id)
 
     def test_if_token_is_readonly_alert_is_raised(self):
-        self.droplet_api().create.side_effect = digitalocean.DataReadError(
+        self.manager_api().create_droplet.side_effect = digitalocean.DataReadError(
             'You do not have access for the attempted action.'
         )
         data = self.get_valid_data(ssh_public_key=self.ssh_url)
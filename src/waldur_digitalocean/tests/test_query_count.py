@@ -0,0 +1,61 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import test
+
+from waldur_core.structure.tests import factories as structure_factories
+
+from . import factories, fixtures
+
+
+class ListQueryCountTest(test.APITransactionTestCase):
+    """ Number of queries executed by list endpoints should not depend on number of rows. """
+
+    def setUp(self):
+        self.fixture = fixtures.DigitalOceanFixture()
+        self.regions = factories.RegionFactory.create_batch(3)
+
+    def get_query_count(self, url, user=None):
+        self.client.force_authenticate(user or structure_factories.UserFactory(is_staff=True))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def create_images(self, count):
+        for image in factories.ImageFactory.create_batch(count):
+            image.regions.add(*self.regions)
+
+    def create_sizes(self, count):
+        for size in factories.SizeFactory.create_batch(count):
+            size.regions.add(*self.regions)
+
+    def create_droplets(self, count):
+        factories.DropletFactory.create_batch(count, service_project_link=self.fixture.spl)
+
+    def assertQueryCountIsConstant(self, url, create_rows, user=None):
+        create_rows(2)
+        expected = self.get_query_count(url, user)
+        create_rows(10)
+        self.assertEqual(self.get_query_count(url, user), expected)
+
+    def test_images_list(self):
+        self.assertQueryCountIsConstant(factories.ImageFactory.get_list_url(), self.create_images)
+
+    def test_sizes_list(self):
+        self.assertQueryCountIsConstant(factories.SizeFactory.get_list_url(), self.create_sizes)
+
+    def test_droplets_list(self):
+        self.assertQueryCountIsConstant(factories.DropletFactory.get_list_url(), self.create_droplets)
+
+    def test_droplets_list_for_customer_owner(self):
+        self.assertQueryCountIsConstant(
+            factories.DropletFactory.get_list_url(), self.create_droplets, user=self.fixture.owner)
+
+    def test_droplet_tags_are_served_from_prefetched_tags(self):
+        droplet = factories.DropletFactory(service_project_link=self.fixture.spl)
+        droplet.tags.add('web', 'production')
+        self.client.force_authenticate(self.fixture.owner)
+
+        response = self.client.get(factories.DropletFactory.get_list_url())
+
+        self.assertEqual(set(response.data[0]['tags']), {'web', 'production'})
@@ -0,0 +1,77 @@
+import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.six import StringIO
+from rest_framework import test
+
+from waldur_core.structure.tests import factories as structure_factories
+
+from ..apps import DigitalOceanConfig
+from ..backend import DigitalOceanBackendError
+from ..sync import SyncRunner, SyncReport, sync_settings
+
+
+class SyncRunnerTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.settings = [
+            structure_factories.ServiceSettingsFactory(type=DigitalOceanConfig.service_name, token=token)
+            for token in ('TOKEN_1', 'TOKEN_1', 'TOKEN_1', 'TOKEN_2')
+        ]
+
+    def test_settings_with_the_same_token_are_sharded_by_token_concurrency(self):
+        runner = SyncRunner(token_concurrency=2)
+
+        shards = runner.get_shards(self.settings)
+
+        self.assertEqual(sorted(len(shard) for shard in shards), [1, 1, 2])
+        self.assertEqual(sorted(pk for shard in shards for pk in shard),
+                         sorted(settings.pk for settings in self.settings))
+
+    @mock.patch('waldur_digitalocean.sync.sync_shard')
+    def test_reports_of_all_shards_are_collected(self, sync_shard):
+        sync_shard.side_effect = lambda pks: [
+            SyncReport(settings_uuid=str(pk), settings_name=str(pk), duration=0,
+                       state=SyncReport.OK, error_message='')
+            for pk in pks
+        ]
+
+        reports = SyncRunner(workers=2, token_concurrency=1).run(self.settings)
+
+        self.assertEqual(sync_shard.call_count, 2)
+        self.assertEqual(sorted(report.settings_uuid for report in reports),
+                         sorted(str(settings.pk) for settings in self.settings))
+
+    @mock.patch('waldur_digitalocean.backend.DigitalOceanBackend.sync')
+    def test_settings_are_marked_as_erred_if_sync_fails(self, sync):
+        sync.side_effect = DigitalOceanBackendError('Invalid token')
+        service_settings = self.settings[0]
+
+        report = sync_settings(service_settings)
+
+        service_settings.refresh_from_db()
+        self.assertEqual(report.state, SyncReport.ERRED)
+        self.assertEqual(report.error_message, 'Invalid token')
+        self.assertEqual(service_settings.state, service_settings.States.ERRED)
+
+
+class SyncCommandTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.settings = structure_factories.ServiceSettingsFactory(type=DigitalOceanConfig.service_name)
+
+    @mock.patch('waldur_digitalocean.sync.SyncRunner.run', return_value=[])
+    def test_given_settings_are_synchronized(self, run):
+        call_command('sync_digitalocean', '--service-settings', self.settings.uuid.hex, stdout=StringIO())
+
+        self.assertEqual(run.call_args[0][0], [self.settings])
+
+    @mock.patch('waldur_digitalocean.sync.SyncRunner.run', return_value=[])
+    def test_settings_of_other_type_are_rejected(self, run):
+        other_settings = structure_factories.ServiceSettingsFactory(type='OpenStack')
+
+        with self.assertRaisesMessage(CommandError, other_settings.uuid.hex):
+            call_command('sync_digitalocean', '--service-settings', self.settings.uuid.hex,
+                         other_settings.uuid.hex, stdout=StringIO())
+
+        self.assertFalse(run.called)
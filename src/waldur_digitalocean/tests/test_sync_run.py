@@ -0,0 +1,126 @@
+import digitalocean
+import mock
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, override_settings
+from rest_framework import status, test
+
+from . import factories, fixtures
+from .. import client, models
+from ..backend import DigitalOceanBackendError, SyncRecorder
+from .test_backend import BackendDroplet, BackendRegion, BackendSize, BaseBackendTest
+
+
+class SyncRunRecordTest(BaseBackendTest):
+
+    def setUp(self):
+        super(SyncRunRecordTest, self).setUp()
+
+        def get_all_regions():
+            client.request_counter.increment()
+            return [BackendRegion(slug='nyc1', name='New York 1', available=True)]
+
+        self.manager_api().get_all_regions.side_effect = get_all_regions
+        self.manager_api().get_all_images.return_value = []
+        self.manager_api().get_all_sizes.return_value = [
+            BackendSize(slug='s-1vcpu-1gb', vcpus=1, memory=1024, disk=25,
+                        transfer=1.0, price_hourly=0.00744, price_monthly=5.0, regions=['nyc1']),
+        ]
+        self.manager_api().iter_droplet_pages.side_effect = lambda **kwargs: iter([[
+            BackendDroplet(id='1', status='active', image={'distribution': 'Ubuntu', 'name': '16.04'}),
+        ]])
+
+    def test_phases_of_sync_are_recorded(self):
+        self.backend.sync()
+
+        run = models.SyncRun.objects.get(settings=self.settings)
+        self.assertEqual(run.state, models.SyncRun.States.OK)
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual([phase.name for phase in run.phases.all()],
+                         ['pull_regions', 'pull_images', 'pull_sizes', 'pull_droplets'])
+
+        regions_phase = run.phases.get(name='pull_regions')
+        self.assertEqual(regions_phase.api_calls, 1)
+        self.assertEqual(regions_phase.created, 1)
+        self.assertGreater(regions_phase.queries, 0)
+        self.assertGreaterEqual(regions_phase.duration, 0)
+        self.assertEqual(run.phases.get(name='pull_sizes').created, 1)
+
+    def test_failed_sync_is_recorded(self):
+        self.manager_api().get_all_sizes.side_effect = digitalocean.DataReadError('Unable to authenticate you.')
+
+        self.assertRaises(DigitalOceanBackendError, self.backend.sync)
+
+        run = models.SyncRun.objects.get(settings=self.settings)
+        self.assertEqual(run.state, models.SyncRun.States.ERRED)
+        self.assertEqual(run.error_message, 'Unable to authenticate you.')
+        self.assertTrue(run.phases.filter(name='pull_regions').exists())
+
+    @override_settings(WALDUR_DIGITALOCEAN=dict(settings.WALDUR_DIGITALOCEAN, SYNC_RUN_HISTORY_SIZE=2))
+    def test_only_latest_runs_are_kept(self):
+        for _ in range(3):
+            self.backend.sync()
+
+        self.assertEqual(models.SyncRun.objects.filter(settings=self.settings).count(), 2)
+
+    def test_phases_are_not_recorded_outside_of_sync(self):
+        self.backend.pull_service_properties()
+
+        self.assertFalse(models.SyncPhase.objects.exists())
+
+
+class SyncRecorderTest(TestCase):
+
+    def test_queries_are_counted_without_queries_log(self):
+        recorder = SyncRecorder()
+
+        with override_settings(DEBUG=False):
+            with recorder.phase('pull_regions'):
+                for _ in range(5):
+                    list(models.Region.objects.all())
+
+        self.assertEqual(recorder.phases['pull_regions'].queries, 5)
+        connection = connections[DEFAULT_DB_ALIAS]
+        self.assertFalse(connection.queries_logged)
+        self.assertNotIn('cursor', vars(connection))
+
+    def test_queries_of_nested_phases_are_counted_in_both_phases(self):
+        recorder = SyncRecorder()
+
+        with recorder.phase('pull_droplets'):
+            list(models.Region.objects.all())
+            with recorder.phase('pull_regions'):
+                list(models.Region.objects.all())
+
+        self.assertEqual(recorder.phases['pull_droplets'].queries, 2)
+        self.assertEqual(recorder.phases['pull_regions'].queries, 1)
+
+
+class SyncRunApiTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.DigitalOceanFixture()
+        self.run = factories.SyncRunFactory(settings__customer=self.fixture.customer)
+        models.SyncPhase.objects.create(run=self.run, name='pull_droplets', api_calls=2, queries=5, updated=1)
+
+        self.other_run = factories.SyncRunFactory()
+        self.url = factories.SyncRunFactory.get_list_url()
+
+    def test_owner_can_see_runs_of_own_settings_only(self):
+        self.client.force_authenticate(self.fixture.owner)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['uuid'] for item in response.data], [self.run.uuid.hex])
+        self.assertEqual(response.data[0]['phases'], [{
+            'name': 'pull_droplets', 'duration': 0, 'api_calls': 2, 'queries': 5,
+            'created': 0, 'updated': 1, 'deleted': 0,
+        }])
+
+    def test_runs_can_be_filtered_by_settings(self):
+        self.client.force_authenticate(self.fixture.staff)
+
+        response = self.client.get(self.url, {'settings_uuid': self.other_run.settings.uuid.hex})
+
+        self.assertEqual([item['uuid'] for item in response.data], [self.other_run.uuid.hex])
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from waldur_core.structure.tests import factories as structure_factories
+
+from .. import factories
+from ... import models
+from ...apps import DigitalOceanConfig
+from ...cost_tracking import DropletStrategy
+
+
+class ConsumableItemsTest(TestCase):
+
+    def setUp(self):
+        self.size = factories.SizeFactory(name='s-1vcpu-1gb', price=5)
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_prices(self):
+        return {item.key: item.default_price for item in DropletStrategy.get_consumable_items()}
+
+    def test_consumable_items_are_cached(self):
+        DropletStrategy.get_consumable_items()
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_prices(), {'s-1vcpu-1gb': 5})
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_consumable_items_are_invalidated_when_size_is_changed(self):
+        DropletStrategy.get_consumable_items()
+
+        self.size.price = 7
+        self.size.save()
+
+        self.assertEqual(self.get_prices(), {'s-1vcpu-1gb': 7})
+
+    def test_consumable_items_are_invalidated_when_sizes_are_pulled(self):
+        settings = structure_factories.ServiceSettingsFactory(type=DigitalOceanConfig.service_name)
+        DropletStrategy.get_consumable_items()
+        models.Size.objects.filter(pk=self.size.pk).update(price=7)
+        self.assertEqual(self.get_prices(), {'s-1vcpu-1gb': 5})
+
+        settings.get_backend().pull_sizes([])
+
+        self.assertEqual(self.get_prices(), {})
+
+
+class DropletConfigurationTest(TestCase):
+
+    def test_configurations_of_many_droplets_match_single_droplet_configurations(self):
+        droplets = [
+            factories.DropletFactory(size_name='s-1vcpu-1gb'),
+            factories.DropletFactory(size_name='s-2vcpu-2gb', state=models.Droplet.States.ERRED),
+            factories.DropletFactory(size_name=''),
+        ]
+
+        with CaptureQueriesContext(connection) as context:
+            configurations = DropletStrategy.get_configurations(models.Droplet.objects.all())
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(configurations, {
+            droplet.pk: DropletStrategy.get_configuration(droplet) for droplet in droplets})
@@ -22,8 +22,22 @@ class SshKeysHandlersTest(TestCase):
         project.remove_user(self.user)
 
         serialized_settings = core_utils.serialize_instance(self.service.settings)
-        mocked_task_call.assert_called_once_with(
-            serialized_settings, 'remove_ssh_key', self.ssh_key.name, self.ssh_key.fingerprint)
+        mocked_task_call.assert_called_once_with(serialized_settings, 'remove_ssh_keys', [self.ssh_key.fingerprint])
+
+    def test_all_ssh_keys_of_user_are_removed_by_single_task_per_service_settings(self, mocked_task_call):
+        other_ssh_key = structure_factories.SshPublicKeyFactory(user=self.user)
+        other_service = factories.DigitalOceanServiceFactory(customer=self.service.customer)
+        project = structure_factories.ProjectFactory(customer=self.service.customer)
+        project.add_user(self.user, structure_models.ProjectRole.ADMINISTRATOR)
+        project.remove_user(self.user)
+
+        self.assertEqual(mocked_task_call.call_count, 2)
+        self.assertEqual({call[0][0] for call in mocked_task_call.call_args_list}, {
+            core_utils.serialize_instance(self.service.settings),
+            core_utils.serialize_instance(other_service.settings),
+        })
+        for call in mocked_task_call.call_args_list:
+            self.assertEqual(set(call[0][2]), {self.ssh_key.fingerprint, other_ssh_key.fingerprint})
 
     def test_ssh_key_will_not_be_removed_if_user_still_has_connection_to_service_settings(self, mocked_task_call):
         project = structure_factories.ProjectFactory(customer=self.service.customer)
@@ -0,0 +1,111 @@
+import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.conf import settings
+
+from ... import metrics
+
+
+@override_settings(WALDUR_DIGITALOCEAN=dict(settings.WALDUR_DIGITALOCEAN, METRICS_DURATION_BUCKETS=(0.1, 1)))
+class PrometheusTextExporterTest(TestCase):
+    collector_class = metrics.InMemoryCollector
+
+    def setUp(self):
+        self.collector = self.collector_class()
+        self.exporter = metrics.PrometheusTextExporter(self.collector)
+
+    def test_counters_are_rendered_with_labels(self):
+        self.collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet', 'settings': 'abc'})
+        self.collector.inc(metrics.BACKEND_CALLS, {'settings': 'abc', 'method': 'get_droplet'})
+
+        lines = self.exporter.render().splitlines()
+
+        self.assertIn('# TYPE %s counter' % metrics.BACKEND_CALLS, lines)
+        self.assertIn('%s{method="get_droplet",settings="abc"} 2' % metrics.BACKEND_CALLS, lines)
+
+    def test_histogram_buckets_are_cumulative(self):
+        labels = {'method': 'get_droplet'}
+        for value in (0.0625, 0.5, 1, 2):
+            self.collector.observe(metrics.BACKEND_CALL_DURATION, labels, value)
+
+        lines = self.exporter.render().splitlines()
+
+        name = metrics.BACKEND_CALL_DURATION
+        self.assertIn('# TYPE %s histogram' % name, lines)
+        self.assertIn('%s_bucket{method="get_droplet",le="0.1"} 1' % name, lines)
+        self.assertIn('%s_bucket{method="get_droplet",le="1"} 3' % name, lines)
+        self.assertIn('%s_bucket{method="get_droplet",le="+Inf"} 4' % name, lines)
+        self.assertIn('%s_sum{method="get_droplet"} 3.5625' % name, lines)
+        self.assertIn('%s_count{method="get_droplet"} 4' % name, lines)
+
+    def test_label_values_are_escaped(self):
+        self.collector.inc(metrics.BACKEND_ERRORS, {'error': 'a"b\\c'})
+
+        self.assertIn('%s{error="a\\"b\\\\c"} 1' % metrics.BACKEND_ERRORS, self.exporter.render())
+
+
+class CacheCollectorExporterTest(PrometheusTextExporterTest):
+    collector_class = metrics.CacheCollector
+
+    def tearDown(self):
+        cache.clear()
+
+
+@override_settings(WALDUR_DIGITALOCEAN=dict(settings.WALDUR_DIGITALOCEAN, METRICS_DURATION_BUCKETS=(0.1, 1)))
+class CacheCollectorTest(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_metrics_are_shared_between_processes(self):
+        web_collector = metrics.CacheCollector()
+        worker_collector = metrics.CacheCollector()
+        labels = {'method': 'get_droplet'}
+
+        web_collector.inc(metrics.BACKEND_CALLS, labels)
+        worker_collector.inc(metrics.BACKEND_CALLS, labels)
+        worker_collector.observe(metrics.BACKEND_CALL_DURATION, labels, 0.5)
+
+        self.assertEqual(web_collector.get_counter(metrics.BACKEND_CALLS, **labels), 2)
+        self.assertEqual(web_collector.get_histogram_count(metrics.BACKEND_CALL_DURATION, **labels), 1)
+
+    def test_reset_removes_all_series(self):
+        collector = metrics.CacheCollector()
+        collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+
+        metrics.CacheCollector().reset()
+
+        self.assertEqual(collector.get_samples(), ({}, {}))
+
+    def test_series_are_registered_again_after_cache_is_cleared(self):
+        collector = metrics.CacheCollector()
+        collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+
+        cache.clear()
+        collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+
+        self.assertEqual(collector.get_counter(metrics.BACKEND_CALLS, method='get_droplet'), 1)
+
+    @override_settings(WALDUR_DIGITALOCEAN=dict(settings.WALDUR_DIGITALOCEAN, METRICS_CACHE_TIMEOUT=60))
+    def test_series_are_reset_in_the_next_period(self):
+        collector = metrics.CacheCollector()
+        with mock.patch('waldur_digitalocean.metrics.time.time', return_value=100):
+            collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+            collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+            self.assertEqual(collector.get_counter(metrics.BACKEND_CALLS, method='get_droplet'), 2)
+
+        with mock.patch('waldur_digitalocean.metrics.time.time', return_value=130):
+            self.assertEqual(collector.get_samples(), ({}, {}))
+            collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+            self.assertEqual(collector.get_counter(metrics.BACKEND_CALLS, method='get_droplet'), 1)
+
+    def test_keys_expire(self):
+        collector = metrics.CacheCollector()
+        with mock.patch('waldur_digitalocean.metrics.cache') as mocked_cache:
+            mocked_cache.incr.side_effect = [1, ValueError, 2, 1]
+            mocked_cache.add.return_value = True
+            collector.inc(metrics.BACKEND_CALLS, {'method': 'get_droplet'})
+
+        timeout = 2 * settings.WALDUR_DIGITALOCEAN['METRICS_CACHE_TIMEOUT']
+        for call in mocked_cache.add.call_args_list + mocked_cache.set.call_args_list:
+            self.assertEqual(call[0][2], timeout)
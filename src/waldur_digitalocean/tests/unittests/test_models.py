@@ -0,0 +1,55 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import factories
+from ... import models
+
+
+class ActionScheduleTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.droplet = factories.DropletFactory(size_name='s-1vcpu-1gb', region_name='nyc1')
+
+    def create_completed_actions(self, durations, **kwargs):
+        for duration in durations:
+            factories.ActionFactory(
+                droplet=self.droplet,
+                action_type='resize',
+                status=models.Action.Statuses.COMPLETED,
+                started_at=self.now - datetime.timedelta(seconds=duration),
+                completed_at=self.now,
+                **kwargs)
+
+    def get_action(self, **kwargs):
+        return models.Action(action_type='resize', size_name='s-1vcpu-1gb', region_name='nyc1', **kwargs)
+
+    def test_default_duration_is_used_if_there_is_no_history(self):
+        self.assertEqual(self.get_action().get_expected_duration(), 120)
+
+    def test_median_duration_of_the_same_size_and_region_is_preferred(self):
+        self.create_completed_actions([10, 20, 30], size_name='s-1vcpu-1gb', region_name='nyc1')
+        self.create_completed_actions([100, 200, 300], size_name='s-1vcpu-1gb', region_name='ams2')
+
+        self.assertEqual(self.get_action().get_expected_duration(), 20)
+
+    def test_duration_of_other_regions_is_used_if_history_of_region_is_too_short(self):
+        self.create_completed_actions([10], size_name='s-1vcpu-1gb', region_name='nyc1')
+        self.create_completed_actions([100, 200], size_name='s-1vcpu-1gb', region_name='ams2')
+
+        self.assertEqual(self.get_action().get_expected_duration(), 100)
+
+    def test_polls_are_sparse_early_and_dense_near_eta(self):
+        action = self.get_action(started_at=self.now, eta=self.now + datetime.timedelta(seconds=100))
+
+        self.assertEqual(action.get_poll_delay(self.now), 50)
+        self.assertEqual(action.get_poll_delay(self.now + datetime.timedelta(seconds=90)), 5)
+
+    def test_polls_back_off_exponentially_after_eta(self):
+        action = self.get_action(started_at=self.now, eta=self.now)
+
+        self.assertEqual(action.get_poll_delay(self.now + datetime.timedelta(seconds=20)), 20)
+        self.assertEqual(action.get_poll_delay(self.now + datetime.timedelta(seconds=40)), 40)
+        self.assertEqual(action.get_poll_delay(self.now + datetime.timedelta(hours=1)), 300)
@@ -7,5 +7,8 @@ def register_in(router):
     router.register(r'digitalocean-regions', views.RegionViewSet, base_name='digitalocean-region')
     router.register(r'digitalocean-sizes', views.SizeViewSet, base_name='digitalocean-size')
     router.register(r'digitalocean-droplets', views.DropletViewSet, base_name='digitalocean-droplet')
+    router.register(r'digitalocean-batches', views.BatchViewSet, base_name='digitalocean-batch')
+    router.register(r'digitalocean-sync-runs', views.SyncRunViewSet, base_name='digitalocean-sync-run')
+    router.register(r'digitalocean-metrics', views.MetricsViewSet, base_name='digitalocean-metrics')
     router.register(r'digitalocean-service-project-link',
                     views.DigitalOceanServiceProjectLinkViewSet, base_name='digitalocean-spl')